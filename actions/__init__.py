@@ -4,9 +4,15 @@ Custom actions for the enhanced email assistant.
 # Import basic actions
 from actions.basic_email_actions import ActionDeleteEmail, ActionMarkAsRead
 
+# Import bulk triage actions
+from actions.bulk_email_actions import ActionPrepareBulkOperation, ActionExecuteBulkOperation
+
 # Import improved email actions
 from actions.improved_email_actions import ActionListEmails, ActionReadSelectedEmail, ValidateSelectedEmail, ActionNavigateEmails
 
+# Import mailbox search action
+from actions.search_email_actions import ActionSearchEmails
+
 # Import email reply actions
 from actions.improved_email_reply_actions import ActionInitiateReply, ActionGenerateReplyDraft, ActionSendReply, ActionEditReplyDraft
 
@@ -40,11 +46,16 @@ from actions.new_actions import (
 # Import the new reset medication slots action
 from actions.reset_medication_slots import ActionResetMedicationSlots
 
+# Start the Gmail push receiver when GMAIL_PUSH_PORT is set (keeps the inbox warm in memory)
+from actions.push_receiver import start_push_receiver_from_env
+start_push_receiver_from_env()
+
 
 # For Rasa to discover the actions
 all_actions = [
     # Email actions
     ActionListEmails(),
+    ActionSearchEmails(),
     ActionReadSelectedEmail(), 
     ActionNavigateEmails(), 
     ValidateSelectedEmail(),
@@ -52,6 +63,8 @@ all_actions = [
     # Email operations
     ActionDeleteEmail(),
     ActionMarkAsRead(),
+    ActionPrepareBulkOperation(),
+    ActionExecuteBulkOperation(),
     
     # Reply actions
     ActionInitiateReply(),
@@ -0,0 +1,379 @@
+"""
+Asyncio-native Gmail client for actions that should not block the action server's event loop.
+"""
+
+import asyncio
+import base64
+from typing import List, Dict, Any, Optional
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+import aiohttp
+
+from actions.improved_email_client import ImprovedEmailClient
+from actions.rate_limiter import quota_units
+from actions.retry_policy import Failure, parse_retry_after
+
+
+class GmailApiError(Exception):
+    """Raised when the Gmail REST API answers with an error status"""
+    
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"Gmail API error {status}: {message}")
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class AsyncEmailClient:
+    """
+    Async counterpart of ImprovedEmailClient with the same method surface.
+    
+    Talks to the Gmail REST API over a pooled aiohttp session and shares
+    credentials, quota bucket, label cache, message cache and parsing with the
+    wrapped sync client, so both can be used side by side for one account.
+    """
+    
+    API_ROOT = 'https://gmail.googleapis.com/gmail/v1/users'
+    
+    # Maximum number of simultaneous connections to Gmail per account
+    DEFAULT_CONNECTION_LIMIT = 20
+    REQUEST_TIMEOUT_SECONDS = 30
+    
+    def __init__(self, client: ImprovedEmailClient, connection_limit: int = DEFAULT_CONNECTION_LIMIT):
+        self.client = client
+        self.user_id = client.user_id
+        self.connection_limit = connection_limit
+        
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    async def close(self) -> None:
+        """Close the pooled HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled session, creating it for the running event loop if needed."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connection_limit),
+                timeout=aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT_SECONDS)
+            )
+            self._session_loop = loop
+        return self._session
+    
+    async def _authorization_header(self) -> Dict[str, str]:
+        """Return a bearer header, refreshing or reconnecting in a worker thread when needed."""
+        creds = self.client.credentials
+        if creds is None or not creds.valid:
+            connected = await asyncio.to_thread(self.client.ensure_connected)
+            creds = self.client.credentials
+            if not connected or creds is None:
+                raise GmailApiError(401, "Not authorized to access Gmail")
+        return {'Authorization': f'Bearer {creds.token}'}
+    
+    @staticmethod
+    def _classify_error(error: Exception) -> Optional[Failure]:
+        """Classify a failed REST call for the retry policy; None for errors that are never retried."""
+        if isinstance(error, GmailApiError):
+            rate_limited = error.status == 403 and (
+                'rateLimitExceeded' in error.message or 'userRateLimitExceeded' in error.message
+            )
+            return Failure(error.status, error.retry_after, rate_limited)
+        if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+            return Failure(None)
+        return None
+    
+    async def _request(self, http_method: str, path: str, method_id: str,
+                       params: Optional[List[tuple]] = None,
+                       json_body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Send one REST call under the account's retry policy; every attempt reserves its quota units."""
+        async def send() -> Dict[str, Any]:
+            await self.client.rate_limiter.acquire_async(quota_units(method_id))
+            
+            session = await self._get_session()
+            headers = await self._authorization_header()
+            
+            async with session.request(
+                http_method,
+                f"{self.API_ROOT}/{self.user_id}/{path}",
+                params=params,
+                json=json_body,
+                headers=headers
+            ) as response:
+                if response.status >= 400:
+                    raise GmailApiError(
+                        response.status,
+                        await response.text(),
+                        parse_retry_after(response.headers.get('Retry-After'))
+                    )
+                if response.status == 204:
+                    return {}
+                return await response.json()
+        
+        return await self.client.retry_policy.run_async(send, self._classify_error, method_id)
+    
+    async def get_unread_emails(self, max_results: int = 10, include_body: bool = True) -> List[Dict[str, Any]]:
+        """Retrieve unread inbox emails; see ImprovedEmailClient.get_unread_emails."""
+        try:
+            results = await self._request(
+                'GET', 'messages', 'messages.list',
+                params=[('labelIds', 'INBOX'), ('labelIds', 'UNREAD'), ('maxResults', str(max_results))]
+            )
+            
+            messages = results.get('messages', [])
+            if not messages:
+                return []
+            
+            return await self.get_emails(
+                [message['id'] for message in messages],
+                include_body=include_body,
+                label_ids=['INBOX', 'UNREAD']
+            )
+        
+        except (GmailApiError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"An error occurred: {error}")
+            return []
+    
+    async def get_emails(self, message_ids: List[str], include_body: bool = False,
+                         label_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Return parsed emails in the given order, from the message cache where
+        possible and fetched concurrently over the pooled connections otherwise.
+        """
+        # The message cache is SQLite and parsing is CPU work: both run in worker threads
+        emails = await asyncio.to_thread(self.client.message_cache.get_many, message_ids, include_body)
+        
+        missing = [msg_id for msg_id in message_ids if msg_id not in emails]
+        if missing:
+            if include_body:
+                params = [('format', self.client.body_format)]
+            else:
+                params = [('format', 'metadata')] + [
+                    ('metadataHeaders', header) for header in self.client.METADATA_HEADERS
+                ]
+            
+            responses = await asyncio.gather(
+                *(self._request('GET', f'messages/{msg_id}', 'messages.get', params=params) for msg_id in missing),
+                return_exceptions=True
+            )
+            
+            fetched = []
+            for msg_id, response in zip(missing, responses):
+                if isinstance(response, Exception):
+                    print(f"Error fetching message {msg_id}: {response}")
+                    continue
+                fetched.append(response)
+            
+            parsed = await asyncio.to_thread(self._parse_and_store, fetched, include_body)
+            emails.update((email['id'], email) for email in parsed)
+        
+        for email in emails.values():
+            for label in label_ids or []:
+                if label not in email['labels']:
+                    email['labels'].append(label)
+            email['read'] = 'UNREAD' not in email['labels']
+        
+        return [emails[msg_id] for msg_id in message_ids if msg_id in emails]
+    
+    async def get_email_body(self, email_id: str) -> str:
+        """Fetch and extract the body of a single email."""
+        cached_body = await asyncio.to_thread(self.client.message_cache.get_body, email_id)
+        if cached_body is not None:
+            return cached_body
+        
+        try:
+            msg = await self._request('GET', f'messages/{email_id}', 'messages.get', params=[('format', self.client.body_format)])
+            email, = await asyncio.to_thread(self._parse_and_store, [msg])
+            return email['body']
+        
+        except (GmailApiError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"An error occurred: {error}")
+            return ""
+    
+    async def get_all_labels(self) -> List[Dict[str, Any]]:
+        """Get all user-defined labels in the Gmail account."""
+        try:
+            labels = await self._get_labels()
+            
+            return [
+                {'id': label['id'], 'name': label['name']}
+                for label in labels
+                if not label['id'].startswith('CATEGORY_')
+                and label['id'] not in ['INBOX', 'SENT', 'SPAM', 'TRASH', 'DRAFT', 'UNREAD']
+            ]
+        
+        except (GmailApiError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"An error occurred: {error}")
+            return []
+    
+    async def send_email(self, to: str, subject: str, body: str, reply_to: Optional[str] = None) -> bool:
+        """Send an email."""
+        try:
+            message = MIMEMultipart()
+            message['to'] = to
+            message['subject'] = subject
+            
+            if reply_to:
+                message['In-Reply-To'] = reply_to
+                message['References'] = reply_to
+            
+            message.attach(MIMEText(body))
+            
+            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+            await self._request('POST', 'messages/send', 'messages.send', json_body={'raw': raw_message})
+            
+            return True
+        
+        except (GmailApiError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"An error occurred: {error}")
+            return False
+    
+    async def apply_label(self, email_id: str, label: str) -> bool:
+        """Apply a label to an email, creating the label if needed."""
+        try:
+            label_id = await self._get_or_create_label(label)
+            if not label_id:
+                return False
+            
+            await self._modify(email_id, add_label_ids=[label_id])
+            return True
+        
+        except (GmailApiError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"An error occurred: {error}")
+            return False
+    
+    async def trash_email(self, email_id: str) -> bool:
+        """Move an email to trash."""
+        try:
+            await self._modify(email_id, add_label_ids=['TRASH'], remove_label_ids=['INBOX'])
+            return True
+        
+        except (GmailApiError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"An error occurred: {error}")
+            return False
+    
+    async def mark_as_read(self, email_id: str) -> bool:
+        """Mark an email as read by removing the UNREAD label."""
+        try:
+            await self._modify(email_id, remove_label_ids=['UNREAD'])
+            return True
+        
+        except (GmailApiError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"An error occurred: {error}")
+            return False
+    
+    async def list_message_ids(self, query: Optional[str] = None, label_ids: Optional[List[str]] = None,
+                               max_results: int = 100) -> List[str]:
+        """Return up to max_results message IDs matching a Gmail search query and/or labels, newest first."""
+        message_ids = []
+        page_token = None
+        try:
+            while len(message_ids) < max_results:
+                params = [('maxResults', str(min(500, max_results - len(message_ids))))]
+                if query:
+                    params.append(('q', query))
+                params.extend(('labelIds', label) for label in label_ids or [])
+                if page_token:
+                    params.append(('pageToken', page_token))
+                
+                results = await self._request('GET', 'messages', 'messages.list', params=params)
+                message_ids.extend(message['id'] for message in results.get('messages', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+        
+        except (GmailApiError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"An error occurred: {error}")
+        
+        return message_ids
+    
+    async def search_emails(self, query: str, max_results: int = 10, include_body: bool = False) -> List[Dict[str, Any]]:
+        """Search the whole mailbox with Gmail query syntax; see ImprovedEmailClient.search_emails."""
+        message_ids = await self.list_message_ids(query=query, max_results=max_results)
+        if not message_ids:
+            return []
+        return await self.get_emails(message_ids, include_body=include_body)
+    
+    async def batch_modify(self, message_ids: List[str], add_label_ids: Optional[List[str]] = None,
+                           remove_label_ids: Optional[List[str]] = None) -> bool:
+        """Change the labels of many emails with users.messages.batchModify (one call per 1000 IDs)."""
+        body = {}
+        if add_label_ids:
+            body['addLabelIds'] = add_label_ids
+        if remove_label_ids:
+            body['removeLabelIds'] = remove_label_ids
+        
+        try:
+            chunk_size = self.client.MAX_BATCH_MODIFY_IDS
+            for start in range(0, len(message_ids), chunk_size):
+                chunk = message_ids[start:start + chunk_size]
+                await self._request('POST', 'messages/batchModify', 'messages.batchModify',
+                                    json_body=dict(body, ids=chunk))
+                await asyncio.to_thread(self._update_cached_labels, chunk, add_label_ids, remove_label_ids)
+            
+            return True
+        
+        except (GmailApiError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"An error occurred: {error}")
+            return False
+    
+    async def trash_emails(self, email_ids: List[str]) -> bool:
+        """Move several emails to trash at once."""
+        return await self.batch_modify(email_ids, add_label_ids=['TRASH'], remove_label_ids=['INBOX'])
+    
+    async def mark_emails_as_read(self, email_ids: List[str]) -> bool:
+        """Mark several emails as read at once."""
+        return await self.batch_modify(email_ids, remove_label_ids=['UNREAD'])
+    
+    async def _modify(self, email_id: str, add_label_ids: Optional[List[str]] = None,
+                      remove_label_ids: Optional[List[str]] = None) -> None:
+        """Change the labels of one message and mirror the change in the message cache."""
+        body = {}
+        if add_label_ids:
+            body['addLabelIds'] = add_label_ids
+        if remove_label_ids:
+            body['removeLabelIds'] = remove_label_ids
+        
+        await self._request('POST', f'messages/{email_id}/modify', 'messages.modify', json_body=body)
+        await asyncio.to_thread(self._update_cached_labels, [email_id], add_label_ids, remove_label_ids)
+    
+    def _parse_and_store(self, messages: List[Dict[str, Any]], include_body: bool = True) -> List[Dict[str, Any]]:
+        """Parse fetched message resources and put them into the message cache (blocking, for worker threads)."""
+        parsed = [self.client._parse_message(message, include_body=include_body) for message in messages]
+        self.client.message_cache.put_many(parsed)
+        return parsed
+    
+    def _update_cached_labels(self, email_ids: List[str], add_label_ids: Optional[List[str]],
+                              remove_label_ids: Optional[List[str]]) -> None:
+        """Mirror a label change in the message cache (blocking, for worker threads)."""
+        for email_id in email_ids:
+            self.client.message_cache.update_labels(email_id, add=add_label_ids, remove=remove_label_ids)
+    
+    async def _get_labels(self) -> List[Dict[str, Any]]:
+        """Return the account's labels from the shared label cache, fetching them when expired."""
+        labels = self.client.label_cache.get_cached_labels()
+        if labels is None:
+            results = await self._request('GET', 'labels', 'labels.list')
+            labels = results.get('labels', [])
+            self.client.label_cache.set_labels(labels)
+        return labels
+    
+    async def _get_or_create_label(self, label_name: str) -> Optional[str]:
+        """Get the ID of a label, creating it if it doesn't exist."""
+        for label in await self._get_labels():
+            if label['name'].lower() == label_name.lower():
+                return label['id']
+        
+        try:
+            new_label = await self._request('POST', 'labels', 'labels.create', json_body={'name': label_name})
+        except GmailApiError:
+            # The cached list may be stale (e.g. label created elsewhere)
+            self.client.label_cache.invalidate()
+            raise
+        
+        self.client.label_cache.add_label(new_label)
+        return new_label['id']
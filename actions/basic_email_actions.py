@@ -7,7 +7,7 @@ from rasa_sdk.events import SlotSet
 from rasa_sdk.executor import CollectingDispatcher
 import logging
 
-from actions.improved_email_client import ImprovedEmailClient
+from actions.email_client_pool import get_async_email_client
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +17,7 @@ class ActionDeleteEmail(Action):
     def name(self) -> Text:
         return "action_delete_email"
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         """
@@ -30,11 +30,11 @@ class ActionDeleteEmail(Action):
                 dispatcher.utter_message(text="Ich habe keine E-Mail ausgewählt, die gelöscht werden soll.")
                 return []
             
-            # Initialize the email client
-            client = ImprovedEmailClient()
+            # Get the shared non-blocking email client
+            client = await get_async_email_client()
             
             # Try to delete the email
-            success = client.trash_email(email_id)
+            success = await client.trash_email(email_id)
             
             if success:
                 dispatcher.utter_message(text="Die E-Mail wurde in den Papierkorb verschoben.")
@@ -60,7 +60,7 @@ class ActionMarkAsRead(Action):
     def name(self) -> Text:
         return "action_mark_as_read"
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         """
@@ -73,11 +73,11 @@ class ActionMarkAsRead(Action):
                 dispatcher.utter_message(text="Ich habe keine E-Mail ausgewählt, die als gelesen markiert werden soll.")
                 return []
             
-            # Initialize the email client
-            client = ImprovedEmailClient()
+            # Get the shared non-blocking email client
+            client = await get_async_email_client()
             
             # Try to mark the email as read
-            success = client.mark_as_read(email_id)
+            success = await client.mark_as_read(email_id)
             
             if success:
                 dispatcher.utter_message(text="Die E-Mail wurde als gelesen markiert.")
@@ -0,0 +1,231 @@
+"""
+Bulk triage actions: trash or mark as read several emails in one turn.
+
+Commands like "alle als gelesen markieren", "1 bis 5 löschen" or "alle von
+diesem Absender löschen" are resolved against the loaded email list (and a
+Gmail search for sender commands) and applied with a single batchModify call.
+"""
+from typing import Any, Text, Dict, List, Optional, Tuple
+from rasa_sdk import Action, Tracker
+from rasa_sdk.events import SlotSet
+from rasa_sdk.executor import CollectingDispatcher
+import asyncio
+import logging
+import re
+
+from actions.email_client_pool import get_async_email_client
+from actions.improved_email_actions import listed_email_ids, load_listed_emails
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for emails touched by one sender command
+MAX_BULK_SEARCH_RESULTS = 500
+
+_TRASH_WORDS = ("lösch", "losch", "papierkorb", "entfern", "wegwerf", "delete", "trash")
+_READ_WORDS = ("gelesen", "als read", "mark as read", "read")
+_CURRENT_SENDER_PATTERN = re.compile(r'\b(?:von|vom)\s+(?:diesem|dem|demselben|gleichen|selben)\s+(?:absender|sender)\b|\bvom absender\b')
+_RANGE_PATTERN = re.compile(r'\b(\d+)\s*(?:bis|-|–|to)\s*(\d+)\b')
+_NUMBER_PATTERN = re.compile(r'\b\d+\b')
+_NAMED_SENDER_PATTERN = re.compile(r'\b(?:von|from)\s+(.+?)(?:\s+(?:löschen|loschen|entfernen|als gelesen.*|markieren|in den papierkorb.*))?$')
+
+
+def _parse_operation(text: str) -> Optional[str]:
+    """'trash' or 'mark_read' depending on the command wording."""
+    if any(word in text for word in _TRASH_WORDS):
+        return "trash"
+    if any(word in text for word in _READ_WORDS):
+        return "mark_read"
+    return None
+
+
+def _sender_address(email: Dict[Text, Any]) -> Text:
+    return (email.get('sender') or '').lower()
+
+
+def _current_sender(tracker: Tracker, emails: List[Dict[Text, Any]]) -> Optional[Text]:
+    """Address of the email that is currently open."""
+    current_id = tracker.get_slot("current_email_id")
+    for email in emails:
+        if email.get('id') == current_id and email.get('sender'):
+            return email['sender']
+    
+    # The slot reads "Name (address)"
+    sender_slot = tracker.get_slot("current_email_sender") or ""
+    match = re.search(r'\(([^()]+@[^()]+)\)\s*$', sender_slot)
+    return match.group(1) if match else None
+
+
+def _resolve_targets(text: str, tracker: Tracker,
+                     emails: List[Dict[Text, Any]]) -> Tuple[Optional[List[Text]], Optional[Text], Text]:
+    """
+    Work out which emails a command refers to.
+    Returns (message IDs from the loaded list, sender address to search for, description);
+    IDs are None when nothing could be resolved.
+    """
+    # "alle von diesem Absender"
+    if _CURRENT_SENDER_PATTERN.search(text):
+        sender = _current_sender(tracker, emails)
+        if not sender:
+            return None, None, ""
+        ids = [email['id'] for email in emails if _sender_address(email) == sender.lower()]
+        return ids, sender, f"alle E-Mails von {sender}"
+    
+    # "1 bis 5"
+    range_match = _RANGE_PATTERN.search(text)
+    if range_match:
+        first, last = sorted((int(range_match.group(1)), int(range_match.group(2))))
+        ids = [email['id'] for i, email in enumerate(emails, 1) if first <= i <= last]
+        return ids, None, f"die E-Mails {first} bis {last}"
+    
+    # "1, 3 und 5"
+    numbers = [int(number) for number in _NUMBER_PATTERN.findall(text)]
+    if numbers:
+        valid = [number for number in dict.fromkeys(numbers) if 1 <= number <= len(emails)]
+        ids = [emails[number - 1]['id'] for number in valid]
+        return ids, None, "die E-Mails " + ", ".join(str(number) for number in (valid or numbers))
+    
+    # "alle von Vincent"
+    named_match = _NAMED_SENDER_PATTERN.search(text)
+    if named_match:
+        name = named_match.group(1).strip()
+        matching = [
+            email for email in emails
+            if name in _sender_address(email) or name in (email.get('sender_name') or '').lower()
+        ]
+        if matching:
+            sender = matching[0]['sender']
+            ids = [email['id'] for email in emails if _sender_address(email) == sender.lower()]
+            return ids, sender, f"alle E-Mails von {sender}"
+        if '@' in name:
+            return [], name, f"alle E-Mails von {name}"
+        return None, None, ""
+    
+    # "alle"
+    if re.search(r'\balle\b|\ball\b', text):
+        return [email['id'] for email in emails], None, "alle geladenen E-Mails"
+    
+    return None, None, ""
+
+
+class ActionPrepareBulkOperation(Action):
+    """Resolve a bulk command to an operation and a set of message IDs."""
+    
+    def name(self) -> Text:
+        return "action_prepare_bulk_operation"
+    
+    async def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+        """
+        Parse the user's command and store the target IDs for action_execute_bulk_operation.
+        """
+        reset = [SlotSet("bulk_operation", None), SlotSet("bulk_target_ids", None)]
+        try:
+            text = (tracker.latest_message.get("text") or "").lower()
+            
+            operation = _parse_operation(text)
+            if not operation:
+                dispatcher.utter_message(text="Soll ich die E-Mails löschen oder als gelesen markieren?")
+                return reset
+            
+            # Records the session cache no longer holds may need a fetch; keep it off the event loop
+            emails = await asyncio.to_thread(load_listed_emails, tracker)
+            
+            target_ids, sender, description = _resolve_targets(text, tracker, emails)
+            if target_ids is None:
+                dispatcher.utter_message(
+                    text="Ich konnte nicht erkennen, welche E-Mails gemeint sind. Sagen Sie zum Beispiel \"1 bis 5 löschen\", "
+                         "\"alle als gelesen markieren\" oder \"alle von diesem Absender löschen\"."
+                )
+                return reset
+            
+            # Sender commands also cover matching mails beyond the loaded list
+            if sender:
+                client = await get_async_email_client()
+                label_ids = ['INBOX', 'UNREAD'] if operation == "mark_read" else ['INBOX']
+                found = await client.list_message_ids(
+                    query=f"from:{sender}",
+                    label_ids=label_ids,
+                    max_results=MAX_BULK_SEARCH_RESULTS
+                )
+                target_ids = list(dict.fromkeys(target_ids + found))
+            
+            if not target_ids:
+                dispatcher.utter_message(text=f"Ich habe keine passenden E-Mails gefunden ({description}).")
+                return reset
+            
+            if operation == "trash":
+                dispatcher.utter_message(text=f"Ich verschiebe {description} in den Papierkorb ({len(target_ids)} E-Mails).")
+            else:
+                dispatcher.utter_message(text=f"Ich markiere {description} als gelesen ({len(target_ids)} E-Mails).")
+            
+            return [SlotSet("bulk_operation", operation), SlotSet("bulk_target_ids", target_ids)]
+        
+        except Exception as e:
+            logger.error(f"Error preparing bulk operation: {e}")
+            dispatcher.utter_message(text="Ich bin auf einen Fehler gestoßen, während ich die E-Mails auswählen wollte.")
+            return reset
+
+
+class ActionExecuteBulkOperation(Action):
+    """Apply the prepared bulk operation with one batchModify call."""
+    
+    def name(self) -> Text:
+        return "action_execute_bulk_operation"
+    
+    async def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+        """
+        Trash or mark as read all prepared emails and drop them from the loaded list.
+        """
+        reset = [
+            SlotSet("bulk_operation", None),
+            SlotSet("bulk_target_ids", None),
+            SlotSet("confirm_bulk_operation", None)
+        ]
+        try:
+            operation = tracker.get_slot("bulk_operation")
+            target_ids = tracker.get_slot("bulk_target_ids") or []
+            if not operation or not target_ids:
+                dispatcher.utter_message(text="Es sind keine E-Mails für diese Aktion ausgewählt.")
+                return reset
+            
+            client = await get_async_email_client()
+            if operation == "trash":
+                success = await client.trash_emails(target_ids)
+            else:
+                success = await client.mark_emails_as_read(target_ids)
+            
+            if not success:
+                dispatcher.utter_message(text="Ich konnte die E-Mails nicht ändern. Bitte versuchen Sie es erneut.")
+                return reset
+            
+            if operation == "trash":
+                dispatcher.utter_message(text=f"{len(target_ids)} E-Mails wurden in den Papierkorb verschoben.")
+            else:
+                dispatcher.utter_message(text=f"{len(target_ids)} E-Mails wurden als gelesen markiert.")
+            
+            # Both operations take the mails out of the unread list
+            events = list(reset)
+            listed_ids = listed_email_ids(tracker)
+            if listed_ids:
+                affected = set(target_ids)
+                remaining = [msg_id for msg_id in listed_ids if msg_id not in affected]
+                events += [
+                    SlotSet("emails", remaining or None),
+                    SlotSet("email_count", len(remaining))
+                ]
+            if tracker.get_slot("current_email_id") in target_ids:
+                events += [
+                    SlotSet("current_email_id", None),
+                    SlotSet("current_email_sender", None),
+                    SlotSet("current_email_subject", None),
+                    SlotSet("current_email_content", None)
+                ]
+            return events
+        
+        except Exception as e:
+            logger.error(f"Error executing bulk operation: {e}")
+            dispatcher.utter_message(text="Ich bin auf einen Fehler gestoßen, während ich die E-Mails ändern wollte.")
+            return reset
@@ -0,0 +1,497 @@
+"""
+Whole-mailbox categorization job.
+
+Walks the mailbox page by page, fetches the messages of each page with a
+bounded pool of worker threads (each on its own connection, all drawing on
+the account's quota bucket) and labels them by keyword category with
+batchModify. Progress is checkpointed to disk after every fetched chunk, so
+an interrupted job resumes on the page it stopped at instead of starting over.
+
+Which messages got which categories is kept in a classification state file,
+together with the historyId each completed pass started at. The file is a log
+of JSON lines: every labeled page appends one line with its assignments, and
+the log is compacted into a single snapshot line once it grows long. Later runs only
+touch new mail: for the whole mailbox the additions are read from Gmail's
+history; for a query (or once the historyId has expired) the newest-first
+listing is walked until a page holds only messages that were categorized
+before.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from googleapiclient.errors import HttpError
+
+from actions.improved_email_client import ImprovedEmailClient
+from actions.keyword_categorizer import get_categorizer
+
+logger = logging.getLogger(__name__)
+
+
+def default_checkpoint_path(token_path: str) -> str:
+    """Checkpoint file next to the account's token, e.g. credentials/gmail_token.categorize.json."""
+    base, _ = os.path.splitext(token_path)
+    return f"{base}.categorize.json"
+
+
+def default_state_path(token_path: str) -> str:
+    """Classification state next to the account's token, e.g. credentials/gmail_token.categorized.json."""
+    base, _ = os.path.splitext(token_path)
+    return f"{base}.categorized.json"
+
+
+class CategorizationJob:
+    """Categorize every message matching query (default: the whole mailbox) of one account"""
+
+    DEFAULT_WORKERS = 4
+    MAX_WORKERS = 16
+
+    # messages.list returns at most 500 IDs per page
+    PAGE_SIZE = 500
+
+    # Mail the history reports but messages.list (without a query) leaves out
+    SKIPPED_LABELS = {'SPAM', 'TRASH'}
+
+    # Lines in the classification state log before it is rewritten as one snapshot
+    STATE_COMPACT_RECORDS = 200
+
+    def __init__(self, client: ImprovedEmailClient, query: Optional[str] = None,
+                 checkpoint_path: Optional[str] = None, workers: Optional[int] = None,
+                 state_path: Optional[str] = None):
+        self.client = client
+        self.query = query
+        self.checkpoint_path = checkpoint_path or default_checkpoint_path(client.token_path)
+        self.state_path = state_path or default_state_path(client.token_path)
+
+        workers = workers or int(os.getenv("GMAIL_CATEGORIZE_WORKERS", self.DEFAULT_WORKERS))
+        self.workers = max(1, min(workers, self.MAX_WORKERS))
+
+        self.categorizer = get_categorizer()
+
+        self._stop = threading.Event()
+        self._local = threading.local()
+        self._label_ids: Optional[Dict[str, Optional[str]]] = None
+        self._state_records = 0
+
+        # Set per run()
+        self._started = 0.0
+        self._processed_before = 0
+        self._seconds_before = 0.0
+        self._max_messages: Optional[int] = None
+        self._progress: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    def stop(self) -> None:
+        """Ask a running job to stop after the chunks in flight; the checkpoint is kept."""
+        self._stop.set()
+
+    def run(self, max_messages: Optional[int] = None,
+            progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Process the mailbox until it is done, stop() is called or max_messages were
+        categorized in this run. progress, if given, gets the stats after every chunk.
+        Returns the stats: processed (all runs), processed_this_run, seconds,
+        messages_per_second (this run), failed (messages that could not be
+        fetched and are left for a later run), skipped (messages that could not
+        be parsed or categorized and are not tried again), categories (count per
+        label), complete.
+        """
+        if not self.client.ensure_connected():
+            raise RuntimeError("Not authorized to access Gmail")
+
+        known = self._load_state()
+        state = self._load_checkpoint()
+        pass_key = self.query or ''
+
+        self._started = time.monotonic()
+        self._processed_before = state['processed']
+        self._seconds_before = state['seconds']
+        self._max_messages = max_messages
+        self._progress = progress
+
+        added = None
+        if state['history_id'] is None:
+            # Taken before listing, so mail arriving during the run is left for the next one
+            state['history_id'] = self._current_history_id()
+            state['incremental'] = pass_key in known['passes']
+            if state['incremental'] and self.query is None:
+                added = self._added_since(known['passes'][pass_key], known)
+        else:
+            logger.info(f"Resuming categorization after {state['processed']} messages")
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="gmail-categorize")
+        try:
+            # Results of a crashed run that were recorded but not yet labeled
+            self._apply_labels(state, known)
+
+            if added is not None:
+                complete = self._process_ids(executor, state, known, added)
+            else:
+                complete = self._walk(executor, state, known)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        result = self._stats(state, complete)
+        if complete:
+            if state['failed']:
+                # Not recorded as a pass, so the next run covers the same mail again and retries them
+                logger.info(f"{state['failed']} messages could not be fetched, they are retried by the next run")
+            else:
+                known['passes'][pass_key] = state['history_id']
+                self._append_state({'passes': {pass_key: state['history_id']}})
+            if self._state_records > self.STATE_COMPACT_RECORDS:
+                self._write_state(known)
+            self._remove_checkpoint()
+            logger.info(
+                f"Categorized {result['processed_this_run']} new messages in {result['seconds']:.1f} s "
+                f"({result['messages_per_second']:.1f} messages/s)"
+            )
+        return result
+
+    def _stats(self, state: Dict[str, Any], complete: bool = False) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._started
+        this_run = state['processed'] - self._processed_before
+        return {
+            'processed': state['processed'],
+            'processed_this_run': this_run,
+            'seconds': self._seconds_before + elapsed,
+            'messages_per_second': this_run / elapsed if elapsed > 0 else 0.0,
+            'failed': state['failed'],
+            'skipped': state['skipped_count'],
+            'categories': dict(state['categories']),
+            'complete': complete
+        }
+
+    def _walk(self, executor: ThreadPoolExecutor, state: Dict[str, Any], known: Dict[str, Any]) -> bool:
+        """Categorize the listing page by page. Returns False if the run stopped before the end."""
+        page = self._list_page(state['page_token'])
+        while True:
+            todo = [msg_id for msg_id in page['ids'] if not self._is_known(known, msg_id)]
+            if state['incremental'] and page['ids'] and not todo:
+                # The listing is newest first: everything older was categorized by an earlier pass
+                return True
+
+            pending, limited = self._submit(executor, state, todo)
+
+            # List the next page while the workers fetch this one
+            next_page = None
+            if page['next_token'] and not limited:
+                next_page = self._list_page(page['next_token'])
+
+            if not self._collect(pending, state, known, checkpoint=True) or limited:
+                return False
+            if not page['next_token']:
+                return True
+
+            state['page_token'] = page['next_token']
+            self._save_checkpoint(state)
+            page = next_page or self._list_page(page['next_token'])
+
+    def _process_ids(self, executor: ThreadPoolExecutor, state: Dict[str, Any],
+                     known: Dict[str, Any], message_ids: List[str]) -> bool:
+        """Categorize the given messages. Returns False if the run stopped before the end."""
+        for start in range(0, len(message_ids), self.PAGE_SIZE):
+            pending, limited = self._submit(executor, state, message_ids[start:start + self.PAGE_SIZE])
+            if not self._collect(pending, state, known, checkpoint=False) or limited:
+                return False
+        return True
+
+    def _submit(self, executor: ThreadPoolExecutor, state: Dict[str, Any],
+                message_ids: List[str]) -> Tuple[Set[Future], bool]:
+        """Queue message_ids in batch-sized chunks. Returns the futures and whether max_messages cut the list."""
+        todo = message_ids
+        if self._max_messages is not None:
+            todo = message_ids[:max(0, self._max_messages - (state['processed'] - self._processed_before))]
+
+        batch_size = self.client.batch_size
+        pending = {
+            executor.submit(self._categorize_chunk, todo[start:start + batch_size])
+            for start in range(0, len(todo), batch_size)
+        }
+        return pending, len(todo) < len(message_ids)
+
+    def _collect(self, pending: Set[Future], state: Dict[str, Any], known: Dict[str, Any],
+                 checkpoint: bool) -> bool:
+        """
+        Record chunks as they finish, then label what was done. Returns False
+        if stop() was called; chunks that had not finished are left for the next run.
+        """
+        stopped = False
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                self._record(state, *future.result())
+            if checkpoint:
+                self._save_checkpoint(state)
+            if self._progress is not None:
+                self._progress(self._stats(state))
+            if self._stop.is_set():
+                for future in pending:
+                    future.cancel()
+                stopped = True
+                break
+
+        self._apply_labels(state, known)
+        if checkpoint:
+            self._save_checkpoint(state)
+        return not stopped
+
+    def _list_page(self, page_token: Optional[str]) -> Dict[str, Any]:
+        results = self.client._execute(self.client.service.users().messages().list(
+            userId=self.client.user_id,
+            q=self.query,
+            maxResults=self.PAGE_SIZE,
+            pageToken=page_token
+        ))
+        return {
+            'ids': [message['id'] for message in results.get('messages', [])],
+            'next_token': results.get('nextPageToken')
+        }
+
+    def _current_history_id(self) -> str:
+        profile = self.client._execute(self.client.service.users().getProfile(userId=self.client.user_id))
+        return profile['historyId']
+
+    def _added_since(self, history_id: str, known: Dict[str, Any]) -> Optional[List[str]]:
+        """
+        IDs of messages added since history_id that were not categorized yet,
+        or None if Gmail no longer has history that far back.
+        """
+        added: Dict[str, None] = {}
+        page_token = None
+        try:
+            while True:
+                results = self.client._execute(self.client.service.users().history().list(
+                    userId=self.client.user_id,
+                    startHistoryId=history_id,
+                    historyTypes=['messageAdded', 'messageDeleted'],
+                    pageToken=page_token
+                ))
+                for record in results.get('history', []):
+                    for change in record.get('messagesAdded', []):
+                        message = change['message']
+                        if not self.SKIPPED_LABELS & set(message.get('labelIds', [])):
+                            added[message['id']] = None
+                    for change in record.get('messagesDeleted', []):
+                        added.pop(change['message']['id'], None)
+
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+
+        except HttpError as error:
+            # 404 means the start historyId is too old to be served
+            if getattr(error.resp, 'status', None) != 404:
+                raise
+            logger.info("History ID of the last categorization expired, walking the mailbox instead")
+            return None
+
+        return [msg_id for msg_id in added if not self._is_known(known, msg_id)]
+
+    @staticmethod
+    def _is_known(known: Dict[str, Any], msg_id: str) -> bool:
+        """Whether an earlier run categorized the message or gave up on it"""
+        return msg_id in known['assigned'] or msg_id in known['skipped']
+
+    def _categorize_chunk(self, message_ids: List[str]) -> Tuple[Dict[str, Optional[List[str]]], Dict[str, str]]:
+        """
+        Fetch and categorize one chunk in a worker thread. Returns message ID ->
+        categories, or None for a message that could not be fetched, and message
+        ID -> error for messages that could not be parsed or categorized.
+        """
+        # httplib2 connections can't be shared between threads
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = self.client.new_http()
+
+        fetched = self.client._batch_get_messages(message_ids, http=http, format=self.client.body_format)
+
+        # Parsed mail is not put into the message cache, which would otherwise be flooded
+        results = {}
+        skipped = {}
+        for msg_id in message_ids:
+            if msg_id not in fetched:
+                results[msg_id] = None
+                continue
+            try:
+                email = self.client._parse_message(fetched[msg_id])
+                results[msg_id] = self.categorizer.categorize(f"{email['subject']} {email['body']}")
+            except Exception as error:
+                # One broken message must not take the rest of the chunk down with it
+                logger.warning(f"Skipping message {msg_id}, it could not be categorized: {error}")
+                skipped[msg_id] = f"{type(error).__name__}: {error}"
+        return results, skipped
+
+    def _record(self, state: Dict[str, Any], results: Dict[str, Optional[List[str]]],
+                skipped: Dict[str, str]) -> None:
+        """Add a finished chunk to the state; its labels are applied once the page is done."""
+        # Fetching again would fail the same way, so these are recorded and not retried
+        state['skipped'].update(skipped)
+        state['skipped_count'] += len(skipped)
+        for msg_id, categories in results.items():
+            if categories is None:
+                # Already retried by the client; left out so a later run tries again
+                state['failed'] += 1
+                continue
+            state['done'][msg_id] = categories
+            state['processed'] += 1
+            for category in categories:
+                state['categories'][category] = state['categories'].get(category, 0) + 1
+
+    def _apply_labels(self, state: Dict[str, Any], known: Dict[str, Any]) -> None:
+        """Label the recorded messages, one batchModify per label, and move them into the classification state."""
+        if not state['done'] and not state['skipped']:
+            return
+
+        if state['done'] and self._label_ids is None:
+            self._label_ids = {
+                category: self.client._get_or_create_label(category) for category in self.categorizer.categories
+            }
+
+        ids_by_label: Dict[str, List[str]] = {}
+        for msg_id, categories in state['done'].items():
+            for category in categories:
+                label_id = self._label_ids.get(category)
+                if label_id:
+                    ids_by_label.setdefault(label_id, []).append(msg_id)
+
+        for label_id, msg_ids in ids_by_label.items():
+            if not self.client.batch_modify(msg_ids, add_label_ids=[label_id]):
+                raise RuntimeError(f"Could not apply label {label_id}")
+
+        # Only this page's results are appended, the state file is not rewritten
+        self._append_state({'assigned': state['done'], 'skipped': state['skipped']})
+        known['assigned'].update(state['done'])
+        known['skipped'].update(state['skipped'])
+        state['done'] = {}
+        state['skipped'] = {}
+
+    def _load_state(self) -> Dict[str, Any]:
+        """
+        Classification state: assigned (message ID -> categories), skipped
+        (message ID -> why it could not be categorized) and passes (query, ''
+        for the whole mailbox -> historyId the last complete pass started at).
+
+        Each line of the state file holds some of these keys and is merged in
+        order; a file holding a single JSON object is a log with one line.
+        """
+        fresh = {'fingerprint': self.categorizer.fingerprint, 'passes': {}, 'assigned': {}, 'skipped': {}}
+        known = {key: value.copy() if isinstance(value, dict) else value for key, value in fresh.items()}
+        records = 0
+        try:
+            with open(self.state_path) as saved:
+                for number, line in enumerate(saved, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError as error:
+                        # A run killed while appending leaves a torn last line
+                        logger.warning(f"Ignoring unreadable line {number} of classification state "
+                                       f"{self.state_path}: {error}")
+                        continue
+                    if record.get('fingerprint', known['fingerprint']) != known['fingerprint']:
+                        logger.info("Category keywords changed since the last categorization, starting over")
+                        known = fresh
+                        records = 0
+                        break
+                    for key in ('passes', 'assigned', 'skipped'):
+                        known[key].update(record.get(key, {}))
+                    records += 1
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            logger.warning(f"Ignoring unreadable classification state {self.state_path}: {error}")
+
+        if records == 0:
+            # Start a new log that records which keywords its assignments were made with
+            self._write_state(known)
+        else:
+            self._state_records = records
+        return known
+
+    def _write_state(self, known: Dict[str, Any]) -> None:
+        """Replace the state log with a single snapshot line"""
+        self._write_json(self.state_path, known)
+        self._state_records = 1
+
+    def _append_state(self, record: Dict[str, Any]) -> None:
+        """Append one line to the state log and flush it to disk"""
+        with open(self.state_path, 'a+b') as log:
+            # A snapshot or a torn line from a killed run may lack its line break
+            if log.tell() > 0:
+                log.seek(-1, os.SEEK_END)
+                if log.read(1) != b'\n':
+                    log.write(b'\n')
+            log.write(json.dumps(record).encode() + b'\n')
+            log.flush()
+            os.fsync(log.fileno())
+        self._state_records += 1
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        state = {
+            'query': self.query,
+            'history_id': None,
+            'incremental': False,
+            'page_token': None,
+            'done': {},
+            'skipped': {},
+            'processed': 0,
+            'failed': 0,
+            'skipped_count': 0,
+            'categories': {},
+            'seconds': 0.0
+        }
+        saved = self._read_json(self.checkpoint_path, "categorization checkpoint")
+        if saved is None:
+            return state
+        if saved.get('query') != self.query:
+            logger.info("Categorization checkpoint is for a different query, starting over")
+            return state
+        state.update(saved)
+        return state
+
+    def _save_checkpoint(self, state: Dict[str, Any]) -> None:
+        state['seconds'] = self._seconds_before + time.monotonic() - self._started
+        self._write_json(self.checkpoint_path, state)
+
+    def _remove_checkpoint(self) -> None:
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _read_json(path: str, description: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path) as saved:
+                return json.load(saved)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            logger.warning(f"Ignoring unreadable {description} {path}: {error}")
+            return None
+
+    @staticmethod
+    def _write_json(path: str, data: Dict[str, Any]) -> None:
+        """Write a file atomically: temp file in the same directory, then os.replace."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".categorize-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as target:
+                json.dump(data, target)
+                target.write('\n')
+                target.flush()
+                os.fsync(target.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
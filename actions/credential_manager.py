@@ -0,0 +1,170 @@
+"""
+OAuth credential management for the Google APIs (Gmail, Calendar).
+
+Each token file gets one manager that keeps its credentials in memory and
+refreshes them on a background timer shortly before they expire. Actions
+get an already valid credential without touching the disk, and refreshed
+tokens are written to a temporary file and moved into place atomically, so
+a crash never leaves a truncated token file behind.
+"""
+
+import os
+import json
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+
+
+class CredentialManager:
+    """Keeps the OAuth credentials of one token file valid in the background"""
+
+    # Refresh this long before the access token expires
+    REFRESH_MARGIN_SECONDS = 300
+    # Wait this long before retrying a failed background refresh
+    RETRY_SECONDS = 60
+
+    def __init__(self, token_path: str, scopes: List[str], credentials_path: Optional[str] = None):
+        self.token_path = token_path
+        self.scopes = scopes
+        self.credentials_path = credentials_path
+
+        self._credentials: Optional[Credentials] = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+
+    def get_credentials(self) -> Optional[Credentials]:
+        """
+        Return valid credentials from memory. The token file is only read on
+        first use; a refresh only happens here if the background refresh failed.
+        """
+        with self._lock:
+            if self._credentials is None:
+                self._credentials = self._load()
+                if self._credentials is None:
+                    return None
+                self._schedule_refresh()
+
+            creds = self._credentials
+            if not creds.valid and creds.refresh_token:
+                self._refresh()
+
+            return creds if creds.valid else None
+
+    def _load(self) -> Optional[Credentials]:
+        """Read the token file, refreshing it or running the OAuth flow when needed."""
+        creds = None
+
+        if os.path.exists(self.token_path):
+            try:
+                with open(self.token_path) as token:
+                    creds = Credentials.from_authorized_user_info(json.load(token), self.scopes)
+            except Exception as e:
+                print(f"Error loading token: {e}")
+
+        if creds and not creds.valid and creds.expired and creds.refresh_token:
+            try:
+                creds.refresh(Request())
+                self._save(creds)
+            except Exception as e:
+                print(f"Error refreshing token: {e}")
+                creds = None
+
+        if not creds or not creds.valid:
+            if not self.credentials_path or not os.path.exists(self.credentials_path):
+                print("Credentials file not found")
+                return None
+
+            try:
+                flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.scopes)
+                creds = flow.run_local_server(port=0)
+            except Exception as e:
+                print(f"Error during OAuth flow: {e}")
+                return None
+
+            self._save(creds)
+
+        return creds
+
+    def _refresh(self) -> bool:
+        """Refresh the in-memory credentials in place and persist them (caller holds the lock)."""
+        try:
+            # In place, so services built with these credentials pick up the new token
+            self._credentials.refresh(Request())
+            self._save(self._credentials)
+            return True
+        except Exception as e:
+            print(f"Error refreshing token: {e}")
+            return False
+
+    def _background_refresh(self) -> None:
+        with self._lock:
+            self._timer = None
+            if self._credentials is None:
+                return
+            refreshed = self._refresh()
+            self._schedule_refresh(None if refreshed else self.RETRY_SECONDS)
+
+    def _schedule_refresh(self, delay: Optional[float] = None) -> None:
+        """Start the timer for the next refresh, REFRESH_MARGIN_SECONDS before expiry (caller holds the lock)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        creds = self._credentials
+        if creds is None or not creds.refresh_token:
+            return
+
+        if delay is None:
+            if creds.expiry is None:
+                return
+            # google-auth keeps expiry as naive UTC
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            delay = max(0.0, (creds.expiry - now).total_seconds() - self.REFRESH_MARGIN_SECONDS)
+
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _save(self, creds: Credentials) -> None:
+        """Write the token file atomically: temp file in the same directory, then os.replace."""
+        directory = os.path.dirname(os.path.abspath(self.token_path))
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as token:
+                token.write(creds.to_json())
+                token.flush()
+                os.fsync(token.fileno())
+            os.replace(tmp_path, self.token_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def stop(self) -> None:
+        """Cancel the pending background refresh."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+_managers: Dict[str, CredentialManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_credential_manager(token_path: str, scopes: List[str],
+                           credentials_path: Optional[str] = None) -> CredentialManager:
+    """Return the credential manager for a token file, creating it on first use."""
+    with _managers_lock:
+        manager = _managers.get(token_path)
+        if manager is None:
+            manager = CredentialManager(token_path, scopes, credentials_path)
+            _managers[token_path] = manager
+        return manager
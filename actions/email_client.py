@@ -4,19 +4,24 @@ Dieses Modul bietet eine einheitliche Schnittstelle zur Interaktion mit Gmail.
 """
 
 import os
+import threading
 import base64
-import json
 from typing import List, Dict, Any, Optional
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from actions.credential_manager import get_credential_manager
+from actions.label_cache import get_label_cache
+from actions.rate_limiter import get_rate_limiter, quota_units
+from actions.retry_policy import get_retry_policy, classify_http_error
+from actions.mime_parser import parse_raw, parse_raw_headers, get_header, get_text_body
+from actions.email_client_pool import get_email_client
+from actions.categorization_job import CategorizationJob
+
 
 class EmailClient:
     """Ein Gmail-API-Client für den Rasa-Chatbot"""
@@ -29,13 +34,23 @@ class EmailClient:
         'https://www.googleapis.com/auth/gmail.labels'
     ]
     
-    def __init__(self, credentials_path: Optional[str] = None, token_path: Optional[str] = None):
+    # Gmail erlaubt bis zu 100 Aufrufe pro Batch-Anfrage, empfiehlt aber höchstens 50
+    MAX_BATCH_SIZE = 100
+    DEFAULT_BATCH_SIZE = 50
+    
+    # sort_emails_by_content sortiert wie bisher höchstens 50 E-Mails des Posteingangs pro Aufruf
+    SORT_QUERY = 'in:inbox'
+    SORT_MAX_MESSAGES = 50
+    
+    def __init__(self, credentials_path: Optional[str] = None, token_path: Optional[str] = None,
+                 batch_size: Optional[int] = None):
         """
         Initialisiert den Gmail-Client.
         
         Args:
             credentials_path: Pfad zur credentials.json-Datei
             token_path: Pfad zum Speichern/Laden der token.json-Datei
+            batch_size: Anzahl Nachrichten pro Batch-Anfrage (Standard: GMAIL_BATCH_SIZE oder 50)
         """
         # Suche nach Anmeldedaten an mehreren Speicherorten mit Fallbacks
         self.credentials_path = credentials_path or os.getenv("GMAIL_CREDENTIALS_PATH") or os.path.join(
@@ -58,6 +73,24 @@ class EmailClient:
         self.authorized = False
         self.user_id = 'me'  # Standardwert für authentifizierten Nutzer
         
+        # Quota-Token-Bucket, den alle Clients dieses Kontos gemeinsam nutzen
+        self.rate_limiter = get_rate_limiter(os.path.abspath(self.token_path))
+        
+        # Wiederholungsstrategie (Backoff, Deadline, Metriken) dieses Kontos
+        self.retry_policy = get_retry_policy(os.path.abspath(self.token_path))
+        
+        # httplib2-Verbindungen sind nicht threadsicher: Anfragen über die gemeinsame
+        # Verbindung laufen nacheinander, auch wenn ein Versuch nach Ablauf der
+        # Deadline noch im Hintergrund zu Ende läuft
+        self._http_lock = threading.Lock()
+        
+        # Label-Liste, die alle Clients dieses Kontos gemeinsam nutzen
+        self.label_cache = get_label_cache(os.path.abspath(self.token_path))
+        
+        # Batch-Größe für das Abrufen mehrerer Nachrichten begrenzen
+        batch_size = batch_size or int(os.getenv("GMAIL_BATCH_SIZE", self.DEFAULT_BATCH_SIZE))
+        self.batch_size = max(1, min(batch_size, self.MAX_BATCH_SIZE))
+        
         # Verbindung zur Gmail-API herstellen
         self.connect()
     
@@ -68,44 +101,12 @@ class EmailClient:
         Returns:
             bool: True, wenn Verbindung erfolgreich, sonst False
         """
-        creds = None
-        
-        # Prüfen, ob die Token-Datei existiert
-        if os.path.exists(self.token_path):
-            try:
-                creds = Credentials.from_authorized_user_info(
-                    json.loads(open(self.token_path).read()),
-                    self.SCOPES
-                )
-            except Exception as e:
-                print(f"Fehler beim Laden des Tokens: {e}")
-        
-        # Wenn keine gültigen Anmeldedaten vorhanden sind, OAuth-Flow starten
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                try:
-                    creds.refresh(Request())
-                except Exception as e:
-                    print(f"Fehler beim Aktualisieren des Tokens: {e}")
-                    creds = None
-            
-            # Falls weiterhin keine gültigen Anmeldedaten, OAuth-Flow durchführen
-            if not creds:
-                if not self.credentials_path or not os.path.exists(self.credentials_path):
-                    print("Credentials-Datei nicht gefunden")
-                    return False
-                
-                try:
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        self.credentials_path, self.SCOPES)
-                    creds = flow.run_local_server(port=0)
-                except Exception as e:
-                    print(f"Fehler beim OAuth-Flow: {e}")
-                    return False
-                
-                # Speichern der Anmeldedaten für zukünftige Verwendung
-                with open(self.token_path, 'w') as token:
-                    token.write(creds.to_json())
+        # Token laden, aktualisieren und speichern übernimmt der Credential-Manager des Kontos
+        creds = get_credential_manager(
+            os.path.abspath(self.token_path), self.SCOPES, self.credentials_path
+        ).get_credentials()
+        if creds is None:
+            return False
         
         try:
             # Gmail-Service aufbauen
@@ -117,39 +118,27 @@ class EmailClient:
             print(f"Fehler beim Erstellen des Gmail-Services: {e}")
             return False
     
-    @staticmethod
-    def rate_limit(max_per_second):
+    def _execute(self, request):
         """
-        Decorator zur Ratenbegrenzung, um API-Drosselung zu vermeiden.
+        Führt eine API-Anfrage mit der Wiederholungsstrategie des Kontos aus.
+        Jeder Versuch entnimmt seine Quota-Einheiten dem Token-Bucket des Kontos;
+        429- und vorübergehende Serverfehler werden mit Backoff wiederholt.
         
         Args:
-            max_per_second: Maximale Anzahl Aufrufe pro Sekunde
+            request: Die vorbereitete Gmail-API-Anfrage
         
         Returns:
-            Die dekorierte Funktion mit Ratenbegrenzung
+            Die Antwort der API
         """
-        from functools import wraps
-        import time
-        
-        min_interval = 1.0 / max_per_second
-        last_called = [0.0]
-        
-        def decorator(func):
-            @wraps(func)
-            def wrapper(*args, **kwargs):
-                elapsed = time.time() - last_called[0]
-                left_to_wait = min_interval - elapsed
-                
-                if left_to_wait > 0:
-                    time.sleep(left_to_wait)
-                
-                ret = func(*args, **kwargs)
-                last_called[0] = time.time()
-                return ret
-            return wrapper
-        return decorator
+        method_id = getattr(request, 'methodId', None)
+        
+        def send():
+            self.rate_limiter.acquire(quota_units(method_id))
+            with self._http_lock:
+                return request.execute()
+        
+        return self.retry_policy.run(send, classify_http_error, method_id)
 
-    @rate_limit(2)  # Maximal 2 Aufrufe pro Sekunde
     def get_unread_emails(self, max_results: int = 5) -> List[Dict[str, Any]]:
         """
         Holt ungelesene E-Mails aus dem Posteingang mit Ratenbegrenzung.
@@ -166,81 +155,148 @@ class EmailClient:
         
         try:
             # Suche nach ungelesenen Nachrichten im Posteingang
-            results = self.service.users().messages().list(
+            results = self._execute(self.service.users().messages().list(
                 userId=self.user_id,
                 labelIds=['INBOX', 'UNREAD'],
                 maxResults=max_results
-            ).execute()
+            ))
             
             messages = results.get('messages', [])
             
             if not messages:
                 return []
             
-            emails = []
-            
-            for message in messages:
-                msg_id = message['id']
-                
-                # Detailierte Nachricht abrufen
-                msg = self.service.users().messages().get(
-                    userId=self.user_id, 
-                    id=msg_id,
-                    format='full'
-                ).execute()
-                
-                headers = msg['payload']['headers']
-                
-                # E-Mail-Details aus den Headern extrahieren
-                subject = ""
-                sender = ""
-                sender_name = ""
-                date_str = ""
-                
-                for header in headers:
-                    if header['name'] == 'Subject':
-                        subject = header['value']
-                    elif header['name'] == 'From':
-                        sender_full = header['value']
-                        # Name und Adresse trennen
-                        if '<' in sender_full and '>' in sender_full:
-                            sender_name = sender_full.split('<')[0].strip()
-                            sender = sender_full.split('<')[1].split('>')[0].strip()
-                        else:
-                            sender = sender_full
-                            sender_name = sender_full
-                    elif header['name'] == 'Date':
-                        date_str = header['value']
-                
-                # Nachrichtentext abrufen
-                body = self._get_message_body(msg)
-                
-                # Datum parsen
-                try:
-                    date_obj = datetime.strptime(date_str.split('(')[0].strip(), "%a, %d %b %Y %H:%M:%S %z")
-                    date_iso = date_obj.isoformat()
-                except:
-                    date_iso = datetime.now().isoformat()
-                
-                # E-Mail-Objekt erstellen
-                email = {
-                    "id": msg_id,
-                    "sender": sender,
-                    "sender_name": sender_name,
-                    "subject": subject,
-                    "snippet": msg.get('snippet', ''),
-                    "body": body,
-                    "date": date_iso
-                }
-                
-                emails.append(email)
+            # Alle Nachrichten gebündelt über den Batch-Endpunkt abrufen
+            fetched = self._batch_get_messages(
+                [message['id'] for message in messages],
+                format='raw'
+            )
             
-            return emails
+            # Reihenfolge der Liste beibehalten, fehlgeschlagene Abrufe überspringen
+            return [self._parse_message(fetched[message['id']]) for message in messages if message['id'] in fetched]
         
         except HttpError as error:
             print(f"Ein Fehler ist aufgetreten: {error}")
             return []
     
+    def _batch_get_messages(self, message_ids: List[str], **get_kwargs) -> Dict[str, Dict[str, Any]]:
+        """
+        Ruft mehrere Nachrichten über den Gmail-Batch-Endpunkt ab.
+        
+        Args:
+            message_ids: IDs der abzurufenden Nachrichten
+            **get_kwargs: Zusätzliche Parameter für messages().get, z.B. format
+        
+        Returns:
+            Dict von Nachrichten-ID zu Nachrichten-Objekt; fehlgeschlagene Abrufe fehlen
+        """
+        fetched = {}
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                print(f"Fehler beim Abrufen der Nachricht {request_id}: {exception}")
+                return
+            fetched[request_id] = response
+        
+        unique_ids = list(dict.fromkeys(message_ids))
+        for start in range(0, len(unique_ids), self.batch_size):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            chunk = unique_ids[start:start + self.batch_size]
+            for msg_id in chunk:
+                batch.add(
+                    self.service.users().messages().get(userId=self.user_id, id=msg_id, **get_kwargs),
+                    request_id=msg_id
+                )
+            
+            def send_batch():
+                # Quota wird für jeden Aufruf im Batch einzeln berechnet
+                self.rate_limiter.acquire(quota_units('messages.get') * len(chunk))
+                with self._http_lock:
+                    batch.execute()
+            
+            self.retry_policy.run(send_batch, classify_http_error, 'messages.get')
+        
+        return fetched
+    
+    def _parse_message(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Wandelt eine Gmail-Nachricht in ein E-Mail-Objekt für den Chatbot um.
+        
+        Args:
+            msg: Das Nachricht-Objekt von der Gmail-API
+        
+        Returns:
+            E-Mail-Objekt mit id, sender, subject, snippet, body und date
+        """
+        # E-Mail-Details aus den Headern extrahieren
+        subject = ""
+        sender = ""
+        sender_name = ""
+        date_str = ""
+        
+        # Bei format='raw' liegt die RFC-822-Quelle statt des Payload-Baums vor
+        mime_message = None
+        header_message = None
+        if 'raw' in msg:
+            try:
+                mime_message = parse_raw(msg['raw'])
+                header_message = mime_message
+            except Exception as error:
+                # Zu tief verschachteltes oder defektes MIME: Header behalten, Snippet als Text zeigen
+                print(f"Fehler beim Parsen der Nachricht {msg.get('id')}: {error}")
+                try:
+                    header_message = parse_raw_headers(msg['raw'])
+                except Exception as error:
+                    print(f"Fehler beim Parsen der Header von Nachricht {msg.get('id')}: {error}")
+        
+        if header_message is not None:
+            subject = get_header(header_message, 'Subject')
+            sender_full = get_header(header_message, 'From')
+            date_str = get_header(header_message, 'Date')
+        else:
+            sender_full = ""
+            for header in msg.get('payload', {}).get('headers', []):
+                if header['name'] == 'Subject':
+                    subject = header['value']
+                elif header['name'] == 'From':
+                    sender_full = header['value']
+                elif header['name'] == 'Date':
+                    date_str = header['value']
+        
+        # Name und Adresse trennen
+        if '<' in sender_full and '>' in sender_full:
+            sender_name = sender_full.split('<')[0].strip()
+            sender = sender_full.split('<')[1].split('>')[0].strip()
+        else:
+            sender = sender_full
+            sender_name = sender_full
+        
+        # Nachrichtentext abrufen (der Rohtext wird dabei nicht ein zweites Mal geparst)
+        if mime_message is not None:
+            body = get_text_body(mime_message, preferencelist=('plain',))[0]
+        elif 'raw' in msg:
+            body = msg.get('snippet', '')
+        else:
+            body = self._get_message_body(msg)
+        
+        # Datum parsen
+        try:
+            date_obj = datetime.strptime(date_str.split('(')[0].strip(), "%a, %d %b %Y %H:%M:%S %z")
+            date_iso = date_obj.isoformat()
+        except:
+            date_iso = datetime.now().isoformat()
+        
+        # E-Mail-Objekt erstellen
+        return {
+            "id": msg['id'],
+            "sender": sender,
+            "sender_name": sender_name,
+            "subject": subject,
+            "snippet": msg.get('snippet', ''),
+            "body": body,
+            "date": date_iso
+        }
+    
     def _get_message_body(self, message: Dict[str, Any]) -> str:
         """
         Extrahiert den Nachrichtentext aus der Gmail-API-Antwort.
@@ -304,10 +360,10 @@ class EmailClient:
             raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
             
             # Nachricht versenden
-            self.service.users().messages().send(
+            self._execute(self.service.users().messages().send(
                 userId=self.user_id,
                 body={'raw': raw_message}
-            ).execute()
+            ))
             
             return True
         
@@ -338,11 +394,11 @@ class EmailClient:
                 return False
             
             # Label auf die E-Mail anwenden
-            self.service.users().messages().modify(
+            self._execute(self.service.users().messages().modify(
                 userId=self.user_id,
                 id=email_id,
                 body={'addLabelIds': [label_id]}
-            ).execute()
+            ))
             
             return True
         
@@ -361,31 +417,49 @@ class EmailClient:
             Die Label-ID oder None bei Fehler
         """
         try:
-            # Alle Labels abfragen
-            results = self.service.users().labels().list(userId=self.user_id).execute()
-            labels = results.get('labels', [])
-            
-            # Prüfen, ob Label bereits existiert
-            for label in labels:
-                if label['name'].lower() == label_name.lower():
-                    return label['id']
+            # Prüfen, ob Label bereits existiert (Label-Liste aus dem Cache)
+            label_id = self.label_cache.get_label_id(label_name, self._fetch_labels)
+            if label_id:
+                return label_id
             
             # Label neu erstellen, falls nicht vorhanden
-            new_label = self.service.users().labels().create(
+            new_label = self._execute(self.service.users().labels().create(
                 userId=self.user_id,
                 body={'name': label_name}
-            ).execute()
+            ))
+            self.label_cache.add_label(new_label)
             
             return new_label['id']
         
         except HttpError as error:
+            # Zwischengespeicherte Liste könnte veraltet sein
+            self.label_cache.invalidate()
             print(f"Ein Fehler ist aufgetreten: {error}")
             return None
     
-    def sort_emails_by_content(self) -> bool:
+    def _fetch_labels(self) -> List[Dict[str, Any]]:
+        """
+        Ruft alle Labels des Kontos von der API ab (füllt den Label-Cache).
+        
+        Returns:
+            Liste der Label-Objekte
+        """
+        results = self._execute(self.service.users().labels().list(userId=self.user_id))
+        return results.get('labels', [])
+    
+    def sort_emails_by_content(self, query: Optional[str] = SORT_QUERY,
+                               max_messages: Optional[int] = SORT_MAX_MESSAGES) -> bool:
         """
-        Sortiert E-Mails basierend auf Inhaltsanalyse in Kategorien.
-        Nutzt einfache Schlüsselwort-Suche für die Kategorisierung.
+        Sortiert E-Mails basierend auf Inhaltsanalyse in Kategorien, standardmäßig
+        die neuesten 50 noch nicht kategorisierten E-Mails des Posteingangs.
+        Die Arbeit übernimmt ein CategorizationJob: Er ruft die Nachrichten parallel
+        ab und setzt beim nächsten Aufruf am gespeicherten Fortschritt wieder auf.
+        Bereits kategorisierte E-Mails werden übersprungen. Das ganze Postfach
+        sortiert scripts/categorize_mailbox.py im Hintergrund.
+        
+        Args:
+            query: Gmail-Suchanfrage, die die E-Mails einschränkt (None für das ganze Postfach)
+            max_messages: Höchstens so viele E-Mails in diesem Aufruf kategorisieren (None für alle)
         
         Returns:
             True wenn die E-Mails erfolgreich sortiert wurden, sonst False
@@ -395,74 +469,14 @@ class EmailClient:
             return False
         
         try:
-            # Aktuelle E-Mails abrufen (bis zu 50)
-            results = self.service.users().messages().list(
-                userId=self.user_id,
-                labelIds=['INBOX'],
-                maxResults=50
-            ).execute()
-            messages = results.get('messages', [])
-            
-            if not messages:
-                return True  # Keine E-Mails zum Sortieren
-            
-            # Kategorien und Schlüsselwörter definieren
-            categories = {
-                'Arbeit': ['projekt', 'frist', 'besprechung', 'bericht', 'kunde', 'aufgabe'],
-                'Finanzen': ['rechnung', 'zahlung', 'beleg', 'transaktion', 'abrechnung', 'abo'],
-                'Reise': ['flug', 'hotel', 'buchung', 'reservierung', 'reiseplan', 'trip'],
-                'Soziales': ['einladung', 'event', 'party', 'feier', 'treffen'],
-                'Updates': ['newsletter', 'update', 'ankündigung', 'nachricht'],
-                'Dringend': ['dringend', 'wichtig', 'sofort', 'asap', 'notfall']
-            }
-            
-            # Sicherstellen, dass alle Kategorien-Labels existieren
-            for category in categories:
-                self._get_or_create_label(category)
-            
-            # E-Mails verarbeiten
-            for message in messages:
-                msg_id = message['id']
-                
-                # Vollständige Nachricht abrufen
-                msg = self.service.users().messages().get(
-                    userId=self.user_id, 
-                    id=msg_id,
-                    format='full'
-                ).execute()
-                
-                # Betreff und Nachrichtentext extrahieren
-                subject = ""
-                for header in msg['payload']['headers']:
-                    if header['name'] == 'Subject':
-                        subject = header['value']
-                        break
-                body = self._get_message_body(msg)
-                
-                # Inhalt für Analyse kombinieren
-                content = f"{subject} {body}".lower()
-                
-                # Kategorien ermitteln
-                matched_categories = []
-                for category, keywords in categories.items():
-                    for keyword in keywords:
-                        if keyword.lower() in content:
-                            matched_categories.append(category)
-                            break
-                
-                # Labels auf die E-Mail anwenden
-                for category in matched_categories:
-                    label_id = self._get_or_create_label(category)
-                    if label_id:
-                        self.service.users().messages().modify(
-                            userId=self.user_id,
-                            id=msg_id,
-                            body={'addLabelIds': [label_id]}
-                        ).execute()
-            
+            # Der Job nutzt den gemeinsamen Client dieses Kontos (Quota, Wiederholungen, Labels)
+            client = get_email_client(self.credentials_path, os.path.abspath(self.token_path))
+            stats = CategorizationJob(client, query=query).run(max_messages=max_messages)
+            print(f"{stats['processed_this_run']} E-Mails kategorisiert "
+                  f"({stats['messages_per_second']:.1f} E-Mails/s)")
             return True
         
-        except HttpError as error:
+        except (HttpError, RuntimeError) as error:
             print(f"Ein Fehler ist aufgetreten: {error}")
             return False
     
@@ -482,14 +496,14 @@ class EmailClient:
             
         try:
             # In den Papierkorb verschieben durch Hinzufügen des TRASH-Labels und Entfernen von INBOX
-            self.service.users().messages().modify(
+            self._execute(self.service.users().messages().modify(
                 userId=self.user_id,
                 id=email_id,
                 body={
                     'addLabelIds': ['TRASH'],
                     'removeLabelIds': ['INBOX']
                 }
-            ).execute()
+            ))
             
             return True
             
@@ -513,13 +527,13 @@ class EmailClient:
             
         try:
             # UNREAD-Label entfernen
-            self.service.users().messages().modify(
+            self._execute(self.service.users().messages().modify(
                 userId=self.user_id,
                 id=email_id,
                 body={
                     'removeLabelIds': ['UNREAD']
                 }
-            ).execute()
+            ))
             
             return True
             
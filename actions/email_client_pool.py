@@ -0,0 +1,84 @@
+"""
+Process-wide pool of authorized Gmail clients shared by all actions.
+"""
+
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple
+
+from actions.async_email_client import AsyncEmailClient
+from actions.improved_email_client import ImprovedEmailClient, resolve_token_path
+
+# One warm client per token file (i.e. per Gmail account)
+_clients: Dict[str, ImprovedEmailClient] = {}
+_async_clients: Dict[str, AsyncEmailClient] = {}
+_clients_lock = threading.Lock()
+# Held while an account's client is being built, so that it is built once
+_creation_locks: Dict[str, threading.Lock] = {}
+
+
+def get_email_client(credentials_path: Optional[str] = None, token_path: Optional[str] = None) -> ImprovedEmailClient:
+    """
+    Return the shared client for the account behind token_path.
+    
+    The first call per account loads the token and builds the Gmail service;
+    later calls reuse it and only refresh credentials or reconnect when needed.
+    """
+    client, created = _get_pooled_client(credentials_path, token_path)
+    if not created:
+        client.ensure_connected()
+    return client
+
+
+async def get_async_email_client(credentials_path: Optional[str] = None,
+                                 token_path: Optional[str] = None) -> AsyncEmailClient:
+    """
+    Return the asyncio client for the account behind token_path. It shares
+    credentials and caches with the pooled sync client. Creating that client
+    (token file, service build) runs in a worker thread, so the event loop
+    never waits on it.
+    """
+    key = resolve_token_path(token_path)
+    with _clients_lock:
+        async_client = _async_clients.get(key)
+        if async_client is not None and async_client.client is _clients.get(key):
+            return async_client
+    
+    client, _ = await asyncio.to_thread(_get_pooled_client, credentials_path, token_path)
+    
+    with _clients_lock:
+        async_client = _async_clients.get(client.token_path)
+        if async_client is None or async_client.client is not client:
+            async_client = AsyncEmailClient(client)
+            _async_clients[client.token_path] = async_client
+        return async_client
+
+
+def _get_pooled_client(credentials_path: Optional[str], token_path: Optional[str]) -> Tuple[ImprovedEmailClient, bool]:
+    """Look up the pooled client for an account, creating it if needed. Returns (client, created)."""
+    key = resolve_token_path(token_path)
+    
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client, False
+        creation_lock = _creation_locks.setdefault(key, threading.Lock())
+    
+    # Loading the token and building the service can take seconds; only callers
+    # for the same account wait for it, not the whole pool
+    with creation_lock:
+        with _clients_lock:
+            client = _clients.get(key)
+        if client is not None:
+            return client, False
+        client = ImprovedEmailClient(credentials_path=credentials_path, token_path=key)
+        with _clients_lock:
+            _clients[key] = client
+        return client, True
+
+
+def reset_email_clients() -> None:
+    """Drop all pooled clients, e.g. after the token files were replaced."""
+    with _clients_lock:
+        _clients.clear()
+        _async_clients.clear()
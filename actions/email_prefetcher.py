@@ -0,0 +1,114 @@
+"""
+Speculative loading of the emails a conversation is likely to open next.
+
+After a mail is shown, its neighbours in the listing are loaded and
+rendered in the background and kept in the session cache, so "nächste" /
+"vorherige" are answered without a Gmail round trip. A mail that is asked
+for while its prefetch is still running awaits that load, without blocking
+the event loop, instead of starting a second one. A body that could not be
+loaded is not cached, so the next read asks Gmail again.
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from actions.session_cache import SessionCache, get_session_cache
+
+logger = logging.getLogger(__name__)
+
+# Loads the body of an email record and returns (body, rendered body), or None if it is unavailable
+BodyLoader = Callable[[Dict[str, Any]], Optional[Tuple[str, str]]]
+
+
+class EmailPrefetcher:
+    """Background loads of email bodies into the session cache"""
+
+    DEFAULT_WORKERS = 2
+
+    # How long a reading action waits for a running prefetch before loading itself
+    WAIT_SECONDS = 10.0
+
+    def __init__(self, session_cache: Optional[SessionCache] = None, workers: Optional[int] = None):
+        self.session_cache = session_cache or get_session_cache()
+
+        # Few workers: the client serializes its Gmail calls anyway, and a
+        # prefetch must not crowd out the requests of other conversations
+        self._executor = ThreadPoolExecutor(max_workers=workers or self.DEFAULT_WORKERS,
+                                            thread_name_prefix="email-prefetch")
+
+        # (conversation ID, message ID) -> running load
+        self._in_flight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, conversation_id: str, emails: Iterable[Dict[str, Any]], load: BodyLoader) -> None:
+        """Load and render emails in the background unless they are cached or already loading."""
+        for email in emails:
+            key = (conversation_id, email['id'])
+            if self.session_cache.get_rendered(conversation_id, email['id']) is not None:
+                continue
+            with self._lock:
+                if key in self._in_flight:
+                    continue
+                future = self._executor.submit(self._load, conversation_id, email, load)
+                self._in_flight[key] = future
+            future.add_done_callback(lambda _, key=key: self._finished(key))
+
+    async def get(self, conversation_id: str, email: Dict[str, Any], load: BodyLoader) -> Optional[Tuple[str, str]]:
+        """
+        Return (body, rendered body) of an email: from the session cache, from
+        a running prefetch, or loaded now in a worker thread (and cached for
+        later turns). None if the body could not be loaded.
+        """
+        cached = self.session_cache.get_rendered(conversation_id, email['id'])
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            future = self._in_flight.get((conversation_id, email['id']))
+        if future is not None:
+            try:
+                # Shielded, so a timeout here leaves the prefetch running to fill the cache
+                loaded = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.WAIT_SECONDS)
+                if loaded is not None:
+                    return loaded
+            except asyncio.TimeoutError:
+                logger.warning(f"Prefetch of email {email['id']} is taking too long, loading it directly")
+            except Exception:
+                # Already logged by the prefetch
+                pass
+
+        # The prefetch failed or took too long; try once more in this turn
+        return await asyncio.to_thread(self._load, conversation_id, email, load)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def _load(self, conversation_id: str, email: Dict[str, Any], load: BodyLoader) -> Optional[Tuple[str, str]]:
+        try:
+            loaded = load(email)
+        except Exception as e:
+            logger.warning(f"Could not load email {email['id']}: {e}")
+            raise
+        if loaded is not None:
+            self.session_cache.put_rendered(conversation_id, email['id'], *loaded)
+        return loaded
+
+    def _finished(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+
+_email_prefetcher: Optional[EmailPrefetcher] = None
+_email_prefetcher_lock = threading.Lock()
+
+
+def get_email_prefetcher() -> EmailPrefetcher:
+    """Return the process-wide prefetcher."""
+    global _email_prefetcher
+    with _email_prefetcher_lock:
+        if _email_prefetcher is None:
+            _email_prefetcher = EmailPrefetcher()
+        return _email_prefetcher
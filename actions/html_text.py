@@ -0,0 +1,129 @@
+"""
+Incremental HTML-to-text conversion for email bodies.
+
+The document is fed to html.parser in chunks. Text inside non-content
+elements (style, script, title, ...) is dropped, block elements become line
+breaks, and parsing stops as soon as the requested character budget is
+filled, so a mail with hundreds of KB of inline CSS costs no more than the
+text that is actually shown.
+"""
+
+import re
+from html.parser import HTMLParser
+from typing import List, Optional
+
+# Elements whose content is never shown to the user. head is not one of them:
+# its end tag is optional, and mails that leave it out would lose their whole body
+SKIPPED_ELEMENTS = {'title', 'style', 'script', 'noscript', 'template', 'svg', 'object', 'iframe'}
+
+# Elements that start a new line
+LINE_BREAK_ELEMENTS = {'br', 'tr', 'li', 'dt', 'dd'}
+
+# Elements that are separated from their surroundings by a blank line
+PARAGRAPH_ELEMENTS = {
+    'p', 'div', 'section', 'article', 'header', 'footer', 'table', 'ul', 'ol', 'dl',
+    'blockquote', 'pre', 'hr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'
+}
+
+# Size of the slices the document is fed to the parser in
+FEED_CHUNK_SIZE = 8192
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class _BudgetReached(Exception):
+    """Stops parsing once enough text has been collected"""
+
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML document up to max_chars characters"""
+
+    def __init__(self, max_chars: Optional[int] = None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.length = 0
+        self._pieces: List[str] = []
+        self._skip_depth = 0
+        # Pending line breaks, emitted before the next text so trailing breaks are never written
+        self._pending_breaks = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            # Whatever the head left open ends here
+            self._skip_depth = 0
+        elif tag in SKIPPED_ELEMENTS:
+            self._skip_depth += 1
+        elif tag in PARAGRAPH_ELEMENTS:
+            self._request_breaks(2)
+        elif tag in LINE_BREAK_ELEMENTS:
+            self._request_breaks(1)
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing tags like <br/> never open a region
+        if tag in PARAGRAPH_ELEMENTS:
+            self._request_breaks(2)
+        elif tag in LINE_BREAK_ELEMENTS:
+            self._request_breaks(1)
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_ELEMENTS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in PARAGRAPH_ELEMENTS:
+            self._request_breaks(2)
+        elif tag in ('td', 'th'):
+            self._append(' ')
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+
+        text = _WHITESPACE.sub(' ', data)
+        if not text.strip():
+            # Keep a single separating space between inline elements
+            if self._pieces and not self._pending_breaks:
+                self._append(' ')
+            return
+
+        if self._pending_breaks and self.length:
+            self._append('\n' * self._pending_breaks)
+            text = text.lstrip()
+        self._pending_breaks = 0
+        self._append(text)
+
+    def _request_breaks(self, count: int) -> None:
+        self._pending_breaks = max(self._pending_breaks, count)
+
+    def _append(self, text: str) -> None:
+        if self.max_chars is not None and self.length + len(text) >= self.max_chars:
+            self._pieces.append(text[:self.max_chars - self.length])
+            self.length = self.max_chars
+            raise _BudgetReached()
+        self._pieces.append(text)
+        self.length += len(text)
+
+    def close(self):
+        # An unterminated comment, declaration or tag at the end of the document
+        # would be flushed as text; drop everything after where it starts
+        if self.rawdata.startswith('<'):
+            self.rawdata = ''
+        super().close()
+
+    def text(self) -> str:
+        lines = (line.strip() for line in ''.join(self._pieces).split('\n'))
+        return '\n'.join(lines).strip()
+
+
+def html_to_text(html_content: str, max_chars: Optional[int] = None) -> str:
+    """
+    Convert HTML to plain text with paragraph and line breaks preserved.
+    With max_chars, parsing stops once that many characters were produced.
+    """
+    extractor = _TextExtractor(max_chars)
+    try:
+        for start in range(0, len(html_content), FEED_CHUNK_SIZE):
+            extractor.feed(html_content[start:start + FEED_CHUNK_SIZE])
+        extractor.close()
+    except _BudgetReached:
+        pass
+
+    return extractor.text()
@@ -2,64 +2,213 @@
 Enhanced actions for email checking, reading, and navigation - FIXED VERSION.
 """
 
-from typing import Any, Text, Dict, List
+from typing import Any, Text, Dict, List, Optional, Tuple
 from rasa_sdk import Action, Tracker
 from rasa_sdk.events import SlotSet
 from rasa_sdk.executor import CollectingDispatcher
 import os
+import asyncio
 import logging
 import json
 import re
 
-from actions.improved_email_client import ImprovedEmailClient
+from actions.email_client_pool import get_email_client
+from actions.email_prefetcher import get_email_prefetcher
+from actions.inbox_sync import get_inbox_sync
+from actions.improved_email_client import resolve_token_path
+from actions.mail_index import get_mail_index
+from actions.session_cache import get_session_cache
+from actions.text_normalization import normalize_body, truncate_for_display
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+# Number of emails shown per listing page
+EMAIL_PAGE_SIZE = 10
+
+# Replies to the selection prompt that ask for the next listing page
+MORE_EMAILS_KEYWORDS = {"mehr", "weitere", "weiter", "mehr e-mails", "weitere e-mails", "more", "next page"}
+
+
+def _get_email_body(email: Dict[Text, Any]) -> Text:
+    """Return the email body, fetching it from Gmail if the listing only loaded metadata ("" if that fails)."""
+    if 'body' in email:
+        return email['body']
+    
+    email_client = get_email_client(
+        credentials_path=os.getenv("GMAIL_CREDENTIALS_PATH"),
+        token_path=os.getenv("GMAIL_TOKEN_PATH")
+    )
+    return email_client.get_email_body(email['id'])
+
+
+def render_email_body(body: Text) -> Text:
+    """Clean up an email body for display, keeping the first 1000 characters."""
+    cleaned = normalize_body(body)
+    return truncate_for_display(cleaned, 1000, "\n\n[Message truncated - full content available in Gmail]")
+
+
+def _load_and_render(email: Dict[Text, Any]) -> Optional[Tuple[Text, Text]]:
+    body = _get_email_body(email)
+    if not body:
+        # Not cached, so the next read asks Gmail again
+        return None
+    return body, render_email_body(body)
+
+
+async def load_email_body(tracker: Tracker, email: Dict[Text, Any]) -> Tuple[Text, Text]:
+    """
+    Return (body, rendered body) of a listed email, served from the session
+    cache when it was shown or prefetched before in this conversation. If the
+    body can't be loaded, the snippet stands in for it in this turn only.
+    """
+    loaded = await get_email_prefetcher().get(tracker.sender_id, email, _load_and_render)
+    if loaded is not None:
+        return loaded
+    snippet = email.get('snippet', '')
+    return snippet, render_email_body(snippet) if snippet else ""
+
+
+def prefetch_neighbours(tracker: Tracker, emails: List[Dict[Text, Any]], index: int) -> None:
+    """Load the emails before and after index in the background, for the next navigation turn."""
+    neighbours = [emails[i] for i in (index + 1, index - 1) if 0 <= i < len(emails)]
+    get_email_prefetcher().prefetch(tracker.sender_id, neighbours, _load_and_render)
+
+
+def format_email_list(emails: List[Dict[Text, Any]]) -> Text:
+    """Render emails as the numbered Von/Betreff/Erhalten list used by listings and search results."""
+    email_list = ""
+    for i, email in enumerate(emails, 1):
+        email_list += f"{i}. Von: {email['sender_name']} ({email['sender']})\n"
+        email_list += f"   Betreff: {email['subject']}\n"
+        email_list += f"   Erhalten: {email['date']}\n\n"
+    return email_list
+
+
+def remember_emails(tracker: Tracker, emails: List[Dict[Text, Any]]) -> Dict[Text, Any]:
+    """
+    Keep the records of listed emails in the conversation's session cache and
+    return the event that puts only their IDs into the emails slot.
+    """
+    get_session_cache().put(tracker.sender_id, emails)
+    return SlotSet("emails", [email['id'] for email in emails] or None)
+
+
+def listed_email_ids(tracker: Tracker) -> List[Text]:
+    """Message IDs in the emails slot, in listing order."""
+    value = tracker.get_slot("emails")
+    if isinstance(value, str):
+        # Conversations from before the slot held IDs carry the records as JSON
+        try:
+            emails = json.loads(value)
+        except ValueError:
+            return []
+        get_session_cache().put(tracker.sender_id, emails)
+        return [email['id'] for email in emails]
+    return list(value or [])
+
+
+def load_listed_emails(tracker: Tracker) -> List[Dict[Text, Any]]:
+    """
+    Return the records of the listed emails from the session cache. Records it
+    no longer holds are loaded through the message cache (or Gmail) again.
+    """
+    message_ids = listed_email_ids(tracker)
+    if not message_ids:
+        return []
+    
+    session_cache = get_session_cache()
+    records = session_cache.get(tracker.sender_id, message_ids)
+    missing = [msg_id for msg_id in message_ids if msg_id not in records]
+    if missing:
+        email_client = get_email_client(
+            credentials_path=os.getenv("GMAIL_CREDENTIALS_PATH"),
+            token_path=os.getenv("GMAIL_TOKEN_PATH")
+        )
+        loaded = email_client.get_emails(missing)
+        session_cache.put(tracker.sender_id, loaded)
+        records.update((email['id'], email) for email in loaded)
+    
+    return [records[msg_id] for msg_id in message_ids if msg_id in records]
+
+
+def _load_unread_page(cursor: Optional[Text]) -> Tuple[List[Dict[Text, Any]], Optional[Text]]:
+    """Return one listing page of unread emails after cursor, and the cursor of the next page (None at the end)."""
+    email_client = get_email_client(
+        credentials_path=os.getenv("GMAIL_CREDENTIALS_PATH"),
+        token_path=os.getenv("GMAIL_TOKEN_PATH")
+    )
+    
+    # Headers only (bodies are loaded when a mail is opened). The inbox
+    # mirror only asks Gmail for the changes since the last listing.
+    inbox_sync = get_inbox_sync(email_client)
+    unread_emails = inbox_sync.get_unread_emails(max_results=EMAIL_PAGE_SIZE, after=cursor)
+    if not unread_emails:
+        return [], None
+    next_cursor = inbox_sync.page_cursor(unread_emails[-1])
+    return unread_emails, next_cursor if inbox_sync.has_more(next_cursor) else None
+
+
+def _match_listed_email(value: Text, emails: List[Dict[Text, Any]]) -> Optional[int]:
+    """Position of the listed email whose sender or subject best matches value, via the local mail index."""
+    mail_index = get_mail_index(resolve_token_path(os.getenv("GMAIL_TOKEN_PATH")))
+    unindexed = [email for email in emails if email['id'] not in mail_index]
+    if unindexed:
+        mail_index.add_many(unindexed)
+    
+    email_ids = [email['id'] for email in emails]
+    matched_id = mail_index.best_match(value, email_ids)
+    return email_ids.index(matched_id) if matched_id is not None else None
+
+
 class ActionListEmails(Action):
     """Action to list all emails in a numbered format."""
     
     def name(self) -> Text:
         return "action_list_emails"
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
         tracker: Tracker,
         domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         """
         List all unread emails in a numbered format.
         """
         try:
-            # Initialize email client
-            credentials_path = os.getenv("GMAIL_CREDENTIALS_PATH")
-            token_path = os.getenv("GMAIL_TOKEN_PATH")
-            
-            email_client = ImprovedEmailClient(
-                credentials_path=credentials_path,
-                token_path=token_path
-            )
+            # "mehr" continues after the last mail of the previous listing instead of page one
+            cursor = tracker.get_slot("email_page_cursor") if tracker.get_slot("email_list_more") else None
             
-            # Get unread emails - increased max to 10
-            unread_emails = email_client.get_unread_emails(max_results=10)
+            # Gmail and the caches are blocking; keep them off the event loop
+            unread_emails, next_cursor = await asyncio.to_thread(_load_unread_page, cursor)
             if not unread_emails:
+                if cursor:
+                    dispatcher.utter_message(text="Es gibt keine weiteren ungelesenen E-Mails.")
+                    return [SlotSet("email_list_more", False), SlotSet("email_page_cursor", None)]
                 dispatcher.utter_message(text="Sie haben im Moment keine neuen E-Mails.")
-                return [SlotSet("emails", None), SlotSet("email_count", 0)]
-
-            # Store all emails in a slot as JSON
-            emails_json = json.dumps(unread_emails)
+                return [SlotSet("emails", None), SlotSet("email_count", 0), SlotSet("email_page_cursor", None)]
+            
             # Create a numbered list of emails
-            email_list = "Hier sind Ihre ungelesenen E-Mails:\n\n"
-            for i, email in enumerate(unread_emails, 1):
-                email_list += f"{i}. Von: {email['sender_name']} ({email['sender']})\n"
-                email_list += f"   Betreff: {email['subject']}\n"
-                email_list += f"   Erhalten: {email['date']}\n\n"
+            if cursor:
+                email_list = "Hier sind weitere ungelesene E-Mails:\n\n"
+            else:
+                email_list = "Hier sind Ihre ungelesenen E-Mails:\n\n"
+            email_list += format_email_list(unread_emails)
+            if next_cursor:
+                email_list += "Sagen Sie \"mehr\", um weitere E-Mails zu sehen."
             
             dispatcher.utter_message(text=email_list)
             
+            # Most conversations open the first mail next; load it while the user reads the list
+            remembered = remember_emails(tracker, unread_emails)
+            get_email_prefetcher().prefetch(tracker.sender_id, unread_emails[:1], _load_and_render)
+            
             # Return events to set slots with all emails
             return [
-                SlotSet("emails", emails_json),
+                remembered,
                 SlotSet("email_count", len(unread_emails)),
-                SlotSet("current_email_index", 0)
+                SlotSet("current_email_index", 0),
+                SlotSet("email_page_cursor", next_cursor),
+                SlotSet("email_list_more", False),
+                SlotSet("email_list_query", None)
             ]
             
         except Exception as e:
@@ -74,14 +223,13 @@ class ValidateSelectedEmail(Action):
     def name(self) -> str:
         return "validate_selected_email"
         
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: dict) -> List[dict]:
         """
         IMPROVED validation for selected_email values with better pattern matching.
         """
         value = tracker.get_slot("selected_email")
-        emails_json = tracker.get_slot("emails")
         
         if value is None:
             return []
@@ -89,15 +237,15 @@ class ValidateSelectedEmail(Action):
         logger.info(f"Validating selected_email: '{value}'")
         
         # Check if we have emails to match against
-        if not emails_json:
-            dispatcher.utter_message(text="Ich habe keine E-Mails geladen. Lass mich zuerst deinen Posteingang überprüfen.")
-            return [SlotSet("selected_email", None)]
-        
         try:
-            emails = json.loads(emails_json)
+            emails = await asyncio.to_thread(load_listed_emails, tracker)
             logger.info(f"Found {len(emails)} emails to match against")
-        except (json.JSONDecodeError, TypeError) as e:
-            logger.error(f"Error parsing emails JSON: {e}")
+        except Exception as e:
+            logger.error(f"Error loading listed emails: {e}")
+            return [SlotSet("selected_email", None)]
+        
+        if not emails:
+            dispatcher.utter_message(text="Ich habe keine E-Mails geladen. Lass mich zuerst deinen Posteingang überprüfen.")
             return [SlotSet("selected_email", None)]
         
         # Convert numeric words to numbers
@@ -111,6 +259,16 @@ class ValidateSelectedEmail(Action):
         
         value_lower = value.lower().strip()
         
+        # "mehr" asks for the next page of the listing
+        if value_lower in MORE_EMAILS_KEYWORDS:
+            if not tracker.get_slot("email_page_cursor"):
+                if tracker.get_slot("email_list_query"):
+                    dispatcher.utter_message(text="Es gibt keine weiteren Treffer zu Ihrer Suche.")
+                else:
+                    dispatcher.utter_message(text="Es gibt keine weiteren ungelesenen E-Mails.")
+                return [SlotSet("selected_email", None)]
+            return [SlotSet("selected_email", None), SlotSet("email_list_more", True)]
+        
         # Check for numeric word conversion
         for word, num in numeric_words.items():
             if word in value_lower:
@@ -138,19 +296,12 @@ class ValidateSelectedEmail(Action):
                 dispatcher.utter_message(text=f"I only have {len(emails)} emails. Please choose a number between 1 and {len(emails)}.")
                 return [SlotSet("selected_email", None)]
         
-        # Try to match by sender name or subject
-        for i, email in enumerate(emails, 1):
-            sender_name = email.get('sender_name', '').lower()
-            sender_email = email.get('sender', '').lower()
-            subject = email.get('subject', '').lower()
-            
-            # Check if any part of the value matches sender or subject
-            value_parts = value_lower.split()
-            for part in value_parts:
-                if len(part) > 2:  # Only check meaningful parts
-                    if (part in sender_name or part in sender_email or part in subject):
-                        logger.info(f"Matched email {i} by keyword '{part}'")
-                        return [SlotSet("selected_email", str(i))]
+        # Try to match by sender name or subject via the local mail index (no Gmail call)
+        position = await asyncio.to_thread(_match_listed_email, value, emails)
+        if position is not None:
+            i = position + 1
+            logger.info(f"Matched email {i} by sender or subject")
+            return [SlotSet("selected_email", str(i))]
         
         # If no match found, provide helpful message
         dispatcher.utter_message(text=f"Ich konnte keine E-Mail finden, die '{value}' entspricht. Bitte versuchen Sie:\n- Eine Zahl (1, 2, 3...)\n- Den Namen des Absenders\n- Einen Teil der Betreffzeile")
@@ -162,7 +313,7 @@ class ActionReadSelectedEmail(Action):
     def name(self) -> Text:
         return "action_read_selected_email"
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         """
@@ -171,17 +322,14 @@ class ActionReadSelectedEmail(Action):
         try:
             # Get the selected email index
             selected = tracker.get_slot("selected_email")
-            emails_json = tracker.get_slot("emails")
-            if not emails_json:
+            emails = await asyncio.to_thread(load_listed_emails, tracker)
+            if not emails:
                 dispatcher.utter_message(text="Ich habe keine E-Mails zu zeigen. Lass mich zuerst deinen Posteingang überprüfen.")
                 return []
             if not selected:
                 dispatcher.utter_message(text="Bitte sagen Sie mir, welche E-Mail Sie lesen möchten.")
                 return []
             
-            # Parse emails from JSON
-            emails = json.loads(emails_json)
-            
             # Get the email index (convert to 0-based)
             if selected.isdigit():
                 email_index = int(selected) - 1
@@ -209,11 +357,9 @@ class ActionReadSelectedEmail(Action):
             # Email content
             email_text += f"**NACHRICHT:**\n"
 
-            # Get email body and clean it up
-            body = email.get('body', email.get('snippet', 'Kein Inhalt verfügbar'))
+            # Get email body (loaded on demand or prefetched) and clean it up
+            body, cleaned_body = await load_email_body(tracker, email)
             if body:
-                # Clean up common email formatting issues
-                cleaned_body = self._clean_email_body(body)
                 email_text += f"{cleaned_body}\n"
             else:
                 email_text += "Kein Nachrichteninhalt verfügbar.\n"
@@ -230,13 +376,14 @@ class ActionReadSelectedEmail(Action):
 
             # Display the formatted email
             dispatcher.utter_message(text=email_text)
+            prefetch_neighbours(tracker, emails, email_index)
             
             # Set current email slots for further actions
             return [
                 SlotSet("current_email_id", email["id"]),
                 SlotSet("current_email_sender", f"{email['sender_name']} ({email['sender']})"),
                 SlotSet("current_email_subject", email["subject"]),
-                SlotSet("current_email_content", email.get('body', email.get('snippet', ''))),
+                SlotSet("current_email_content", body),
                 SlotSet("current_email_index", email_index)
             ]
             
@@ -246,33 +393,13 @@ class ActionReadSelectedEmail(Action):
                 text="Ich bin auf einen Fehler gestoßen, während ich versuchte, Ihre E-Mail zu lesen. Bitte versuchen Sie es erneut oder wählen Sie eine andere E-Mail aus."
             )
             return []
-    
-    def _clean_email_body(self, body: str) -> str:
-        """Clean up email body for better display."""
-        if not body:
-            return "Kein Inhalt verfügbar"
-        
-        # Remove excessive line breaks
-        cleaned = re.sub(r'\n\s*\n\s*\n', '\n\n', body)
-        
-        # Remove unicode characters that don't display well
-        cleaned = re.sub(r'[\u034f\u200c]+', '', cleaned)
-        
-        # Clean up excessive whitespace
-        cleaned = re.sub(r'[ \t]+', ' ', cleaned)
-        
-        # Limit length for readability (keep first 1000 characters)
-        if len(cleaned) > 1000:
-            cleaned = cleaned[:1000] + "\n\n[Message truncated - full content available in Gmail]"
-        
-        return cleaned.strip()
 
 class ActionNavigateEmails(Action):
     
     def name(self) -> Text:
         return "action_navigate_emails"
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         """
@@ -282,14 +409,11 @@ class ActionNavigateEmails(Action):
             # Get navigation direction
             direction = tracker.get_slot("navigation_direction")
             current_index = tracker.get_slot("current_email_index")
-            emails_json = tracker.get_slot("emails")
-            if not emails_json or current_index is None:
+            emails = await asyncio.to_thread(load_listed_emails, tracker) if current_index is not None else []
+            if not emails:
                 dispatcher.utter_message(text="Ich habe keine E-Mail-Details, um zu navigieren. Lass mich zuerst deinen Posteingang überprüfen.")
                 return []
             
-            # Parse emails from JSON
-            emails = json.loads(emails_json)
-            
             # Calculate new index
             new_index = current_index
             if direction == "next" and current_index < len(emails) - 1:
@@ -320,9 +444,8 @@ class ActionNavigateEmails(Action):
             
             email_text += f"**Nachricht:**\n"
             
-            body = email.get('body', email.get('snippet', 'Kein Inhalt verfügbar'))
+            body, cleaned_body = await load_email_body(tracker, email)
             if body:
-                cleaned_body = self._clean_email_body(body)
                 email_text += f"{cleaned_body}\n"
             else:
                 email_text += "Kein Nachrichteninhalt verfügbar.\n"
@@ -342,13 +465,14 @@ class ActionNavigateEmails(Action):
             email_text += "• Zurück zum Posteingang\n"
 
             dispatcher.utter_message(text=email_text)
+            prefetch_neighbours(tracker, emails, new_index)
             
             # Set current email slots
             return [
                 SlotSet("current_email_id", email["id"]),
                 SlotSet("current_email_sender", f"{email['sender_name']} ({email['sender']})"),
                 SlotSet("current_email_subject", email["subject"]),
-                SlotSet("current_email_content", email.get('body', email.get('snippet', ''))),
+                SlotSet("current_email_content", body),
                 SlotSet("current_email_index", new_index)
             ]
             
@@ -358,17 +482,3 @@ class ActionNavigateEmails(Action):
                 text="Ich bin auf einen Fehler gestoßen, während ich versuchte, Ihre E-Mails zu navigieren. Bitte versuchen Sie es erneut oder überprüfen Sie Ihren Posteingang."
             )
             return []
-    
-    def _clean_email_body(self, body: str) -> str:
-        """Clean up email body for better display - same as ActionReadSelectedEmail."""
-        if not body:
-            return "No content available"
-        
-        cleaned = re.sub(r'\n\s*\n\s*\n', '\n\n', body)
-        cleaned = re.sub(r'[\u034f\u200c]+', '', cleaned)
-        cleaned = re.sub(r'[ \t]+', ' ', cleaned)
-        
-        if len(cleaned) > 1000:
-            cleaned = cleaned[:1000] + "\n\n[Message truncated - full content available in Gmail]"
-        
-        return cleaned.strip()
\ No newline at end of file
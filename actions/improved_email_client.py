@@ -4,19 +4,46 @@ Enhanced Gmail API client wrapper for better email content extraction.
 
 import os
 import base64
-import json
 import re
-import html
-from typing import List, Dict, Any, Optional
+import time
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.message import EmailMessage
 from datetime import datetime
 
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
+from google_auth_httplib2 import AuthorizedHttp
+
+from actions.credential_manager import get_credential_manager
+from actions.label_cache import get_label_cache
+from actions.rate_limiter import get_rate_limiter, quota_units
+from actions.retry_policy import get_retry_policy, classify_http_error
+from actions.message_cache import get_message_cache
+from actions.mail_index import get_mail_index
+from actions.mime_parser import parse_raw, parse_raw_headers, get_header, get_text_body
+from actions.html_text import html_to_text
+from actions.text_normalization import normalize_body
+
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def resolve_credentials_path(credentials_path: Optional[str] = None) -> str:
+    """Resolve the OAuth client secrets path from argument, environment or default location"""
+    return credentials_path or os.getenv("GMAIL_CREDENTIALS_PATH") or os.path.join(
+        _PROJECT_ROOT, "credentials", "gmail_credentials.json"
+    )
+
+
+def resolve_token_path(token_path: Optional[str] = None) -> str:
+    """Resolve the OAuth token path from argument, environment or default location"""
+    return os.path.abspath(token_path or os.getenv("GMAIL_TOKEN_PATH") or os.path.join(
+        _PROJECT_ROOT, "credentials", "gmail_token.json"
+    ))
 
 
 class ImprovedEmailClient:
@@ -30,73 +57,90 @@ class ImprovedEmailClient:
         'https://www.googleapis.com/auth/gmail.labels'
     ]
     
-    def __init__(self, credentials_path: Optional[str] = None, token_path: Optional[str] = None):
-        """Initialize with same parameters as original EmailClient"""
-        self.credentials_path = credentials_path or os.getenv("GMAIL_CREDENTIALS_PATH") or os.path.join(
-            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-            "credentials", 
-            "gmail_credentials.json"
-        )
-        
-        self.token_path = token_path or os.getenv("GMAIL_TOKEN_PATH") or os.path.join(
-            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
-            "credentials",
-            "gmail_token.json"
-        )
+    # Headers needed to render an inbox listing
+    METADATA_HEADERS = ['From', 'Subject', 'Date']
+    
+    # Gmail accepts up to 100 calls per batch request but recommends at most 50
+    MAX_BATCH_SIZE = 100
+    DEFAULT_BATCH_SIZE = 50
+    
+    # users.messages.batchModify accepts at most 1000 IDs per call
+    MAX_BATCH_MODIFY_IDS = 1000
+    
+    # Message format used when bodies are fetched: 'raw' is parsed once by the
+    # stdlib email parser, 'full' walks the JSON payload tree
+    BODY_FORMATS = ('raw', 'full')
+    DEFAULT_BODY_FORMAT = 'raw'
+    
+    # HTML bodies are converted only up to this many characters of text
+    DEFAULT_HTML_TEXT_MAX_CHARS = 10000
+    
+    # Limits for walking the MIME part tree: nesting depth, number of parts
+    # looked at, and the size of a single text part that is still decoded
+    MAX_MIME_DEPTH = 10
+    MAX_MIME_PARTS = 200
+    DEFAULT_MAX_PART_BYTES = 1024 * 1024
+    
+    def __init__(self, credentials_path: Optional[str] = None, token_path: Optional[str] = None,
+                 batch_size: Optional[int] = None):
+        """Initialize with same parameters as original EmailClient, plus the batch size for message fetches"""
+        self.credentials_path = resolve_credentials_path(credentials_path)
+        self.token_path = resolve_token_path(token_path)
         
         os.makedirs(os.path.dirname(self.token_path), exist_ok=True)
         
         self.service = None
+        self.credentials = None
         self.authorized = False
         self.user_id = 'me'
         
+        batch_size = batch_size or int(os.getenv("GMAIL_BATCH_SIZE", self.DEFAULT_BATCH_SIZE))
+        self.batch_size = max(1, min(batch_size, self.MAX_BATCH_SIZE))
+        
+        body_format = os.getenv("GMAIL_BODY_FORMAT", self.DEFAULT_BODY_FORMAT).lower()
+        self.body_format = body_format if body_format in self.BODY_FORMATS else self.DEFAULT_BODY_FORMAT
+        self.html_text_max_chars = int(os.getenv("GMAIL_HTML_TEXT_MAX_CHARS", self.DEFAULT_HTML_TEXT_MAX_CHARS))
+        self.max_part_bytes = int(os.getenv("GMAIL_MAX_PART_BYTES", self.DEFAULT_MAX_PART_BYTES))
+        
+        # Quota token bucket shared by all clients of this account
+        self.rate_limiter = get_rate_limiter(self.token_path)
+        
+        # Backoff, deadline, hedging and retry metrics shared by all clients of this account
+        self.retry_policy = get_retry_policy(self.token_path)
+        
+        # Label list shared by all clients of this account
+        self.label_cache = get_label_cache(self.token_path)
+        
+        # Parsed messages by ID, persisted next to the token file
+        self.message_cache = get_message_cache(self.token_path)
+        
+        # Term index over the cached mail, built in the background and updated as mail is cached
+        self.mail_index = get_mail_index(self.token_path, self.message_cache)
+        
+        # Guards credential refresh and reconnects when the client is shared between threads
+        self._lock = threading.RLock()
+        
+        # Credentials kept valid in the background, shared by all clients of this account
+        self.credential_manager = get_credential_manager(self.token_path, self.SCOPES, self.credentials_path)
+        
+        # Serializes HTTP calls: the service's connection is not thread-safe and
+        # background prefetches share it with the caller
+        self._http_lock = threading.Lock()
+        
         # Connect to Gmail API
         self.connect()
     
     def connect(self) -> bool:
         """Connect to Gmail API using OAuth 2.0."""
-        creds = None
-        
-        # Check if token file exists
-        if os.path.exists(self.token_path):
-            try:
-                creds = Credentials.from_authorized_user_info(
-                    json.loads(open(self.token_path).read()),
-                    self.SCOPES
-                )
-            except Exception as e:
-                print(f"Error loading token: {e}")
-        
-        # If credentials don't exist or are invalid, go through the OAuth flow
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                try:
-                    creds.refresh(Request())
-                except Exception as e:
-                    print(f"Error refreshing token: {e}")
-                    creds = None
-            
-            # If still no valid credentials, go through OAuth flow
-            if not creds:
-                if not self.credentials_path or not os.path.exists(self.credentials_path):
-                    print("Credentials file not found")
-                    return False
-                
-                try:
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        self.credentials_path, self.SCOPES)
-                    creds = flow.run_local_server(port=0)
-                except Exception as e:
-                    print(f"Error during OAuth flow: {e}")
-                    return False
-                
-                # Save the credentials for future use
-                with open(self.token_path, 'w') as token:
-                    token.write(creds.to_json())
+        # Loading, refreshing and saving the token is done by the account's credential manager
+        creds = self.credential_manager.get_credentials()
+        if creds is None:
+            return False
         
         try:
             # Build the Gmail service
             self.service = build('gmail', 'v1', credentials=creds)
+            self.credentials = creds
             self.authorized = True
             print("Successfully connected to Gmail API")
             return True
@@ -104,111 +148,347 @@ class ImprovedEmailClient:
             print(f"Failed to build Gmail service: {e}")
             return False
     
-    @staticmethod
-    def rate_limit(max_per_second):
-        """Rate limiting decorator to prevent API throttling."""
-        from functools import wraps
-        import time
-        
-        min_interval = 1.0 / max_per_second
-        last_called = [0.0]
-        
-        def decorator(func):
-            @wraps(func)
-            def wrapper(*args, **kwargs):
-                elapsed = time.time() - last_called[0]
-                left_to_wait = min_interval - elapsed
-                
-                if left_to_wait > 0:
-                    time.sleep(left_to_wait)
-                    
-                ret = func(*args, **kwargs)
-                last_called[0] = time.time()
-                return ret
-            return wrapper
-        return decorator
+    def ensure_connected(self) -> bool:
+        """
+        Keep a long-lived client usable. The credential manager refreshes the
+        token in place in the background (the built service holds a reference
+        to it), so the service is only rebuilt when there is no working
+        connection or the credentials had to be replaced.
+        """
+        with self._lock:
+            if self.authorized and self.service and self.credentials is not None and self.credentials.valid:
+                return True
+            
+            creds = self.credential_manager.get_credentials()
+            if creds is not None and creds is self.credentials and self.service:
+                self.authorized = True
+                return True
+            
+            self.authorized = False
+            return self.connect()
+    
+    def _execute(self, request):
+        """
+        Execute an API request under the account's retry policy. Every attempt
+        takes its quota units from the token bucket; hedged reads go over their
+        own connection so they don't wait for the shared one.
+        """
+        method_id = getattr(request, 'methodId', None)
+        
+        def send():
+            self.rate_limiter.acquire(quota_units(method_id))
+            with self._http_lock:
+                return request.execute()
+        
+        def hedge_send():
+            self.rate_limiter.acquire(quota_units(method_id))
+            return request.execute(http=self.new_http())
+        
+        return self.retry_policy.run(send, classify_http_error, method_id, hedge_send=hedge_send)
 
-    @rate_limit(2)  # 2 calls per second max
-    def get_unread_emails(self, max_results: int = 10) -> List[Dict[str, Any]]:
-        """Enhanced version that retrieves emails with better content extraction"""
+    def new_http(self) -> AuthorizedHttp:
+        """A separate authorized connection for work that runs beside the shared one."""
+        return AuthorizedHttp(self.credentials, http=build_http())
+    
+    def get_unread_emails(self, max_results: int = 10, include_body: bool = True) -> List[Dict[str, Any]]:
+        """
+        Enhanced version that retrieves emails with better content extraction.
+        With include_body=False only the From/Subject/Date headers are fetched
+        (format='metadata'); bodies can then be loaded per mail via get_email_body.
+        """
         if not self.authorized or not self.service:
             print("Not authorized to access Gmail")
             return []
         
         try:
             # Query for unread messages in inbox
-            results = self.service.users().messages().list(
-                userId=self.user_id,
-                labelIds=['INBOX', 'UNREAD'],
-                maxResults=max_results
-            ).execute()
-            
-            messages = results.get('messages', [])
+            message_ids, _ = self.list_unread_page(page_size=max_results)
             
-            if not messages:
+            if not message_ids:
                 return []
             
-            emails = []
-            
-            for message in messages:
-                msg_id = message['id']
-                
-                # Get the full message details with format='full' for complete content
-                msg = self.service.users().messages().get(
-                    userId=self.user_id, 
-                    id=msg_id,
-                    format='full'
-                ).execute()
-                
-                headers = msg['payload']['headers']
-                
-                # Extract email details from headers
-                subject = ""
-                sender = ""
-                sender_name = ""
-                date_str = ""
-                
-                for header in headers:
-                    if header['name'] == 'Subject':
-                        subject = header['value']
-                    elif header['name'] == 'From':
-                        sender_full = header['value']
-                        # Extract name and email address with better parsing
-                        sender_name, sender = self._parse_sender(sender_full)
-                    elif header['name'] == 'Date':
-                        date_str = header['value']
-                
-                # Get the message body with enhanced extraction
-                body = self._get_message_body_enhanced(msg)
-                
-                # Parse date into friendly format
-                try:
-                    date_obj = datetime.strptime(date_str.split('(')[0].strip(), "%a, %d %b %Y %H:%M:%S %z")
-                    friendly_date = date_obj.strftime("%b %d, %Y at %I:%M %p")
-                except Exception:
-                    friendly_date = "Recently"
-                
-                # Create email object with enhanced fields
-                email = {
-                    "id": msg_id,
-                    "sender": sender,
-                    "sender_name": sender_name,
-                    "subject": subject,
-                    "snippet": msg.get('snippet', ''),
-                    "body": body,
-                    "date": friendly_date,
-                    "labels": msg.get('labelIds', []),
-                    "read": 'UNREAD' not in msg.get('labelIds', [])
-                }
-                
-                emails.append(email)
-            
-            return emails
+            # Serve cached messages locally and batch-fetch the rest
+            return self.get_emails(
+                message_ids,
+                include_body=include_body,
+                label_ids=['INBOX', 'UNREAD']
+            )
         
         except HttpError as error:
             print(f"An error occurred: {error}")
             return []
     
+    def list_unread_page(self, page_size: int = 10, page_token: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        """Return the IDs of one page of unread inbox messages and the token of the next page."""
+        results = self._execute(self.service.users().messages().list(
+            userId=self.user_id,
+            labelIds=['INBOX', 'UNREAD'],
+            maxResults=page_size,
+            pageToken=page_token
+        ))
+        
+        message_ids = [message['id'] for message in results.get('messages', [])]
+        return message_ids, results.get('nextPageToken')
+    
+    def list_message_ids(self, query: Optional[str] = None, label_ids: Optional[List[str]] = None,
+                         max_results: int = 100) -> List[str]:
+        """Return up to max_results message IDs matching a Gmail search query and/or labels, newest first."""
+        if not self.authorized or not self.service:
+            print("Not authorized to access Gmail")
+            return []
+        
+        message_ids = []
+        page_token = None
+        try:
+            while len(message_ids) < max_results:
+                results = self._execute(self.service.users().messages().list(
+                    userId=self.user_id,
+                    q=query,
+                    labelIds=label_ids,
+                    maxResults=min(500, max_results - len(message_ids)),
+                    pageToken=page_token
+                ))
+                message_ids.extend(message['id'] for message in results.get('messages', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+        
+        except HttpError as error:
+            print(f"An error occurred: {error}")
+        
+        return message_ids
+    
+    def search_emails(self, query: str, max_results: int = 10, include_body: bool = False) -> List[Dict[str, Any]]:
+        """
+        Search the whole mailbox with Gmail query syntax (from:, subject:, newer_than:,
+        has:attachment, ...), newest first. Gmail does the filtering; only the
+        matches are fetched, by default with headers only.
+        """
+        message_ids = self.list_message_ids(query=query, max_results=max_results)
+        if not message_ids:
+            return []
+        return self.get_emails(message_ids, include_body=include_body)
+    
+    def watch_inbox(self, topic_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Ask Gmail to publish inbox changes to a Cloud Pub/Sub topic.
+        The watch expires after 7 days and has to be renewed before that.
+        """
+        if not self.authorized or not self.service:
+            print("Not authorized to access Gmail")
+            return None
+        
+        try:
+            return self._execute(self.service.users().watch(
+                userId=self.user_id,
+                body={'topicName': topic_name, 'labelIds': ['INBOX'], 'labelFilterBehavior': 'include'}
+            ))
+        
+        except HttpError as error:
+            print(f"An error occurred: {error}")
+            return None
+    
+    def get_emails(self, message_ids: List[str], include_body: bool = False,
+                   label_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Return parsed emails for message_ids in the given order, taken from the
+        message cache where possible and batch-fetched from Gmail otherwise.
+        label_ids are labels the caller knows the messages carry (e.g. from the
+        list query); they are merged into the possibly older cached label data.
+        Messages that could not be fetched are left out.
+        """
+        emails = self.message_cache.get_many(message_ids, require_body=include_body)
+        
+        missing = [msg_id for msg_id in message_ids if msg_id not in emails]
+        if missing:
+            if include_body:
+                fetched = self._batch_get_messages(missing, format=self.body_format)
+            else:
+                fetched = self._batch_get_messages(
+                    missing,
+                    format='metadata',
+                    metadataHeaders=self.METADATA_HEADERS
+                )
+            
+            parsed = [
+                self._parse_message(fetched[msg_id], include_body=include_body)
+                for msg_id in missing if msg_id in fetched
+            ]
+            self.message_cache.put_many(parsed)
+            emails.update((email['id'], email) for email in parsed)
+        
+        for email in emails.values():
+            for label in label_ids or []:
+                if label not in email['labels']:
+                    email['labels'].append(label)
+            email['read'] = 'UNREAD' not in email['labels']
+        
+        return [emails[msg_id] for msg_id in message_ids if msg_id in emails]
+    
+    def get_email_body(self, email_id: str) -> str:
+        """Fetch and extract the body of a single email, e.g. when it is opened after a metadata-only listing"""
+        cached_body = self.message_cache.get_body(email_id)
+        if cached_body is not None:
+            return cached_body
+        
+        if not self.authorized or not self.service:
+            print("Not authorized to access Gmail")
+            return ""
+        
+        try:
+            msg = self._execute(self.service.users().messages().get(
+                userId=self.user_id,
+                id=email_id,
+                format=self.body_format
+            ))
+            
+            email = self._parse_message(msg)
+            self.message_cache.put(email)
+            return email['body']
+        
+        except HttpError as error:
+            print(f"An error occurred: {error}")
+            return ""
+    
+    def _batch_get_messages(self, message_ids: List[str], http=None, **get_kwargs) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch several messages via the Gmail batch endpoint, batch_size calls per HTTP request.
+        Calls inside a batch that fail with a retryable error are sent again in a new batch.
+        With http (e.g. from new_http()), the batches go over that connection instead of
+        the shared one, so several threads can fetch in parallel.
+        Returns a dict of message id -> message resource; ids whose call failed are left out.
+        """
+        fetched = {}
+        failed = {}
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                failed[request_id] = exception
+                return
+            fetched[request_id] = response
+        
+        def send_batch(chunk):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for msg_id in chunk:
+                batch.add(
+                    self.service.users().messages().get(userId=self.user_id, id=msg_id, **get_kwargs),
+                    request_id=msg_id
+                )
+            # Quota is charged per call inside the batch
+            self.rate_limiter.acquire(quota_units('messages.get') * len(chunk))
+            if http is not None:
+                batch.execute(http=http)
+                return
+            with self._http_lock:
+                batch.execute()
+        
+        pending = list(dict.fromkeys(message_ids))
+        started = time.monotonic()
+        attempt = 0
+        while pending:
+            failed.clear()
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                self.retry_policy.run(lambda: send_batch(chunk), classify_http_error, 'messages.get')
+            
+            if not failed:
+                break
+            
+            # Retry the failed calls together, waiting for the longest Retry-After among them
+            failures = {msg_id: classify_http_error(error) for msg_id, error in failed.items()}
+            retryable = [msg_id for msg_id, failure in failures.items()
+                         if failure is not None and self.retry_policy.should_retry(failure, 'messages.get')]
+            delay = None
+            if retryable:
+                worst = max((failures[msg_id] for msg_id in retryable), key=lambda failure: failure.retry_after or 0)
+                delay = self.retry_policy.retry_delay(worst, 'messages.get', attempt, started)
+            
+            if delay is None:
+                retryable = []
+            for msg_id, error in failed.items():
+                if msg_id not in retryable:
+                    print(f"Error fetching message {msg_id}: {error}")
+            
+            pending = retryable
+            if pending:
+                time.sleep(delay)
+                attempt += 1
+        
+        return fetched
+    
+    def _parse_message(self, msg: Dict[str, Any], include_body: bool = True) -> Dict[str, Any]:
+        """
+        Turn a Gmail message resource into the email dict used by the actions.
+        Without include_body the "body" key is left out so callers know to load it lazily.
+        """
+        # Extract email details from headers
+        subject = ""
+        sender = ""
+        sender_name = ""
+        date_str = ""
+        
+        # format='raw' carries the RFC 822 source instead of a payload tree
+        mime_message = None
+        header_message = None
+        if 'raw' in msg:
+            try:
+                mime_message = parse_raw(msg['raw'])
+                header_message = mime_message
+            except Exception as e:
+                # Too deeply nested or broken MIME: keep the headers, show the snippet as body
+                print(f"Error parsing message {msg.get('id')}: {e}")
+                try:
+                    header_message = parse_raw_headers(msg['raw'])
+                except Exception as e:
+                    print(f"Error parsing headers of message {msg.get('id')}: {e}")
+        
+        if header_message is not None:
+            subject = get_header(header_message, 'Subject')
+            sender_name, sender = self._parse_sender(get_header(header_message, 'From'))
+            date_str = get_header(header_message, 'Date')
+        else:
+            for header in msg.get('payload', {}).get('headers', []):
+                if header['name'] == 'Subject':
+                    subject = header['value']
+                elif header['name'] == 'From':
+                    sender_full = header['value']
+                    # Extract name and email address with better parsing
+                    sender_name, sender = self._parse_sender(sender_full)
+                elif header['name'] == 'Date':
+                    date_str = header['value']
+        
+        # Parse date into friendly format
+        try:
+            date_obj = datetime.strptime(date_str.split('(')[0].strip(), "%a, %d %b %Y %H:%M:%S %z")
+            friendly_date = date_obj.strftime("%b %d, %Y at %I:%M %p")
+        except Exception:
+            friendly_date = "Recently"
+        
+        # Create email object with enhanced fields
+        email = {
+            "id": msg['id'],
+            "sender": sender,
+            "sender_name": sender_name,
+            "subject": subject,
+            "snippet": msg.get('snippet', ''),
+            "date": friendly_date,
+            # Milliseconds since the epoch at which Gmail received the message; orders mail by date
+            "internal_date": int(msg['internalDate']) if 'internalDate' in msg else None,
+            "labels": msg.get('labelIds', []),
+            "read": 'UNREAD' not in msg.get('labelIds', [])
+        }
+        
+        # Get the message body with enhanced extraction
+        if include_body:
+            if mime_message is not None:
+                email["body"] = self._get_raw_message_body(msg, mime_message)
+            elif 'raw' in msg:
+                email["body"] = msg.get('snippet', '')
+            else:
+                email["body"] = self._get_message_body_enhanced(msg)
+        
+        return email
+    
     def _parse_sender(self, sender_full: str) -> tuple:
         """Enhanced sender parsing to handle various formats"""
         if not sender_full:
@@ -233,6 +513,11 @@ class ImprovedEmailClient:
     
     def _get_message_body_enhanced(self, message: Dict[str, Any]) -> str:
         """Enhanced message body extraction with better handling of different formats"""
+        # Bodies never change, so a cached extraction can be reused as is
+        cached_body = self.message_cache.get_body(message['id']) if 'id' in message else None
+        if cached_body is not None:
+            return cached_body
+        
         body = ""
         
         try:
@@ -259,79 +544,109 @@ class ImprovedEmailClient:
             
         except Exception as e:
             print(f"Error extracting message body: {e}")
-            body = message.get('snippet', 'Error extracting message content')
+            return message.get('snippet', 'Error extracting message content')
+        
+        if 'id' in message:
+            self.message_cache.put_body(message['id'], body)
+        
+        return body
+    
+    def _get_raw_message_body(self, message: Dict[str, Any], mime_message: EmailMessage) -> str:
+        """Body extraction for format='raw': one charset-aware decode of the preferred text part"""
+        cached_body = self.message_cache.get_body(message['id'])
+        if cached_body is not None:
+            return cached_body
+        
+        try:
+            body, is_html = get_text_body(mime_message, max_part_bytes=self.max_part_bytes,
+                                          max_depth=self.MAX_MIME_DEPTH, max_parts=self.MAX_MIME_PARTS)
+            if is_html:
+                body = self._html_to_text(body)
+            
+            if not body:
+                body = message.get('snippet', '')
+            
+            # Transfer encodings are already decoded, so there are no quoted-printable leftovers to strip
+            body = self._clean_body(body, decoded=True)
+        
+        except Exception as e:
+            print(f"Error extracting message body: {e}")
+            return message.get('snippet', 'Error extracting message content')
         
+        self.message_cache.put_body(message['id'], body)
         return body
     
     def _extract_from_parts(self, parts: List[Dict[str, Any]]) -> str:
-        """Recursively extract text from message parts"""
-        body = ""
+        """
+        Walk the part tree iteratively in document order and return the best text
+        alternative: the first text/plain part, otherwise the first text/html part.
+        Only the chosen part is decoded. Parts above max_part_bytes, attachments and
+        anything nested deeper than MAX_MIME_DEPTH are skipped.
+        """
+        html_data = None
+        visited = 0
         
-        for part in parts:
+        stack = [(part, 1) for part in reversed(parts)]
+        while stack and visited < self.MAX_MIME_PARTS:
+            part, depth = stack.pop()
+            visited += 1
+            
+            # Descend into multipart containers up to the depth limit
+            if 'parts' in part:
+                if depth < self.MAX_MIME_DEPTH:
+                    stack.extend((child, depth + 1) for child in reversed(part['parts']))
+                continue
+            
             mime_type = part.get('mimeType', '')
+            part_body = part.get('body', {})
+            if mime_type not in ('text/plain', 'text/html') or 'data' not in part_body or part.get('filename'):
+                continue
+            if part_body.get('size', 0) > self.max_part_bytes:
+                continue
             
-            # Prefer plain text content
+            # Prefer plain text content and stop at the first one
             if mime_type == 'text/plain':
-                if 'body' in part and 'data' in part['body']:
-                    try:
-                        decoded = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                        body = decoded
-                        break  # Found plain text, use it
-                    except Exception as e:
-                        print(f"Error decoding plain text part: {e}")
-            
-            # Handle HTML content if no plain text found
-            elif mime_type == 'text/html' and not body:
-                if 'body' in part and 'data' in part['body']:
-                    try:
-                        decoded = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                        body = self._html_to_text(decoded)
-                    except Exception as e:
-                        print(f"Error decoding HTML part: {e}")
-            
-            # Handle nested parts recursively
-            elif 'parts' in part:
-                nested_body = self._extract_from_parts(part['parts'])
-                if nested_body and not body:
-                    body = nested_body
+                text = self._decode_part_data(part_body['data'])
+                if text:
+                    return text
+            elif html_data is None:
+                html_data = part_body['data']
         
-        return body
+        # Handle HTML content if no plain text found
+        if html_data is not None:
+            html_content = self._decode_part_data(html_data)
+            if html_content:
+                return self._html_to_text(html_content)
+        
+        return ""
+    
+    def _decode_part_data(self, data: str) -> str:
+        """Decode the base64url data of a payload part"""
+        try:
+            return base64.urlsafe_b64decode(data).decode('utf-8')
+        except Exception as e:
+            print(f"Error decoding message part: {e}")
+            return ""
     
     def _html_to_text(self, html_content: str) -> str:
-        """Convert HTML content to plain text"""
+        """Convert HTML content to plain text, stopping once html_text_max_chars characters are collected"""
         try:
-            # Remove HTML tags using regex (basic approach)
-            text = re.sub(r'<[^>]+>', '', html_content)
-            # Decode HTML entities
-            text = html.unescape(text)
-            # Clean up whitespace
-            text = re.sub(r'\s+', ' ', text)
-            return text.strip()
+            return html_to_text(html_content, max_chars=self.html_text_max_chars)
         except Exception as e:
             print(f"Error converting HTML to text: {e}")
             return html_content
     
-    def _clean_body(self, body: str) -> str:
-        """Clean up email body content"""
+    def _clean_body(self, body: str, decoded: bool = False) -> str:
+        """Clean up email body content; decoded=True for bodies whose transfer encoding was properly decoded"""
         if not body:
             return ""
         
-        # Remove excessive whitespace and line breaks
-        cleaned = re.sub(r'\n\s*\n\s*\n+', '\n\n', body)
-        
-        # Remove unicode characters that don't display well
-        cleaned = re.sub(r'[\u034f\u200c\u200b\u200d\u200e\u200f]+', '', cleaned)
-        
-        # Clean up excessive spaces
-        cleaned = re.sub(r'[ \t]+', ' ', cleaned)
-        
         # Remove common email artifacts
-        cleaned = re.sub(r'=\d{2}', '', cleaned)  # Remove quoted-printable artifacts
+        if not decoded:
+            body = re.sub(r'=\d{2}', '', body)  # Remove quoted-printable artifacts
         
-        # Normalize line endings
-        cleaned = cleaned.replace('\r\n', '\n').replace('\r', '\n')
-        
-        return cleaned.strip()
+        # Line endings, invisible characters, spaces and blank lines in one linear pass
+        return normalize_body(body)
     
     def get_all_labels(self) -> List[Dict[str, Any]]:
         """Get all available labels in the user's Gmail account."""
@@ -340,8 +655,7 @@ class ImprovedEmailClient:
             return []
         
         try:
-            results = self.service.users().labels().list(userId=self.user_id).execute()
-            labels = results.get('labels', [])
+            labels = self.label_cache.get_labels(self._fetch_labels)
             
             formatted_labels = []
             for label in labels:
@@ -378,10 +692,10 @@ class ImprovedEmailClient:
             
             raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
             
-            self.service.users().messages().send(
+            self._execute(self.service.users().messages().send(
                 userId=self.user_id,
                 body={'raw': raw_message}
-            ).execute()
+            ))
             
             return True
         
@@ -401,36 +715,79 @@ class ImprovedEmailClient:
             if not label_id:
                 return False
             
-            self.service.users().messages().modify(
+            self._execute(self.service.users().messages().modify(
                 userId=self.user_id,
                 id=email_id,
                 body={'addLabelIds': [label_id]}
-            ).execute()
+            ))
             
+            self.message_cache.update_labels(email_id, add=[label_id])
             return True
         
         except HttpError as error:
             print(f"An error occurred: {error}")
             return False
     
+    def batch_modify(self, message_ids: List[str], add_label_ids: Optional[List[str]] = None,
+                     remove_label_ids: Optional[List[str]] = None) -> bool:
+        """Change the labels of many emails with users.messages.batchModify (one call per 1000 IDs)."""
+        if not self.authorized or not self.service:
+            print("Not authorized to modify emails")
+            return False
+        
+        body = {}
+        if add_label_ids:
+            body['addLabelIds'] = add_label_ids
+        if remove_label_ids:
+            body['removeLabelIds'] = remove_label_ids
+        
+        try:
+            for start in range(0, len(message_ids), self.MAX_BATCH_MODIFY_IDS):
+                chunk = message_ids[start:start + self.MAX_BATCH_MODIFY_IDS]
+                self._execute(self.service.users().messages().batchModify(
+                    userId=self.user_id,
+                    body=dict(body, ids=chunk)
+                ))
+                for email_id in chunk:
+                    self.message_cache.update_labels(email_id, add=add_label_ids, remove=remove_label_ids)
+            
+            return True
+        
+        except HttpError as error:
+            print(f"An error occurred: {error}")
+            return False
+    
+    def trash_emails(self, email_ids: List[str]) -> bool:
+        """Move several emails to trash at once."""
+        return self.batch_modify(email_ids, add_label_ids=['TRASH'], remove_label_ids=['INBOX'])
+    
+    def mark_emails_as_read(self, email_ids: List[str]) -> bool:
+        """Mark several emails as read at once."""
+        return self.batch_modify(email_ids, remove_label_ids=['UNREAD'])
+    
+    def _fetch_labels(self) -> List[Dict[str, Any]]:
+        """Fetch the account's labels from the API (used to fill the label cache)."""
+        results = self._execute(self.service.users().labels().list(userId=self.user_id))
+        return results.get('labels', [])
+    
     def _get_or_create_label(self, label_name: str) -> Optional[str]:
         """Get the ID of a label, creating it if it doesn't exist."""
         try:
-            results = self.service.users().labels().list(userId=self.user_id).execute()
-            labels = results.get('labels', [])
-            
-            for label in labels:
-                if label['name'].lower() == label_name.lower():
-                    return label['id']
+            label_id = self.label_cache.get_label_id(label_name, self._fetch_labels)
+            if label_id:
+                return label_id
             
-            new_label = self.service.users().labels().create(
+            new_label = self._execute(self.service.users().labels().create(
                 userId=self.user_id,
                 body={'name': label_name}
-            ).execute()
+            ))
+            self.label_cache.add_label(new_label)
             
             return new_label['id']
         
         except HttpError as error:
+            # The cached list may be stale (e.g. label created elsewhere)
+            self.label_cache.invalidate()
             print(f"An error occurred: {error}")
             return None
     
@@ -441,15 +798,16 @@ class ImprovedEmailClient:
             return False
             
         try:
-            self.service.users().messages().modify(
+            self._execute(self.service.users().messages().modify(
                 userId=self.user_id,
                 id=email_id,
                 body={
                     'addLabelIds': ['TRASH'],
                     'removeLabelIds': ['INBOX']
                 }
-            ).execute()
+            ))
             
+            self.message_cache.update_labels(email_id, add=['TRASH'], remove=['INBOX'])
             return True
             
         except HttpError as error:
@@ -463,14 +821,15 @@ class ImprovedEmailClient:
             return False
             
         try:
-            self.service.users().messages().modify(
+            self._execute(self.service.users().messages().modify(
                 userId=self.user_id,
                 id=email_id,
                 body={
                     'removeLabelIds': ['UNREAD']
                 }
-            ).execute()
+            ))
             
+            self.message_cache.update_labels(email_id, remove=['UNREAD'])
             return True
             
         except HttpError as error:
@@ -4,6 +4,7 @@ Enhanced actions for organizing and labeling emails.
 
 from typing import Any, Text, Dict, List
 import os
+import asyncio
 import requests
 import json
 import logging
@@ -12,11 +13,22 @@ from rasa_sdk import Action, Tracker
 from rasa_sdk.events import SlotSet
 from rasa_sdk.executor import CollectingDispatcher
 
-from actions.improved_email_client import ImprovedEmailClient
+from actions.email_client_pool import get_async_email_client
+from actions.keyword_categorizer import get_categorizer
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+# Label names of the keyword fallback, per keyword category
+FALLBACK_LABEL_NAMES = {
+    'Arbeit': 'Work',
+    'Finanzen': 'Finance',
+    'Dringend': 'Important',
+    'Reise': 'Travel',
+    'Updates': 'Updates',
+    'Soziales': 'Social'
+}
+
 
 class ActionGetLabelSuggestions(Action):
     """Action to get label suggestions for the current email."""
@@ -24,7 +36,7 @@ class ActionGetLabelSuggestions(Action):
     def name(self) -> Text:
         return "action_get_label_suggestions"
 
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         """
@@ -42,20 +54,20 @@ class ActionGetLabelSuggestions(Action):
                 )
                 return []
 
-            # Initialize email client
+            # Get the shared email client
             credentials_path = os.getenv("GMAIL_CREDENTIALS_PATH")
             token_path = os.getenv("GMAIL_TOKEN_PATH")
 
-            email_client = ImprovedEmailClient(
+            email_client = await get_async_email_client(
                 credentials_path=credentials_path,
                 token_path=token_path
             )
 
             # Get existing labels
-            existing_labels = email_client.get_all_labels()
+            existing_labels = await email_client.get_all_labels()
 
-            # Use LLM to determine suggested labels
-            suggested_labels = self.determine_labels(content, subject)
+            # Use LLM to determine suggested labels (blocking HTTP, so in a worker thread)
+            suggested_labels = await asyncio.to_thread(self.determine_labels, content, subject)
 
             # Format the response
             response = f"Basierend auf dem Inhalt würde ich empfehlen, diese E‑Mail als \"{suggested_labels[0]}\" zu labeln."
@@ -165,23 +177,11 @@ class ActionGetLabelSuggestions(Action):
 
     def _fallback_label_determination(self, content: str, subject: str) -> List[str]:
         """
-        Fallback method for label determination using rule-based approach.
+        Fallback method for label determination using the shared keyword categorizer.
+        Categories keep the English label names this fallback has always suggested.
         """
-        # Combine subject and body for analysis
-        combined_text = (subject + " " + content).lower()
-        
-        labels = []
-        
-        if any(word in combined_text for word in ["meeting", "project", "deadline", "report"]):
-            labels.append("Work")
-        if any(word in combined_text for word in ["invoice", "payment", "receipt", "transaction"]):
-            labels.append("Finance")
-        if any(word in combined_text for word in ["urgent", "important", "immediately", "asap"]):
-            labels.append("Important")
-        if any(word in combined_text for word in ["flight", "hotel", "booking", "reservation"]):
-            labels.append("Travel")
-        if any(word in combined_text for word in ["newsletter", "update", "news"]):
-            labels.append("Updates")
+        categories = get_categorizer().categorize(f"{subject} {content}", limit=3)
+        labels = [FALLBACK_LABEL_NAMES.get(category, category) for category in categories]
         
         # Add default if no matches
         if not labels:
@@ -196,7 +196,7 @@ class ActionApplySelectedLabel(Action):
     def name(self) -> Text:
         return "action_apply_selected_label"
 
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         """
@@ -240,17 +240,17 @@ class ActionApplySelectedLabel(Action):
             else:
                 label_to_apply = label_choice
 
-            # Initialize email client
+            # Get the shared email client
             credentials_path = os.getenv("GMAIL_CREDENTIALS_PATH")
             token_path = os.getenv("GMAIL_TOKEN_PATH")
             
-            email_client = ImprovedEmailClient(
+            email_client = await get_async_email_client(
                 credentials_path=credentials_path,
                 token_path=token_path
             )
 
             # Apply the label
-            success = email_client.apply_label(email_id, label_to_apply)
+            success = await email_client.apply_label(email_id, label_to_apply)
 
             if not success:
                 dispatcher.utter_message(text=f"Es gab ein Problem beim Anwenden des Labels '{label_to_apply}'.")
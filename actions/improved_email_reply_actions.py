@@ -13,7 +13,7 @@ from rasa_sdk import Action, Tracker
 from rasa_sdk.events import SlotSet
 from rasa_sdk.executor import CollectingDispatcher
 
-from actions.improved_email_client import ImprovedEmailClient
+from actions.email_client_pool import get_async_email_client
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -389,7 +389,7 @@ class ActionSendReply(Action):
     def name(self) -> Text:
         return "action_send_reply"
     
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         """
@@ -426,11 +426,11 @@ class ActionSendReply(Action):
             sender_match = re.search(r'\((.*?)\)', sender_full)
             sender_email = sender_match.group(1) if sender_match else sender_full
             
-            # Initialize email client
+            # Get the shared email client
             credentials_path = os.getenv("GMAIL_CREDENTIALS_PATH")
             token_path = os.getenv("GMAIL_TOKEN_PATH")
             
-            email_client = ImprovedEmailClient(
+            email_client = await get_async_email_client(
                 credentials_path=credentials_path,
                 token_path=token_path
             )
@@ -440,7 +440,7 @@ class ActionSendReply(Action):
             full_subject = f"{subject_prefix}{subject}"
             
             # Send the email
-            success = email_client.send_email(
+            success = await email_client.send_email(
                 to=sender_email,
                 subject=full_subject,
                 body=response,
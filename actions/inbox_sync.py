@@ -0,0 +1,422 @@
+"""
+Incremental inbox sync based on Gmail history IDs.
+
+Keeps a local mirror of the unread inbox per account: the ordered set of
+unread message IDs plus the parsed metadata of the mails that were shown.
+After the first full listing only the changes since the last historyId are
+fetched via users.history.list. Listings are served page by page from the
+mirror, and the page after the one being shown is loaded in the background.
+Pages continue after a cursor naming the last mail shown (see page_cursor),
+so mail arriving or being read between two pages does not shift them.
+The mirror holds the newest max_messages unread IDs; paging past them lists
+further into Gmail's unread mail and grows the mirror by the pages shown.
+When Gmail push notifications are enabled, the mirror is synced as they
+arrive and listings are answered from memory without calling Gmail.
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from actions.improved_email_client import ImprovedEmailClient
+
+
+class InboxSync:
+    """Local mirror of one account's unread inbox, kept current with history deltas"""
+    
+    # Labels a message needs to be part of the mirrored set
+    MIRROR_LABELS = ('INBOX', 'UNREAD')
+    
+    # Upper bound for the number of unread IDs kept in the mirror
+    DEFAULT_MAX_MESSAGES = 500
+    
+    HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+    
+    # With push enabled, still sync on listing when the last sync is older than this
+    DEFAULT_PUSH_MAX_STALENESS_SECONDS = 900
+    
+    def __init__(self, client: ImprovedEmailClient, max_messages: int = DEFAULT_MAX_MESSAGES):
+        self.client = client
+        self.max_messages = max_messages
+        # Number of unread IDs mirrored: max_messages, or more once listings page beyond it
+        self._limit = max_messages
+        self.history_id: Optional[str] = None
+        self.email_address: Optional[str] = None
+        
+        # Set by the push receiver; listings then skip the sync while the mirror is current
+        self.push_enabled = False
+        self.push_max_staleness = float(
+            os.getenv("GMAIL_PUSH_MAX_STALENESS", self.DEFAULT_PUSH_MAX_STALENESS_SECONDS)
+        )
+        self._notified_history_id = 0
+        self._last_sync = 0.0
+        
+        # Unread message IDs, newest first
+        self._unread_ids: List[str] = []
+        # Whether Gmail holds more unread inbox mail than the mirror (capped at _limit)
+        self._truncated = False
+        # Gmail internalDate of mirrored messages, looked up when one has to be placed by date
+        self._dates: Dict[str, Optional[int]] = {}
+        # Parsed metadata (email dicts without body) for messages that were listed
+        self._records: Dict[str, Dict[str, Any]] = {}
+        
+        self._lock = threading.RLock()
+        
+        # Loads the records of the next page while the current one is read
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inbox-prefetch")
+        self._prefetch: Optional[Future] = None
+    
+    def get_unread_emails(self, max_results: int = 10, after: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Bring the mirror up to date and return up to max_results unread emails,
+        starting after the mail the cursor `after` points at (from the newest
+        without one), as metadata-only email dicts (no "body" key).
+        Only the records of this page and the next one are kept in memory.
+        """
+        self._wait_for_prefetch()
+        
+        with self._lock:
+            if not self.is_current():
+                self.sync()
+            
+            offset = self._cursor_position(after)
+            if self._truncated and offset + 2 * max_results > len(self._unread_ids):
+                # This page or the prefetched next one reaches past the mirror
+                self._limit = offset + 2 * max_results
+                try:
+                    self._list_unread_ids()
+                except HttpError as error:
+                    print(f"An error occurred: {error}")
+                offset = self._cursor_position(after)
+            
+            window = self._unread_ids[offset:offset + max_results]
+            missing = [msg_id for msg_id in window if msg_id not in self._records]
+            if missing:
+                try:
+                    self._load_records(missing)
+                except HttpError as error:
+                    print(f"An error occurred: {error}")
+            
+            page = [dict(self._records[msg_id]) for msg_id in window if msg_id in self._records]
+            
+            next_window = self._unread_ids[offset + max_results:offset + 2 * max_results]
+            keep = set(window) | set(next_window)
+            self._records = {msg_id: record for msg_id, record in self._records.items() if msg_id in keep}
+            
+            to_prefetch = [msg_id for msg_id in next_window if msg_id not in self._records]
+            if to_prefetch:
+                self._prefetch = self._prefetch_executor.submit(self._prefetch_records, to_prefetch)
+            
+            return page
+    
+    def has_more(self, after: str) -> bool:
+        """Whether there are unread emails after the mail the cursor points at, in the mirror or beyond its cap."""
+        with self._lock:
+            return self._truncated or self._cursor_position(after) < len(self._unread_ids)
+    
+    @staticmethod
+    def page_cursor(email: Dict[str, Any]) -> str:
+        """Cursor for the page after email: its internalDate and ID."""
+        return f"{email.get('internal_date') or ''}:{email['id']}"
+    
+    def _cursor_position(self, cursor: Optional[str]) -> int:
+        """Index of the first mirrored mail after the cursor's mail."""
+        if not cursor:
+            return 0
+        
+        date_text, _, msg_id = str(cursor).partition(':')
+        if not msg_id:
+            # Not a cursor (e.g. an offset stored by an older version)
+            return 0
+        if msg_id in self._unread_ids:
+            return self._unread_ids.index(msg_id) + 1
+        
+        # The mail was read or deleted since: continue with the first mail not newer than it
+        date = int(date_text) if date_text.isdigit() else self._internal_date(msg_id)
+        if date is None:
+            return 0
+        return self._first_not_newer(date)
+    
+    def is_current(self) -> bool:
+        """
+        Whether the mirror can be served without asking Gmail: push is enabled,
+        every notified change has been synced and the last sync is recent enough.
+        """
+        with self._lock:
+            if not self.push_enabled or self.history_id is None:
+                return False
+            if int(self.history_id) < self._notified_history_id:
+                return False
+            return time.monotonic() - self._last_sync < self.push_max_staleness
+    
+    def mark_notified(self, history_id: str) -> None:
+        """Record that Gmail reported changes up to history_id, so the mirror is behind until synced."""
+        with self._lock:
+            self._notified_history_id = max(self._notified_history_id, int(history_id))
+    
+    def notify(self, history_id: Optional[str] = None, prewarm_count: int = 10) -> None:
+        """
+        Handle a push notification: sync the changes and warm the first
+        prewarm_count unread emails, including their bodies, in the caches.
+        """
+        if history_id is not None:
+            self.mark_notified(history_id)
+        
+        with self._lock:
+            if not self.sync():
+                return
+            window = self._unread_ids[:prewarm_count]
+        
+        # Fetch outside the lock so listings are not blocked by the body downloads
+        try:
+            emails = self.client.get_emails(window, include_body=True, label_ids=list(self.MIRROR_LABELS))
+        except HttpError as error:
+            print(f"An error occurred while prewarming: {error}")
+            return
+        
+        with self._lock:
+            unread_set = set(self._unread_ids)
+            for email in emails:
+                if email['id'] in unread_set:
+                    record = dict(email)
+                    record.pop('body', None)
+                    self._records[email['id']] = record
+    
+    def unread_count(self) -> int:
+        """Number of unread inbox messages currently in the mirror."""
+        with self._lock:
+            return len(self._unread_ids)
+    
+    def sync(self) -> bool:
+        """
+        Fetch the changes since the last sync. Falls back to a full resync on
+        the first call and when Gmail reports the stored historyId as expired.
+        """
+        if not self.client.authorized or not self.client.service:
+            print("Not authorized to access Gmail")
+            return False
+        
+        with self._lock:
+            try:
+                if self.history_id is None:
+                    self._full_resync()
+                    self._last_sync = time.monotonic()
+                    return True
+                
+                try:
+                    self._apply_history()
+                except HttpError as error:
+                    # 404 means the start historyId is too old to be served
+                    if getattr(error.resp, 'status', None) != 404:
+                        raise
+                    print("History ID expired, running full inbox resync")
+                    self._full_resync()
+                
+                # Read or deleted mail left room for older unread mail beyond the cap
+                if self._truncated and len(self._unread_ids) < self._limit:
+                    self._list_unread_ids()
+                
+                self._last_sync = time.monotonic()
+                return True
+            
+            except HttpError as error:
+                print(f"An error occurred during inbox sync: {error}")
+                return False
+    
+    def _full_resync(self) -> None:
+        """Rebuild the mirror from a fresh listing of unread inbox messages."""
+        service = self.client.service
+        user_id = self.client.user_id
+        
+        # Take the historyId before listing so no change between the two calls is lost
+        profile = self.client._execute(service.users().getProfile(userId=user_id))
+        history_id = profile['historyId']
+        self.email_address = profile.get('emailAddress')
+        
+        self._list_unread_ids()
+        self.history_id = history_id
+    
+    def _list_unread_ids(self) -> None:
+        """Replace the mirrored IDs with the newest _limit unread inbox messages, in Gmail's date order."""
+        service = self.client.service
+        user_id = self.client.user_id
+        
+        unread_ids = []
+        page_token = None
+        while len(unread_ids) < self._limit:
+            results = self.client._execute(service.users().messages().list(
+                userId=user_id,
+                labelIds=list(self.MIRROR_LABELS),
+                maxResults=min(500, self._limit - len(unread_ids)),
+                pageToken=page_token
+            ))
+            
+            unread_ids.extend(message['id'] for message in results.get('messages', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        
+        unread_set = set(unread_ids)
+        self._unread_ids = unread_ids
+        self._truncated = page_token is not None
+        self._records = {msg_id: record for msg_id, record in self._records.items() if msg_id in unread_set}
+        self._dates = {msg_id: date for msg_id, date in self._dates.items() if msg_id in unread_set}
+    
+    def _apply_history(self) -> None:
+        """Apply added, deleted and relabeled messages since history_id to the mirror."""
+        service = self.client.service
+        user_id = self.client.user_id
+        
+        page_token = None
+        latest_history_id = self.history_id
+        while True:
+            results = self.client._execute(service.users().history().list(
+                userId=user_id,
+                startHistoryId=self.history_id,
+                historyTypes=self.HISTORY_TYPES,
+                pageToken=page_token
+            ))
+            
+            for record in results.get('history', []):
+                for change in record.get('messagesAdded', []):
+                    self._update_membership(change['message'], added=True)
+                for change in record.get('messagesDeleted', []):
+                    self._remove(change['message']['id'])
+                for change in record.get('labelsAdded', []) + record.get('labelsRemoved', []):
+                    self._update_membership(change['message'])
+            
+            latest_history_id = results.get('historyId', latest_history_id)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        
+        self.history_id = latest_history_id
+    
+    def _update_membership(self, message: Dict[str, Any], added: bool = False) -> None:
+        """
+        Add or drop a message depending on its current labels. Newly arrived
+        mail goes to the top; mail that is marked unread again is placed by date.
+        """
+        msg_id = message['id']
+        label_ids = message.get('labelIds', [])
+        self.client.message_cache.set_labels(msg_id, label_ids)
+        
+        if all(label in label_ids for label in self.MIRROR_LABELS):
+            if msg_id not in self._unread_ids:
+                position = 0 if added else self._date_position(msg_id)
+                if position is None:
+                    return
+                self._unread_ids.insert(position, msg_id)
+                for dropped_id in self._unread_ids[self._limit:]:
+                    self._records.pop(dropped_id, None)
+                    self._dates.pop(dropped_id, None)
+                    self._truncated = True
+                del self._unread_ids[self._limit:]
+            elif msg_id in self._records:
+                self._records[msg_id]['labels'] = label_ids
+        else:
+            self._remove(msg_id)
+    
+    def _date_position(self, msg_id: str) -> Optional[int]:
+        """
+        Index at which msg_id belongs in the newest-first mirror, or None if it
+        no longer exists or is older than everything a truncated mirror holds.
+        """
+        date = self._internal_date(msg_id)
+        if date is None:
+            return None
+        
+        position = self._first_not_newer(date)
+        if position == len(self._unread_ids) and self._truncated:
+            # Somewhere in the unread mail beyond the cap; a refill picks it up if there is room
+            return None
+        return position
+    
+    def _first_not_newer(self, date: int) -> int:
+        """Binary search for the first mirrored mail received at or before date (milliseconds)."""
+        low, high = 0, len(self._unread_ids)
+        while low < high:
+            middle = (low + high) // 2
+            other_date = self._internal_date(self._unread_ids[middle])
+            if other_date is None or other_date > date:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+    
+    def _internal_date(self, msg_id: str) -> Optional[int]:
+        """Gmail internalDate of a message from the mirror, the message cache or a minimal fetch; None if it is gone."""
+        if msg_id in self._dates:
+            return self._dates[msg_id]
+        
+        record = self._records.get(msg_id) or self.client.message_cache.get(msg_id)
+        date = record.get('internal_date') if record else None
+        if date is None:
+            try:
+                message = self.client._execute(self.client.service.users().messages().get(
+                    userId=self.client.user_id,
+                    id=msg_id,
+                    format='minimal'
+                ))
+                date = int(message['internalDate'])
+            except HttpError as error:
+                if getattr(error.resp, 'status', None) != 404:
+                    raise
+        
+        self._dates[msg_id] = date
+        return date
+    
+    def _remove(self, msg_id: str) -> None:
+        if msg_id in self._unread_ids:
+            self._unread_ids.remove(msg_id)
+        self._records.pop(msg_id, None)
+        self._dates.pop(msg_id, None)
+    
+    def _load_records(self, message_ids: List[str]) -> None:
+        """Load metadata (from the message cache or Gmail) for mirrored messages not listed yet."""
+        # Failed fetches stay unloaded and are retried on the next listing
+        for email in self.client.get_emails(message_ids, label_ids=list(self.MIRROR_LABELS)):
+            self._records[email['id']] = email
+    
+    def _prefetch_records(self, message_ids: List[str]) -> None:
+        """Background task: load records for the next page without holding the mirror lock while fetching."""
+        try:
+            emails = self.client.get_emails(message_ids, label_ids=list(self.MIRROR_LABELS))
+        except HttpError as error:
+            print(f"An error occurred while prefetching: {error}")
+            return
+        
+        with self._lock:
+            unread_set = set(self._unread_ids)
+            for email in emails:
+                if email['id'] in unread_set:
+                    self._records[email['id']] = email
+    
+    def _wait_for_prefetch(self) -> None:
+        """Let a running prefetch finish so the same messages are not fetched twice."""
+        prefetch = self._prefetch
+        if prefetch is not None:
+            self._prefetch = None
+            try:
+                prefetch.result()
+            except Exception as error:
+                # The page is simply loaded again on demand
+                print(f"Prefetch failed: {error}")
+
+
+_syncs: Dict[str, InboxSync] = {}
+_syncs_lock = threading.Lock()
+
+
+def get_inbox_sync(client: ImprovedEmailClient) -> InboxSync:
+    """Return the inbox mirror for the client's account, creating it on first use."""
+    with _syncs_lock:
+        inbox_sync = _syncs.get(client.token_path)
+        if inbox_sync is None or inbox_sync.client is not client:
+            inbox_sync = InboxSync(client)
+            _syncs[client.token_path] = inbox_sync
+        return inbox_sync
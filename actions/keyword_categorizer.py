@@ -0,0 +1,164 @@
+"""
+Keyword categorizer shared by the mailbox sort and the fallback label suggestions.
+
+Each category has German and English keywords; a text scores one point per
+keyword occurrence (substrings count, so "Hotelbuchung" matches "buchung").
+Large keyword sets are compiled into one trie-shaped pattern that finds all
+keywords in a single pass over the text. For small sets, one C-level find
+per keyword is faster in CPython, so those are scanned per keyword with
+the same results.
+
+The keywords can be replaced with a YAML or JSON file (category -> list of
+keywords) named by EMAIL_CATEGORIES_PATH.
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATEGORY_KEYWORDS = {
+    'Arbeit': ['projekt', 'frist', 'besprechung', 'bericht', 'kunde', 'aufgabe',
+               'project', 'deadline', 'meeting', 'report'],
+    'Finanzen': ['rechnung', 'zahlung', 'beleg', 'transaktion', 'abrechnung', 'abo',
+                 'invoice', 'payment', 'receipt', 'transaction'],
+    'Reise': ['flug', 'hotel', 'buchung', 'reservierung', 'reiseplan', 'trip',
+              'flight', 'booking', 'reservation'],
+    'Soziales': ['einladung', 'event', 'party', 'feier', 'treffen', 'invitation'],
+    'Updates': ['newsletter', 'update', 'ankündigung', 'nachricht', 'news'],
+    'Dringend': ['dringend', 'wichtig', 'sofort', 'asap', 'notfall',
+                 'urgent', 'important', 'immediately']
+}
+
+# From this many keywords on, the single-pass automaton beats one find per keyword
+AUTOMATON_MIN_KEYWORDS = 150
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """Regex alternation shaped like a trie of keywords; it matches the longest keyword at a position."""
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+def _count_occurrences(text: str, keyword: str) -> int:
+    """Occurrences of keyword in text, overlapping ones included."""
+    count = 0
+    position = text.find(keyword)
+    while position != -1:
+        count += 1
+        position = text.find(keyword, position + 1)
+    return count
+
+
+class KeywordCategorizer:
+    """Scores texts against keyword lists per category"""
+
+    def __init__(self, category_keywords: Dict[str, List[str]]):
+        self.categories = list(category_keywords)
+        self._order = {category: position for position, category in enumerate(self.categories)}
+
+        # Changes when the keyword table does, so stored results can be recognized as outdated
+        self.fingerprint = hashlib.sha1(
+            json.dumps(category_keywords, sort_keys=True).encode('utf-8')
+        ).hexdigest()[:16]
+
+        # keyword -> categories it belongs to
+        self._keyword_categories: Dict[str, List[str]] = {}
+        for category, keywords in category_keywords.items():
+            for keyword in keywords:
+                keyword = keyword.strip().lower()
+                if keyword:
+                    self._keyword_categories.setdefault(keyword, []).append(category)
+
+        self._automaton = None
+        if len(self._keyword_categories) >= AUTOMATON_MIN_KEYWORDS:
+            # Lookahead, so overlapping keywords are all found
+            self._automaton = re.compile(f'(?=({_trie_pattern(self._keyword_categories)}))')
+            # The automaton reports the longest keyword at a position; shorter
+            # keywords that are prefixes of it match there too
+            self._prefix_keywords = {
+                keyword: [other for other in self._keyword_categories if keyword.startswith(other)]
+                for keyword in self._keyword_categories
+            }
+
+    def scores(self, text: str) -> Dict[str, int]:
+        """Return category -> number of keyword occurrences, for categories that occur."""
+        text = (text or '').lower()
+        scores: Dict[str, int] = {}
+
+        if self._automaton is None:
+            for keyword, categories in self._keyword_categories.items():
+                # Most keywords don't occur; only hits pay for counting
+                if keyword not in text:
+                    continue
+                count = _count_occurrences(text, keyword)
+                for category in categories:
+                    scores[category] = scores.get(category, 0) + count
+            return scores
+
+        for longest in self._automaton.findall(text):
+            for keyword in self._prefix_keywords[longest]:
+                for category in self._keyword_categories[keyword]:
+                    scores[category] = scores.get(category, 0) + 1
+        return scores
+
+    def categorize(self, text: str, limit: Optional[int] = None) -> List[str]:
+        """Return the matching categories, highest score first (ties in configured order)."""
+        scores = self.scores(text)
+        ranked = sorted(scores, key=lambda category: (-scores[category], self._order[category]))
+        return ranked[:limit] if limit is not None else ranked
+
+
+def load_category_keywords(path: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Read category keywords from path (or EMAIL_CATEGORIES_PATH), falling
+    back to DEFAULT_CATEGORY_KEYWORDS if neither is set or the file is unusable.
+    """
+    path = path or os.getenv("EMAIL_CATEGORIES_PATH")
+    if not path:
+        return DEFAULT_CATEGORY_KEYWORDS
+
+    try:
+        with open(path, encoding='utf-8') as config:
+            loaded = yaml.safe_load(config)
+    except (OSError, yaml.YAMLError) as error:
+        logger.warning(f"Could not read category keywords from {path}: {error}")
+        return DEFAULT_CATEGORY_KEYWORDS
+
+    if not isinstance(loaded, dict) or not all(isinstance(keywords, list) for keywords in loaded.values()):
+        logger.warning(f"Category keywords in {path} must map category names to lists of keywords")
+        return DEFAULT_CATEGORY_KEYWORDS
+    return {str(category): [str(keyword) for keyword in keywords] for category, keywords in loaded.items()}
+
+
+_categorizer: Optional[KeywordCategorizer] = None
+_categorizer_lock = threading.Lock()
+
+
+def get_categorizer() -> KeywordCategorizer:
+    """Return the process-wide categorizer, compiled on first use."""
+    global _categorizer
+    with _categorizer_lock:
+        if _categorizer is None:
+            _categorizer = KeywordCategorizer(load_category_keywords())
+        return _categorizer
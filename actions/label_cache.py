@@ -0,0 +1,81 @@
+"""
+Per-account cache of Gmail labels shared by the email clients.
+"""
+
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+class LabelCache:
+    """Caches the label list of one Gmail account with case-insensitive name lookup and a TTL"""
+    
+    DEFAULT_TTL_SECONDS = 300.0
+    
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(
+            os.getenv("GMAIL_LABEL_CACHE_TTL", self.DEFAULT_TTL_SECONDS)
+        )
+        self._labels: Optional[List[Dict[str, Any]]] = None
+        self._ids_by_name: Dict[str, str] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+    
+    def get_labels(self, fetch_labels: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Return all labels, calling fetch_labels only when the cache is empty or expired."""
+        with self._lock:
+            if self._labels is None or time.monotonic() - self._loaded_at > self.ttl_seconds:
+                self._store(fetch_labels())
+            return list(self._labels)
+    
+    def get_label_id(self, label_name: str, fetch_labels: Callable[[], List[Dict[str, Any]]]) -> Optional[str]:
+        """Look up a label ID by name, ignoring case."""
+        self.get_labels(fetch_labels)
+        with self._lock:
+            return self._ids_by_name.get(label_name.lower())
+    
+    def get_cached_labels(self) -> Optional[List[Dict[str, Any]]]:
+        """Return the cached labels, or None when they have to be fetched first."""
+        with self._lock:
+            if self._labels is None or time.monotonic() - self._loaded_at > self.ttl_seconds:
+                return None
+            return list(self._labels)
+    
+    def set_labels(self, labels: List[Dict[str, Any]]) -> None:
+        """Replace the cached labels with a freshly fetched list."""
+        with self._lock:
+            self._store(labels)
+    
+    def add_label(self, label: Dict[str, Any]) -> None:
+        """Record a newly created label so the next lookup does not need a list call."""
+        with self._lock:
+            if self._labels is None:
+                return
+            self._labels.append(label)
+            self._ids_by_name[label['name'].lower()] = label['id']
+    
+    def invalidate(self) -> None:
+        """Forget the cached labels; the next lookup refetches them."""
+        with self._lock:
+            self._labels = None
+            self._ids_by_name = {}
+    
+    def _store(self, labels: List[Dict[str, Any]]) -> None:
+        self._labels = list(labels)
+        self._ids_by_name = {label['name'].lower(): label['id'] for label in self._labels}
+        self._loaded_at = time.monotonic()
+
+
+_caches: Dict[str, LabelCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_label_cache(account_key: str) -> LabelCache:
+    """Return the label cache for an account (keyed by its token path)."""
+    with _caches_lock:
+        cache = _caches.get(account_key)
+        if cache is None:
+            cache = LabelCache()
+            _caches[account_key] = cache
+        return cache
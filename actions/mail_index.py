@@ -0,0 +1,317 @@
+"""
+In-memory inverted index over the cached mail of an account.
+
+Sender, subject and body text are tokenized and folded (lowercase, umlauts
+and accents removed: "Müller" and "Mueller" both become "mueller"), and each
+term maps to the IDs of the messages containing it. The index is filled from
+the message cache on first use and then follows it: every mail that is
+fetched or synced into the cache is indexed, evicted mails are removed.
+Selecting a listed mail by sender or subject is answered from memory without
+a Gmail call, and also matches words inside longer sender and subject words
+("rechnung" picks "Stromrechnung"). Searches look terms up exactly or, unless
+exact, by prefix; both are dictionary and binary-search lookups, so their
+cost does not grow with the number of indexed mails.
+"""
+
+import re
+import heapq
+import bisect
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from actions.message_cache import MessageCache, get_message_cache
+
+_FOLD_TABLE = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+# Gmail operators the index can answer and the field they map to
+_FIELD_OPERATORS = {'from': 'from', 'subject': 'subject'}
+
+_UNSUPPORTED_SYNTAX = re.compile(r'(?:^|\s)-|\bOR\b|[{}]')
+_QUERY_PART = re.compile(r'(\w+):\(([^)]*)\)|(\w+):("[^"]*"|\S+)|"([^"]*)"|(\S+)')
+
+# Words that say nothing about which mail is meant ("die E-Mail von Vincent")
+_STOP_WORDS = {
+    "die", "der", "das", "den", "dem", "des", "ein", "eine", "einen", "von", "vom", "mit", "und", "oder",
+    "mail", "mails", "email", "emails", "nachricht", "nachrichten", "zeige", "zeig", "oeffne", "lies",
+    "lese", "bitte", "mir", "ueber", "betreff", "the", "from", "about",
+}
+
+# A query term without an exact match also matches longer terms ("ann" -> "anna")
+# if it has at least MIN_PREFIX_LENGTH characters; at most MAX_PREFIX_TERMS are merged
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_TERMS = 100
+
+# When picking a listed mail, sender and subject words also match terms of at
+# least this length inside them ("rechnung" -> "stromrechnung")
+MIN_SUBSTRING_LENGTH = 4
+
+
+def fold(text: str) -> str:
+    """Lowercase text and replace umlauts, ß and accented letters by plain ASCII."""
+    text = text.lower().translate(_FOLD_TABLE)
+    if text.isascii():
+        return text
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split folded text into alphanumeric terms."""
+    if not text:
+        return []
+    return _TOKEN.findall(fold(text))
+
+
+class MailIndex:
+    """Inverted index from folded terms to message IDs, with field terms for sender and subject"""
+
+    # Only the beginning of long bodies is indexed
+    MAX_BODY_CHARS = 5000
+
+    def __init__(self):
+        # term -> message IDs; field terms are stored as "from:anna", "subject:rechnung"
+        self._postings: Dict[str, Set[str]] = {}
+        # message ID -> (header terms, body terms), to remove or update a message
+        self._documents: Dict[str, Tuple[Set[str], Set[str]]] = {}
+        # Sorted terms per field ('' for plain terms) for prefix lookups
+        self._vocabularies: Dict[str, List[str]] = {'': [], 'from': [], 'subject': []}
+        # message ID -> Gmail internalDate in ms; newer mails rank first
+        self._dates: Dict[str, int] = {}
+        # message ID -> insertion sequence; breaks ties and ranks mails without a date
+        self._sequence: Dict[str, int] = {}
+        self._counter = 0
+        self._lock = threading.RLock()
+
+        # Set once the existing cached mail is indexed; search() defers to Gmail until then
+        self.ready = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, message_id: str) -> bool:
+        return message_id in self._documents
+
+    def add_many(self, emails: Iterable[Dict[str, Any]]) -> None:
+        """
+        Index or re-index email dicts. An email without a "body" key keeps
+        the body terms that are already indexed for it.
+        """
+        with self._lock:
+            for email in emails:
+                self._add(email)
+
+    def _add(self, email: Dict[str, Any]) -> None:
+        msg_id = email['id']
+        header_terms = set()
+        for field, texts in (('from', (email.get('sender'), email.get('sender_name'))),
+                             ('subject', (email.get('subject'),))):
+            for text in texts:
+                for token in tokenize(text):
+                    header_terms.add(token)
+                    header_terms.add(f"{field}:{token}")
+
+        if email.get('internal_date') is not None:
+            self._dates[msg_id] = int(email['internal_date'])
+
+        previous = self._documents.get(msg_id)
+        if 'body' in email:
+            body_terms = self._body_terms(email.get('body'))
+        else:
+            body_terms = previous[1] if previous else set(tokenize(email.get('snippet')))
+
+        self._store(msg_id, header_terms, body_terms)
+
+    def _body_terms(self, body: Optional[str]) -> Set[str]:
+        return set(tokenize((body or '')[:self.MAX_BODY_CHARS]))
+
+    def _store(self, msg_id: str, header_terms: Set[str], body_terms: Set[str]) -> None:
+        """Replace the indexed terms of a message (caller holds the lock)."""
+        previous = self._documents.get(msg_id)
+        if previous is not None:
+            self._unlink(msg_id, previous[0] | previous[1])
+        else:
+            self._counter += 1
+            self._sequence[msg_id] = self._counter
+
+        self._documents[msg_id] = (header_terms, body_terms)
+        for term in header_terms | body_terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = set()
+                bisect.insort(self._vocabulary_for(term), term)
+            postings.add(msg_id)
+
+    def load(self, emails: Iterable[Dict[str, Any]], chunk_size: int = 500) -> None:
+        """
+        Index existing mail in chunks, so concurrent updates and lookups only wait
+        for one chunk, then mark the index as ready.
+        """
+        chunk = []
+        for email in emails:
+            chunk.append(email)
+            if len(chunk) >= chunk_size:
+                self.add_many(chunk)
+                chunk = []
+        self.add_many(chunk)
+        self.ready.set()
+
+    def add_body(self, message_id: str, body: str) -> None:
+        """Index the body of an already indexed message once it is loaded."""
+        with self._lock:
+            document = self._documents.get(message_id)
+            if document is not None:
+                self._store(message_id, document[0], self._body_terms(body))
+
+    def remove(self, message_ids: Iterable[str]) -> None:
+        """Drop messages from the index."""
+        with self._lock:
+            for msg_id in message_ids:
+                document = self._documents.pop(msg_id, None)
+                if document is not None:
+                    self._unlink(msg_id, document[0] | document[1])
+                    self._sequence.pop(msg_id, None)
+                    self._dates.pop(msg_id, None)
+
+    def _unlink(self, msg_id: str, terms: Set[str]) -> None:
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.discard(msg_id)
+            if not postings:
+                del self._postings[term]
+                vocabulary = self._vocabulary_for(term)
+                position = bisect.bisect_left(vocabulary, term)
+                if position < len(vocabulary) and vocabulary[position] == term:
+                    del vocabulary[position]
+
+    def _vocabulary_for(self, term: str) -> List[str]:
+        return self._vocabularies[term.partition(':')[0] if ':' in term else '']
+
+    def _matching(self, term: str, exact: bool = False) -> Set[str]:
+        """
+        Message IDs containing term or, unless exact, a longer term starting with
+        it. The returned set may be a posting list itself and must not be modified.
+        """
+        postings = self._postings.get(term)
+        if postings is not None or exact or len(term.partition(':')[2] or term) < MIN_PREFIX_LENGTH:
+            return postings or set()
+
+        vocabulary = self._vocabulary_for(term)
+        position = bisect.bisect_left(vocabulary, term)
+        matches = []
+        while (position < len(vocabulary) and len(matches) < MAX_PREFIX_TERMS
+               and vocabulary[position].startswith(term)):
+            matches.append(self._postings[vocabulary[position]])
+            position += 1
+        if not matches:
+            return set()
+        return matches[0] if len(matches) == 1 else set().union(*matches)
+
+    def _header_matches(self, msg_id: str, term: str) -> bool:
+        """Whether the sender or subject of a message contains term, a term starting with it, or a word containing it."""
+        header_terms = self._documents.get(msg_id, (set(), set()))[0]
+        if term in header_terms:
+            return True
+        if len(term) < MIN_PREFIX_LENGTH:
+            return False
+        if len(term) < MIN_SUBSTRING_LENGTH:
+            return any(candidate.startswith(term) for candidate in header_terms if ':' not in candidate)
+        return any(term in candidate for candidate in header_terms if ':' not in candidate)
+
+    def search(self, query: str, limit: int = 10, exact: bool = False) -> Optional[List[str]]:
+        """
+        Return the IDs of messages matching all terms of query, newest first by
+        Gmail's internalDate (mails cached without one rank last). Terms match
+        whole words, and unless exact also the beginning of words ("ann" -> "anna").
+        query may use free text, quoted phrases, from: and subject:. Returns
+        None if it uses other Gmail operators (newer_than:, has:, ...), which
+        the index cannot answer, or while the index is still being built.
+        """
+        terms = self._parse_query(query)
+        if terms is None or not self.ready.is_set():
+            return None
+        if not terms:
+            return []
+
+        with self._lock:
+            # Start from the rarest term and narrow down
+            candidate_sets = sorted((self._matching(term, exact) for term in terms), key=len)
+            ids = candidate_sets[0]
+            for other in candidate_sets[1:]:
+                if not ids:
+                    break
+                ids = ids & other
+            return heapq.nlargest(limit, ids, key=lambda msg_id: (self._dates.get(msg_id, 0),
+                                                                  self._sequence.get(msg_id, 0)))
+
+    def best_match(self, text: str, message_ids: List[str]) -> Optional[str]:
+        """
+        Pick the message among message_ids (e.g. the listed mails) whose sender and
+        subject match the most terms of text; ties go to the earlier one.
+        Returns None if no term matches.
+        """
+        terms = [term for term in dict.fromkeys(tokenize(text))
+                 if len(term) > 2 and term not in _STOP_WORDS]
+        if not terms:
+            return None
+
+        best_id, best_score = None, 0
+        with self._lock:
+            for msg_id in message_ids:
+                score = sum(1 for term in terms if self._header_matches(msg_id, term))
+                if score > best_score:
+                    best_id, best_score = msg_id, score
+        return best_id
+
+    @staticmethod
+    def _parse_query(query: str) -> Optional[List[str]]:
+        # Negation, OR and grouping are left to Gmail
+        if _UNSUPPORTED_SYNTAX.search(query or ''):
+            return None
+        terms = []
+        for grouped_op, grouped, op, value, phrase, word in _QUERY_PART.findall(query or ''):
+            operator = (grouped_op or op).lower()
+            if operator:
+                field = _FIELD_OPERATORS.get(operator)
+                if field is None:
+                    return None
+                terms.extend(f"{field}:{token}" for token in tokenize(grouped or value))
+            else:
+                terms.extend(tokenize(phrase or word))
+        return list(dict.fromkeys(terms))
+
+    # Message cache listener interface
+    def on_messages_stored(self, emails: List[Dict[str, Any]]) -> None:
+        self.add_many(emails)
+
+    def on_body_stored(self, message_id: str, body: str) -> None:
+        self.add_body(message_id, body)
+
+    def on_messages_evicted(self, message_ids: List[str]) -> None:
+        self.remove(message_ids)
+
+
+_indexes: Dict[str, MailIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_mail_index(token_path: str, message_cache: Optional[MessageCache] = None) -> MailIndex:
+    """
+    Return the mail index for an account. On first use it is built from the
+    account's message cache in a background thread and then kept in step with it.
+    """
+    with _indexes_lock:
+        index = _indexes.get(token_path)
+        if index is None:
+            cache = message_cache or get_message_cache(token_path)
+            index = MailIndex()
+            # Register first so nothing stored while the existing mail is read gets lost
+            cache.add_listener(index)
+            threading.Thread(
+                target=index.load, args=(cache.iter_messages(),), name="mail-index-build", daemon=True
+            ).start()
+            _indexes[token_path] = index
+        return index
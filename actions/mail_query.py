@@ -0,0 +1,121 @@
+"""
+Translation of German search requests into Gmail search queries.
+
+"Mails von Anna letzte Woche" becomes "from:anna newer_than:7d", so Gmail
+does the filtering server-side. Input that already uses Gmail operators
+(from:, subject:, ...) is passed through unchanged.
+"""
+
+import re
+from typing import List
+
+_GMAIL_OPERATOR = re.compile(r'\b(?:from|to|cc|subject|label|has|is|in|after|before|newer_than|older_than|filename):', re.IGNORECASE)
+
+# Time phrases and their Gmail equivalents, checked in this order
+_TIME_PATTERNS = [
+    (re.compile(r'\b(?:in den |in der )?(?:letzten|vergangenen)\s+(\d+)\s+tage?n?\b'), lambda m: f"newer_than:{m.group(1)}d"),
+    (re.compile(r'\b(?:in den |in der )?(?:letzten|vergangenen)\s+(\d+)\s+wochen\b'), lambda m: f"newer_than:{int(m.group(1)) * 7}d"),
+    (re.compile(r'\bvorgestern\b'), lambda m: "newer_than:3d older_than:2d"),
+    (re.compile(r'\bgestern\b'), lambda m: "newer_than:2d older_than:1d"),
+    (re.compile(r'\bheute\b'), lambda m: "newer_than:1d"),
+    (re.compile(r'\b(?:letzte|letzten|vergangene|vergangenen|diese|dieser)\s+woche\b'), lambda m: "newer_than:7d"),
+    (re.compile(r'\b(?:letzten|vergangenen|diesen|diesem)\s+monat\b'), lambda m: "newer_than:1m"),
+    (re.compile(r'\b(?:letztes|letzten|vergangenes|vergangenen|dieses|diesem)\s+jahr\b'), lambda m: "newer_than:1y"),
+]
+
+_FLAG_PATTERNS = [
+    (re.compile(r'\b(?:mit\s+)?(?:anhang|anhängen|anhaengen|attachment)\b'), "has:attachment"),
+    (re.compile(r'\bungelesene?n?\b'), "is:unread"),
+    (re.compile(r'\bwichtige?n?\b'), "is:important"),
+    (re.compile(r'\b(?:markierte?n?|mit stern)\b'), "is:starred"),
+]
+
+_QUOTED = re.compile(r'["„“]([^"„“]+)["“”]')
+
+# Words that introduce a sender, a recipient or a subject
+_FROM_WORDS = {"von", "vom"}
+_TO_WORDS = {"an"}
+_SUBJECT_WORDS = {"betreff", "thema", "über", "ueber", "wegen", "zum", "zu"}
+
+_STOP_WORDS = {
+    "zeig", "zeige", "such", "suche", "finde", "find", "finden", "durchsuche", "gib", "bitte", "mal",
+    "mir", "mich", "ich", "meine", "meinen", "meiner", "alle", "allen", "die", "der", "den", "dem", "das",
+    "des", "ein", "eine", "einer", "mit", "nach", "und", "oder", "aus", "im", "in", "auf", "für", "es",
+    "gibt", "hat", "habe", "haben", "welche", "welcher", "nachricht", "nachrichten", "mail", "mails",
+    "e-mail", "e-mails", "email", "emails", "post", "posteingang", "geschickt", "geschrieben", "gesendet",
+    "bekommen", "erhalten", "kam", "kamen", "sind", "ist", "herr", "herrn", "frau", "betreff",
+}
+
+_BOUNDARY_WORDS = _FROM_WORDS | _TO_WORDS | _SUBJECT_WORDS | _STOP_WORDS
+
+
+def _group(operator: str, words: List[str]) -> str:
+    if len(words) == 1:
+        return f"{operator}:{words[0]}"
+    return f"{operator}:({' '.join(words)})"
+
+
+def build_gmail_query(text: str) -> str:
+    """
+    Turn a German search request into a Gmail query string.
+    Returns an empty string if the request contains nothing to search for.
+    """
+    if not text or not text.strip():
+        return ""
+    if _GMAIL_OPERATOR.search(text):
+        return text.strip()
+
+    lowered = text.lower()
+    terms = []
+
+    # Quoted phrases are searched as they are
+    for phrase in _QUOTED.findall(lowered):
+        terms.append(f'"{phrase.strip()}"')
+    lowered = _QUOTED.sub(' ', lowered)
+
+    for pattern, to_query in _TIME_PATTERNS:
+        match = pattern.search(lowered)
+        if match:
+            terms.append(to_query(match))
+            lowered = lowered[:match.start()] + ' ' + lowered[match.end():]
+            break
+
+    for pattern, operator in _FLAG_PATTERNS:
+        if pattern.search(lowered):
+            terms.append(operator)
+            lowered = pattern.sub(' ', lowered)
+
+    words = [word.strip('.,;:!?()') for word in lowered.split()]
+    words = [word for word in words if word]
+
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word in _FROM_WORDS or word in _TO_WORDS or word in _SUBJECT_WORDS:
+            j = i + 1
+            # Skip articles: "von der Bank", "zum Thema Urlaub", "mit dem Betreff Rechnung"
+            while j < len(words) and words[j] in _STOP_WORDS | {"thema", "betreff"}:
+                j += 1
+            collected = []
+            while j < len(words) and words[j] not in _BOUNDARY_WORDS:
+                collected.append(words[j])
+                j += 1
+            if collected:
+                if word in _FROM_WORDS:
+                    terms.append(_group("from", collected))
+                elif word in _TO_WORDS:
+                    terms.append(_group("to", collected))
+                else:
+                    terms.append(_group("subject", collected))
+            i = j
+            continue
+
+        if word not in _STOP_WORDS:
+            # "Annas Mails" -> from:anna
+            if word.endswith('s') and i + 1 < len(words) and words[i + 1] in {"mail", "mails", "e-mail", "e-mails", "nachricht", "nachrichten"}:
+                terms.append(f"from:{word[:-1]}")
+            else:
+                terms.append(word)
+        i += 1
+
+    return ' '.join(terms)
@@ -0,0 +1,265 @@
+"""
+Persistent on-disk cache of parsed Gmail messages.
+
+Message content (headers, cleaned body, snippet) never changes once a mail
+exists, so it is stored by message ID and reused across listings and
+restarts. Labels are the only mutable part and live in their own table, so
+relabeling a mail never invalidates its cached content.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class MessageCache:
+    """SQLite-backed message store with size-bounded LRU eviction"""
+    
+    DEFAULT_MAX_ENTRIES = 5000
+    QUERY_CHUNK_SIZE = 500
+    
+    CONTENT_FIELDS = ('sender', 'sender_name', 'subject', 'date', 'snippet', 'body', 'internal_date')
+    
+    def __init__(self, db_path: str, max_entries: Optional[int] = None):
+        self.db_path = db_path
+        self.max_entries = max_entries or int(os.getenv("GMAIL_MESSAGE_CACHE_SIZE", self.DEFAULT_MAX_ENTRIES))
+        
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        
+        # One connection shared by all threads, serialized by the lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        
+        # Notified after messages are stored or evicted (e.g. the mail index)
+        self._listeners: List[Any] = []
+        
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS messages (
+                    id TEXT PRIMARY KEY,
+                    sender TEXT,
+                    sender_name TEXT,
+                    subject TEXT,
+                    date TEXT,
+                    snippet TEXT,
+                    body TEXT,
+                    last_access REAL NOT NULL,
+                    internal_date INTEGER
+                )
+                """
+            )
+            # Caches created before messages carried their Gmail internalDate
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(messages)")]
+            if 'internal_date' not in columns:
+                self._conn.execute("ALTER TABLE messages ADD COLUMN internal_date INTEGER")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_last_access ON messages (last_access)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS labels (id TEXT PRIMARY KEY, label_ids TEXT NOT NULL)"
+            )
+    
+    def get_many(self, message_ids: List[str], require_body: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Return cached email dicts by message ID. Entries without a body are
+        skipped when require_body is set; otherwise they come back without a "body" key.
+        """
+        if not message_ids:
+            return {}
+        
+        found = {}
+        with self._lock, self._conn:
+            rows = []
+            # Stay below SQLite's limit on bound parameters per statement
+            for start in range(0, len(message_ids), self.QUERY_CHUNK_SIZE):
+                chunk = list(message_ids[start:start + self.QUERY_CHUNK_SIZE])
+                placeholders = ','.join('?' * len(chunk))
+                rows.extend(self._conn.execute(
+                    f"SELECT m.id, m.sender, m.sender_name, m.subject, m.date, m.snippet, m.body, l.label_ids, "
+                    f"m.internal_date "
+                    f"FROM messages m LEFT JOIN labels l ON l.id = m.id WHERE m.id IN ({placeholders})",
+                    chunk
+                ).fetchall())
+            
+            for row in rows:
+                msg_id, body, label_json = row[0], row[6], row[7]
+                if require_body and body is None:
+                    continue
+                
+                labels = json.loads(label_json) if label_json else []
+                email = {
+                    "id": msg_id,
+                    "sender": row[1],
+                    "sender_name": row[2],
+                    "subject": row[3],
+                    "snippet": row[5],
+                    "date": row[4],
+                    "internal_date": row[8],
+                    "labels": labels,
+                    "read": 'UNREAD' not in labels
+                }
+                if body is not None:
+                    email["body"] = body
+                found[msg_id] = email
+            
+            # Mark hits as recently used
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE messages SET last_access = ? WHERE id = ?",
+                [(now, msg_id) for msg_id in found]
+            )
+        
+        return found
+    
+    def get(self, message_id: str, require_body: bool = False) -> Optional[Dict[str, Any]]:
+        """Return a single cached email dict or None."""
+        return self.get_many([message_id], require_body=require_body).get(message_id)
+    
+    def get_body(self, message_id: str) -> Optional[str]:
+        """Return the cached body of a message, or None if it was never loaded."""
+        email = self.get(message_id, require_body=True)
+        return email["body"] if email else None
+    
+    def add_listener(self, listener: Any) -> None:
+        """
+        Register an object with on_messages_stored(emails), on_body_stored(message_id, body)
+        and on_messages_evicted(message_ids); it is called after each change, outside the lock.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+    
+    def iter_messages(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Yield all cached messages as email dicts (with "body" where loaded), without touching last_access."""
+        offset = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, sender, sender_name, subject, date, snippet, body, internal_date FROM messages "
+                    "ORDER BY rowid LIMIT ? OFFSET ?",
+                    (batch_size, offset)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                email = {"id": row[0]}
+                email.update(zip(self.CONTENT_FIELDS, row[1:]))
+                if email["body"] is None:
+                    del email["body"]
+                yield email
+            offset += len(rows)
+    
+    def put_many(self, emails: List[Dict[str, Any]]) -> None:
+        """
+        Store parsed email dicts. A missing "body" never overwrites a body that
+        is already cached; labels are stored separately.
+        """
+        if not emails:
+            return
+        
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO messages (id, sender, sender_name, subject, date, snippet, body, internal_date,
+                                      last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    sender = excluded.sender,
+                    sender_name = excluded.sender_name,
+                    subject = excluded.subject,
+                    date = excluded.date,
+                    snippet = excluded.snippet,
+                    body = COALESCE(excluded.body, messages.body),
+                    internal_date = COALESCE(excluded.internal_date, messages.internal_date),
+                    last_access = excluded.last_access
+                """,
+                [
+                    (email['id'],) + tuple(email.get(field) for field in self.CONTENT_FIELDS) + (now,)
+                    for email in emails
+                ]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO labels (id, label_ids) VALUES (?, ?)",
+                [(email['id'], json.dumps(email.get('labels', []))) for email in emails if 'labels' in email]
+            )
+            evicted_ids = self._evict()
+            listeners = list(self._listeners)
+        
+        for listener in listeners:
+            listener.on_messages_stored(emails)
+            if evicted_ids:
+                listener.on_messages_evicted(evicted_ids)
+    
+    def put(self, email: Dict[str, Any]) -> None:
+        """Store a single parsed email dict."""
+        self.put_many([email])
+    
+    def put_body(self, message_id: str, body: str) -> None:
+        """Attach a body to an already cached message (no-op for unknown IDs)."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE messages SET body = ?, last_access = ? WHERE id = ?",
+                (body, time.time(), message_id)
+            )
+            listeners = list(self._listeners)
+        
+        for listener in listeners:
+            listener.on_body_stored(message_id, body)
+    
+    def update_labels(self, message_id: str, add: Optional[List[str]] = None,
+                      remove: Optional[List[str]] = None) -> None:
+        """Apply a label change to a cached message without touching its content."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT label_ids FROM labels WHERE id = ?", (message_id,)).fetchone()
+            if row is None:
+                return
+            
+            labels = [label for label in json.loads(row[0]) if label not in (remove or [])]
+            labels.extend(label for label in (add or []) if label not in labels)
+            self._conn.execute("UPDATE labels SET label_ids = ? WHERE id = ?", (json.dumps(labels), message_id))
+    
+    def set_labels(self, message_id: str, label_ids: List[str]) -> None:
+        """Replace the cached labels of a message (no-op for unknown IDs)."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE labels SET label_ids = ? WHERE id = ?",
+                (json.dumps(label_ids), message_id)
+            )
+    
+    def _evict(self) -> List[str]:
+        """Drop the least recently used messages beyond max_entries and return their IDs (caller holds the lock)."""
+        count = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return []
+        
+        stale_ids = [
+            row[0] for row in self._conn.execute(
+                "SELECT id FROM messages ORDER BY last_access ASC LIMIT ?", (excess,)
+            )
+        ]
+        self._conn.executemany("DELETE FROM messages WHERE id = ?", [(msg_id,) for msg_id in stale_ids])
+        self._conn.executemany("DELETE FROM labels WHERE id = ?", [(msg_id,) for msg_id in stale_ids])
+        return stale_ids
+
+
+_caches: Dict[str, MessageCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_message_cache(token_path: str) -> MessageCache:
+    """Return the message cache for an account, stored next to its token file by default."""
+    with _caches_lock:
+        cache = _caches.get(token_path)
+        if cache is None:
+            db_path = os.getenv("GMAIL_MESSAGE_CACHE_PATH") or os.path.join(
+                os.path.dirname(token_path),
+                os.path.splitext(os.path.basename(token_path))[0] + "_messages.sqlite3"
+            )
+            cache = MessageCache(db_path)
+            _caches[token_path] = cache
+        return cache
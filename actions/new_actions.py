@@ -5,7 +5,6 @@ Replace your existing actions/new_actions.py with this file.
 import os
 import logging
 import requests
-import json
 from typing import Any, Text, Dict, List
 from datetime import datetime, timedelta
 from rasa_sdk import Action, Tracker
@@ -13,12 +12,11 @@ from rasa_sdk.events import SlotSet, FollowupAction
 from rasa_sdk.executor import CollectingDispatcher
 
 # Google Calendar imports
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from actions.credential_manager import get_credential_manager
+
 logger = logging.getLogger(__name__)
 
 class ActionOpenAIFallback(Action):
@@ -232,7 +230,6 @@ class ActionCreateMedicationReminder(Action):
         SCOPES = ['https://www.googleapis.com/auth/calendar']
         
         try:
-            creds = None
             token_path = os.path.join(
                 os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
                 "credentials",
@@ -244,47 +241,11 @@ class ActionCreateMedicationReminder(Action):
                 "gcal_credentials.json"
             )
             
-            # Ensure credentials directory exists
-            os.makedirs(os.path.dirname(token_path), exist_ok=True)
-            
-            # Load existing token
-            if os.path.exists(token_path):
-                try:
-                    with open(token_path, 'r') as token:
-                        creds = Credentials.from_authorized_user_info(
-                            json.load(token), SCOPES
-                        )
-                        logger.info("Loaded existing Google Calendar credentials")
-                except Exception as e:
-                    logger.error(f"Error loading existing token: {e}")
-            
-            # Refresh or get new credentials
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    try:
-                        creds.refresh(Request())
-                        logger.info("Refreshed Google Calendar credentials")
-                    except Exception as e:
-                        logger.error(f"Error refreshing token: {e}")
-                        creds = None
-                
-                if not creds:
-                    if not os.path.exists(credentials_path):
-                        logger.error(f"Google Calendar credentials file not found at {credentials_path}")
-                        return None
-                    
-                    try:
-                        flow = InstalledAppFlow.from_client_secrets_file(
-                            credentials_path, SCOPES)
-                        creds = flow.run_local_server(port=0)
-                        
-                        # Save the credentials
-                        with open(token_path, 'w') as token:
-                            json.dump(json.loads(creds.to_json()), token)
-                        logger.info("Created new Google Calendar credentials")
-                    except Exception as e:
-                        logger.error(f"Error during OAuth flow: {e}")
-                        return None
+            # The credential manager keeps the token in memory and refreshes it in the background
+            creds = get_credential_manager(token_path, SCOPES, credentials_path).get_credentials()
+            if not creds:
+                logger.error(f"No valid Google Calendar credentials (credentials file: {credentials_path})")
+                return None
             
             # Build and return the service
             service = build('calendar', 'v3', credentials=creds)
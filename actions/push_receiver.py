@@ -0,0 +1,200 @@
+"""
+Receiver for Gmail push notifications.
+
+Gmail publishes inbox changes to a Cloud Pub/Sub topic (users.watch), and a
+push subscription POSTs them to this receiver. Each notification triggers a
+history sync of the account's inbox mirror and warms the newest unread
+emails, bodies included, so ActionListEmails and the read actions can answer
+from memory. Locally, scripts/simulate_gmail_push.py posts the same payloads.
+
+The receiver runs in a daemon thread of the action server and is only
+started when GMAIL_PUSH_PORT is set.
+"""
+
+import os
+import json
+import base64
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from actions.email_client_pool import get_email_client
+from actions.inbox_sync import InboxSync, get_inbox_sync
+
+logger = logging.getLogger(__name__)
+
+# Gmail watches expire after 7 days; renew well before that
+WATCH_RENEWAL_SECONDS = 24 * 60 * 60
+
+
+def decode_notification(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extract the Gmail notification ({"emailAddress", "historyId"}) from a
+    Pub/Sub push body: {"message": {"data": <base64 JSON>, ...}, "subscription": ...}.
+    Raises ValueError for anything else.
+    """
+    try:
+        data = payload['message']['data']
+        notification = json.loads(base64.b64decode(data))
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Not a Gmail push notification: {e}")
+    
+    if 'historyId' not in notification:
+        raise ValueError("Notification without historyId")
+    return notification
+
+
+class PushReceiver:
+    """HTTP endpoint that turns push notifications into inbox syncs"""
+    
+    def __init__(self, inbox_sync: InboxSync, host: str = '127.0.0.1', port: int = 8085,
+                 verification_token: Optional[str] = None):
+        self.inbox_sync = inbox_sync
+        self.verification_token = verification_token
+        
+        # One worker: notifications that arrive during a sync are folded into the next one
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gmail-push")
+        self._sync_queued = False
+        self._queue_lock = threading.Lock()
+        
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+        self._watch_timer: Optional[threading.Timer] = None
+    
+    @property
+    def address(self):
+        return self._server.server_address
+    
+    def start(self) -> None:
+        """Serve in a daemon thread and let listings rely on the pushed state."""
+        self.inbox_sync.push_enabled = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="gmail-push-server", daemon=True)
+        self._thread.start()
+        logger.info(f"Gmail push receiver listening on {self.address[0]}:{self.address[1]}")
+        
+        # Build the mirror right away so the first listing is already served from memory
+        self._queue_sync(None)
+    
+    def stop(self) -> None:
+        self.inbox_sync.push_enabled = False
+        if self._watch_timer is not None:
+            self._watch_timer.cancel()
+        self._server.shutdown()
+        self._server.server_close()
+        self._executor.shutdown(wait=False)
+    
+    def watch(self, topic_name: str) -> None:
+        """Register the Gmail watch on topic_name and renew it daily."""
+        response = self.inbox_sync.client.watch_inbox(topic_name)
+        if response is None:
+            logger.error(f"Could not register Gmail watch on {topic_name}")
+        else:
+            logger.info(f"Gmail watch registered until {response.get('expiration')}")
+        
+        self._watch_timer = threading.Timer(WATCH_RENEWAL_SECONDS, self.watch, args=(topic_name,))
+        self._watch_timer.daemon = True
+        self._watch_timer.start()
+    
+    def handle_notification(self, notification: Dict[str, Any]) -> bool:
+        """Accept a decoded notification; returns False if it is for another account."""
+        email_address = notification.get('emailAddress')
+        known_address = self.inbox_sync.email_address
+        if email_address and known_address and email_address.lower() != known_address.lower():
+            logger.warning(f"Ignoring push notification for unknown account {email_address}")
+            return False
+        
+        self._queue_sync(str(notification['historyId']))
+        return True
+    
+    def _queue_sync(self, history_id: Optional[str]) -> None:
+        # Record the notified historyId right away so listings know the mirror is behind
+        if history_id is not None:
+            self.inbox_sync.mark_notified(history_id)
+        
+        with self._queue_lock:
+            if self._sync_queued:
+                return
+            self._sync_queued = True
+        self._executor.submit(self._run_sync)
+    
+    def _run_sync(self) -> None:
+        with self._queue_lock:
+            self._sync_queued = False
+        try:
+            self.inbox_sync.notify()
+        except Exception as e:
+            logger.error(f"Error syncing inbox after push notification: {e}")
+    
+    def _make_handler(self):
+        receiver = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if receiver.verification_token:
+                    token = parse_qs(urlparse(self.path).query).get('token', [None])[0]
+                    if token != receiver.verification_token:
+                        self.send_response(403)
+                        self.end_headers()
+                        return
+                
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    notification = decode_notification(json.loads(self.rfile.read(length)))
+                except ValueError as e:
+                    logger.warning(f"Rejected push request: {e}")
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                
+                receiver.handle_notification(notification)
+                
+                # Any 2xx acknowledges the message to Pub/Sub; the sync runs afterwards
+                self.send_response(204)
+                self.end_headers()
+            
+            def log_message(self, format, *args):
+                logger.debug("push receiver: " + format % args)
+        
+        return Handler
+
+
+_receiver: Optional[PushReceiver] = None
+
+
+def start_push_receiver_from_env() -> Optional[PushReceiver]:
+    """
+    Start the receiver for the default Gmail account if GMAIL_PUSH_PORT is set.
+    GMAIL_PUSH_HOST (default 127.0.0.1), GMAIL_PUSH_TOKEN (expected ?token=
+    query parameter) and GMAIL_PUBSUB_TOPIC (registers the Gmail watch) are optional.
+    """
+    global _receiver
+    
+    port = os.getenv("GMAIL_PUSH_PORT")
+    if not port or _receiver is not None:
+        return _receiver
+    
+    try:
+        client = get_email_client(
+            credentials_path=os.getenv("GMAIL_CREDENTIALS_PATH"),
+            token_path=os.getenv("GMAIL_TOKEN_PATH")
+        )
+        receiver = PushReceiver(
+            get_inbox_sync(client),
+            host=os.getenv("GMAIL_PUSH_HOST", "127.0.0.1"),
+            port=int(port),
+            verification_token=os.getenv("GMAIL_PUSH_TOKEN")
+        )
+        receiver.start()
+        
+        topic_name = os.getenv("GMAIL_PUBSUB_TOPIC")
+        if topic_name:
+            receiver.watch(topic_name)
+    except Exception as e:
+        logger.error(f"Could not start Gmail push receiver: {e}")
+        return None
+    
+    _receiver = receiver
+    return receiver
@@ -0,0 +1,115 @@
+"""
+Quota-aware rate limiting for Gmail API calls.
+
+Gmail meters usage in quota units per user, and each method costs a
+different number of units. Every account gets a token bucket holding quota
+units; each call reserves its cost up front, so callers queue in reservation
+order instead of behind a shared gate. Coroutines wait with asyncio.sleep.
+Sync callers wait in their own worker thread (actions hand blocking Gmail
+work to asyncio.to_thread); on a thread running an event loop, acquire
+refuses instead of stalling every conversation.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from typing import Dict, Optional
+
+# Quota units per Gmail API method (https://developers.google.com/gmail/api/reference/quota)
+GMAIL_QUOTA_UNITS = {
+    'getProfile': 1,
+    'watch': 100,
+    'stop': 50,
+    'history.list': 2,
+    'labels.list': 1,
+    'labels.get': 1,
+    'labels.create': 5,
+    'labels.update': 5,
+    'labels.delete': 5,
+    'messages.list': 5,
+    'messages.get': 5,
+    'messages.modify': 5,
+    'messages.trash': 5,
+    'messages.untrash': 5,
+    'messages.batchModify': 50,
+    'messages.batchDelete': 50,
+    'messages.send': 100,
+}
+
+DEFAULT_QUOTA_UNITS = 5
+
+
+def quota_units(method_id: Optional[str]) -> int:
+    """Return the quota cost of an API method given its discovery ID, e.g. 'gmail.users.messages.list'."""
+    if not method_id:
+        return DEFAULT_QUOTA_UNITS
+    method = method_id[len('gmail.users.'):] if method_id.startswith('gmail.users.') else method_id
+    return GMAIL_QUOTA_UNITS.get(method, DEFAULT_QUOTA_UNITS)
+
+
+def _on_event_loop() -> bool:
+    """Whether the calling thread is running an asyncio event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class QuotaRateLimiter:
+    """Token bucket of Gmail quota units for one account, usable from threads and asyncio"""
+
+    # Gmail allows 250 quota units per user per second
+    DEFAULT_UNITS_PER_SECOND = 250.0
+
+    def __init__(self, units_per_second: Optional[float] = None, burst: Optional[float] = None):
+        self.units_per_second = units_per_second or float(
+            os.getenv("GMAIL_QUOTA_UNITS_PER_SECOND", self.DEFAULT_UNITS_PER_SECOND)
+        )
+        self.burst = burst or self.units_per_second
+
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, units: float) -> float:
+        """Take units from the bucket and return how long the caller has to wait for them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.units_per_second)
+            self._updated = now
+
+            # The balance may go negative: later callers queue behind this reservation
+            self._tokens -= units
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.units_per_second
+
+    def acquire(self, units: float = DEFAULT_QUOTA_UNITS) -> None:
+        """Wait in the calling worker thread until units are available."""
+        if _on_event_loop():
+            raise RuntimeError("Blocking Gmail call on the event loop; run it in a worker thread or use acquire_async")
+        wait = self._reserve(units)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, units: float = DEFAULT_QUOTA_UNITS) -> None:
+        """Wait for units without blocking the event loop."""
+        wait = self._reserve(units)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+_limiters: Dict[str, QuotaRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(account_key: str) -> QuotaRateLimiter:
+    """Return the rate limiter for an account (keyed by its token path)."""
+    with _limiters_lock:
+        limiter = _limiters.get(account_key)
+        if limiter is None:
+            limiter = QuotaRateLimiter()
+            _limiters[account_key] = limiter
+        return limiter
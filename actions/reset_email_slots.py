@@ -23,5 +23,8 @@ class ActionResetEmailSlots(Action):
             SlotSet("email_response", None),
             SlotSet("review_option", None),
             SlotSet("user_input", None),
-            SlotSet("confirm_edited_draft", None)
+            SlotSet("confirm_edited_draft", None),
+            SlotSet("email_page_cursor", None),
+            SlotSet("email_list_more", False),
+            SlotSet("email_list_query", None)
         ]
\ No newline at end of file
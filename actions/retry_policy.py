@@ -0,0 +1,357 @@
+"""
+Retry policy for Gmail API calls.
+
+Rate limit answers (429, or 403 rateLimitExceeded) and transient server or
+connection errors are retried with exponential backoff and full jitter,
+honoring Retry-After, until the attempts or the per-call deadline run out.
+Calls that could have side effects twice (e.g. messages.send) are only
+retried when Gmail rejected them for rate limiting.
+
+Optionally, reads (get/list) that take longer than a latency percentile of
+their recent calls get a hedged duplicate request and the first answer wins.
+Retry and hedge counts are collected per account in RetryMetrics and logged
+every GMAIL_RETRY_METRICS_LOG_SECONDS; each retry and hedge is logged at
+debug level.
+
+Every attempt is bounded by what is left of the deadline: sync attempts run
+on a worker thread that the caller stops waiting for, async ones under
+asyncio.wait_for.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, NamedTuple, Optional
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+# Server errors worth another attempt; 429 and rate limited 403s are always retried
+RETRYABLE_STATUS_CODES = {500, 502, 503, 504}
+
+# Methods that must not run twice after a server or connection error
+NON_IDEMPOTENT_METHODS = {'messages.send', 'messages.insert', 'messages.import', 'labels.create', 'drafts.send'}
+
+
+class Failure(NamedTuple):
+    """What a client's classify function reports about a failed attempt"""
+    status: Optional[int]  # None for connection errors and timeouts
+    retry_after: Optional[float] = None
+    rate_limited: bool = False
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (seconds or an HTTP date) into seconds from now."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def classify_http_error(error: Exception) -> Optional[Failure]:
+    """Classify errors raised by googleapiclient requests; None for errors that are never retried."""
+    if isinstance(error, HttpError):
+        status = int(error.resp.status)
+        content = error.content or b''
+        rate_limited = status == 403 and (b'rateLimitExceeded' in content or b'userRateLimitExceeded' in content)
+        return Failure(status, parse_retry_after(error.resp.get('retry-after')), rate_limited)
+    if isinstance(error, (ConnectionError, TimeoutError, httplib2.HttpLib2Error)):
+        return Failure(None)
+    return None
+
+
+def _short_method(method_id: Optional[str]) -> str:
+    if not method_id:
+        return 'unknown'
+    return method_id[len('gmail.users.'):] if method_id.startswith('gmail.users.') else method_id
+
+
+def is_read_method(method_id: Optional[str]) -> bool:
+    """True for idempotent reads that may be hedged."""
+    return _short_method(method_id).rsplit('.', 1)[-1] in ('get', 'list', 'getProfile')
+
+
+class RetryMetrics:
+    """Thread-safe counters of calls, retries and hedges for one account"""
+
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, int]:
+        """Return a copy of all counters, e.g. {'calls': 120, 'retries': 3, 'retries.status_429': 2, ...}."""
+        with self._lock:
+            return dict(self._counts)
+
+    def summary(self) -> str:
+        """The counters as one log-friendly line, e.g. "calls=120 hedges=1 retries=3 ..."."""
+        return ' '.join(f"{name}={count}" for name, count in sorted(self.snapshot().items()))
+
+
+class RetryPolicy:
+    """Backoff, deadline and hedging settings for the Gmail calls of one account"""
+
+    DEFAULT_MAX_ATTEMPTS = 5
+    DEFAULT_DEADLINE_SECONDS = 30.0
+    BASE_DELAY_SECONDS = 0.5
+    MAX_DELAY_SECONDS = 16.0
+
+    # Hedge a read once it is slower than this percentile of its recent calls
+    DEFAULT_HEDGE_PERCENTILE = 95.0
+    HEDGE_MIN_SAMPLES = 20
+    LATENCY_WINDOW = 200
+
+    # Workers that run sync attempts and their hedges
+    MAX_WORKERS = 8
+
+    DEFAULT_METRICS_LOG_SECONDS = 300.0
+
+    def __init__(self, max_attempts: Optional[int] = None, deadline_seconds: Optional[float] = None,
+                 hedge_reads: Optional[bool] = None, hedge_percentile: Optional[float] = None,
+                 name: str = 'gmail'):
+        self.max_attempts = max_attempts or int(os.getenv("GMAIL_RETRY_MAX_ATTEMPTS", self.DEFAULT_MAX_ATTEMPTS))
+        self.deadline_seconds = deadline_seconds or float(
+            os.getenv("GMAIL_RETRY_DEADLINE_SECONDS", self.DEFAULT_DEADLINE_SECONDS)
+        )
+        if hedge_reads is None:
+            hedge_reads = os.getenv("GMAIL_HEDGE_READS", "").lower() in ("1", "true", "yes")
+        self.hedge_reads = hedge_reads
+        self.hedge_percentile = hedge_percentile or float(
+            os.getenv("GMAIL_HEDGE_PERCENTILE", self.DEFAULT_HEDGE_PERCENTILE)
+        )
+
+        self.name = name
+        self.metrics = RetryMetrics()
+        self.metrics_log_seconds = float(
+            os.getenv("GMAIL_RETRY_METRICS_LOG_SECONDS", self.DEFAULT_METRICS_LOG_SECONDS)
+        )
+        self._metrics_logged_at = time.monotonic()
+        self._metrics_log_lock = threading.Lock()
+
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._latency_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def should_retry(self, failure: Failure, method_id: Optional[str]) -> bool:
+        """Rate limiting is always retried; server and connection errors only for idempotent methods."""
+        if failure.rate_limited or failure.status == 429:
+            return True
+        if _short_method(method_id) in NON_IDEMPOTENT_METHODS:
+            return False
+        return failure.status is None or failure.status in RETRYABLE_STATUS_CODES
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff for the given (0-based) retry; Retry-After is a lower bound."""
+        delay = random.uniform(0, min(self.MAX_DELAY_SECONDS, self.BASE_DELAY_SECONDS * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def record_latency(self, method_id: Optional[str], seconds: float) -> None:
+        with self._latency_lock:
+            samples = self._latencies.get(_short_method(method_id))
+            if samples is None:
+                samples = deque(maxlen=self.LATENCY_WINDOW)
+                self._latencies[_short_method(method_id)] = samples
+            samples.append(seconds)
+
+    def hedge_delay(self, method_id: Optional[str]) -> Optional[float]:
+        """Seconds after which a read gets a hedged duplicate, or None if it should not be hedged."""
+        if not self.hedge_reads or not is_read_method(method_id):
+            return None
+        with self._latency_lock:
+            samples = sorted(self._latencies.get(_short_method(method_id), ()))
+        if len(samples) < self.HEDGE_MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))
+        return samples[index]
+
+    def retry_delay(self, failure: Optional[Failure], method_id: Optional[str],
+                    attempt: int, started: float) -> Optional[float]:
+        """
+        Return how long to sleep before retry number attempt + 1 of a call that
+        started at started (time.monotonic()), or None if it should not be retried.
+        """
+        if failure is None:
+            return None
+        if not self.should_retry(failure, method_id) or attempt + 1 >= self.max_attempts:
+            self.metrics.increment('failures')
+            return None
+
+        delay = self.backoff_delay(attempt, failure.retry_after)
+        if time.monotonic() - started + delay > self.deadline_seconds:
+            self.metrics.increment('failures')
+            self.metrics.increment('deadline_exceeded')
+            return None
+
+        self.metrics.increment('retries')
+        self.metrics.increment(f"retries.status_{failure.status or 'network'}")
+        self.metrics.increment(f"retries.{_short_method(method_id)}")
+        logger.debug(f"{self.name}: retrying {_short_method(method_id)} after "
+                     f"{failure.status or 'network error'} in {delay:.2f}s (attempt {attempt + 2})")
+        return delay
+
+    def log_metrics_if_due(self) -> None:
+        """Log the counters at info level once metrics_log_seconds have passed since the last time."""
+        now = time.monotonic()
+        with self._metrics_log_lock:
+            if now - self._metrics_logged_at < self.metrics_log_seconds:
+                return
+            self._metrics_logged_at = now
+        logger.info(f"{self.name} call metrics: {self.metrics.summary()}")
+
+    def run(self, send: Callable[[], Any], classify: Callable[[Exception], Optional[Failure]],
+            method_id: Optional[str] = None, hedge_send: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Call send() until it succeeds, retrying failures that classify() reports as
+        retryable. hedge_send, if given, runs the same read over a separate connection.
+        An attempt still running when the deadline is reached is left to finish in
+        the background and the call fails with TimeoutError.
+        """
+        started = time.monotonic()
+        attempt = 0
+        self.metrics.increment('calls')
+        self.log_metrics_if_due()
+        while True:
+            try:
+                remaining = self.deadline_seconds - (time.monotonic() - started)
+                return self._attempt(send, method_id, hedge_send, max(remaining, 0.001))
+            except Exception as error:
+                delay = self.retry_delay(classify(error), method_id, attempt, started)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    def _attempt(self, send: Callable[[], Any], method_id: Optional[str],
+                 hedge_send: Optional[Callable[[], Any]], timeout: float) -> Any:
+        hedge_after = self.hedge_delay(method_id) if hedge_send is not None else None
+        attempt_started = time.monotonic()
+        executor = self._get_executor()
+
+        primary = executor.submit(send)
+        done, _ = wait([primary], timeout=timeout if hedge_after is None else min(hedge_after, timeout))
+        if done:
+            self.record_latency(method_id, time.monotonic() - attempt_started)
+            return primary.result()
+        if hedge_after is None or hedge_after >= timeout:
+            raise self._timed_out(method_id, timeout)
+
+        self.metrics.increment('hedges')
+        logger.debug(f"{self.name}: hedging {_short_method(method_id)} after {hedge_after:.2f}s")
+        hedge = executor.submit(hedge_send)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            remaining = timeout - (time.monotonic() - attempt_started)
+            done, pending = wait(pending, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+            if not done:
+                raise self._timed_out(method_id, timeout)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.metrics.increment('hedges_won')
+                    self.record_latency(method_id, time.monotonic() - attempt_started)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="gmail-call")
+            return self._executor
+
+    def _timed_out(self, method_id: Optional[str], timeout: float) -> TimeoutError:
+        self.metrics.increment('attempt_timeouts')
+        return TimeoutError(f"{_short_method(method_id)} did not finish within {timeout:.1f}s")
+
+    async def run_async(self, send: Callable[[], Awaitable[Any]], classify: Callable[[Exception], Optional[Failure]],
+                        method_id: Optional[str] = None) -> Any:
+        """Coroutine version of run(); each attempt is also bounded by the remaining deadline."""
+        started = time.monotonic()
+        attempt = 0
+        self.metrics.increment('calls')
+        self.log_metrics_if_due()
+        while True:
+            try:
+                remaining = self.deadline_seconds - (time.monotonic() - started)
+                return await asyncio.wait_for(self._attempt_async(send, method_id), timeout=max(remaining, 0.001))
+            except Exception as error:
+                delay = self.retry_delay(classify(error), method_id, attempt, started)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _attempt_async(self, send: Callable[[], Awaitable[Any]], method_id: Optional[str]) -> Any:
+        hedge_after = self.hedge_delay(method_id)
+        attempt_started = time.monotonic()
+
+        primary = asyncio.ensure_future(send())
+        if hedge_after is None:
+            result = await primary
+            self.record_latency(method_id, time.monotonic() - attempt_started)
+            return result
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            self.record_latency(method_id, time.monotonic() - attempt_started)
+            return primary.result()
+
+        self.metrics.increment('hedges')
+        logger.debug(f"{self.name}: hedging {_short_method(method_id)} after {hedge_after:.2f}s")
+        hedge = asyncio.ensure_future(send())
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.metrics.increment('hedges_won')
+                        self.record_latency(method_id, time.monotonic() - attempt_started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+_policies: Dict[str, RetryPolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_retry_policy(account_key: str) -> RetryPolicy:
+    """Return the retry policy for an account (keyed by its token path)."""
+    with _policies_lock:
+        policy = _policies.get(account_key)
+        if policy is None:
+            policy = RetryPolicy(name=f"Gmail {os.path.basename(account_key) or account_key}")
+            _policies[account_key] = policy
+        return policy
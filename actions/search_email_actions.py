@@ -0,0 +1,177 @@
+"""
+Mailbox search: find emails beyond the unread listing with a Gmail query.
+
+Matches are listed newest first, a page at a time like the unread listing:
+"mehr" continues after the last match shown (email_page_cursor), with the
+query kept in email_list_query.
+"""
+from typing import Any, Text, Dict, List, Optional, Tuple
+from rasa_sdk import Action, Tracker
+from rasa_sdk.events import SlotSet
+from rasa_sdk.executor import CollectingDispatcher
+import asyncio
+import logging
+
+from actions.email_client_pool import get_async_email_client
+from actions.improved_email_actions import EMAIL_PAGE_SIZE, format_email_list, remember_emails
+from actions.inbox_sync import InboxSync
+from actions.mail_query import build_gmail_query
+
+logger = logging.getLogger(__name__)
+
+# Cached matches the mail index contributes to a page before they are merged with Gmail's
+LOCAL_SEARCH_LIMIT = 200
+
+# Most matches fetched from Gmail to fill one page after a cursor
+MAX_SEARCH_FETCH = 500
+
+
+def _order_key(email: Dict[Text, Any]) -> Tuple[int, Text]:
+    """Position of a match in the newest-first order: internalDate, then ID."""
+    return email.get('internal_date') or 0, email['id']
+
+
+def _cursor_key(cursor: Optional[Text]) -> Optional[Tuple[int, Text]]:
+    """The order key of the last match shown, from a cursor made by InboxSync.page_cursor."""
+    date, _, msg_id = str(cursor or '').partition(':')
+    if not msg_id:
+        return None
+    return (int(date) if date.isdigit() else 0), msg_id
+
+
+def merge_by_date(*result_lists: List[Dict[Text, Any]]) -> List[Dict[Text, Any]]:
+    """Combine result lists without duplicates, newest first by Gmail's internalDate."""
+    merged = {}
+    for results in result_lists:
+        for email in results:
+            merged.setdefault(email['id'], email)
+    return sorted(merged.values(), key=_order_key, reverse=True)
+
+
+class ActionSearchEmails(Action):
+    """Search the whole mailbox and list the matches like the inbox listing."""
+
+    def name(self) -> Text:
+        return "action_search_emails"
+
+    @staticmethod
+    def _search_locally(client, query: Text, limit: int) -> List[Dict[Text, Any]]:
+        """
+        Matches of the query among cached mail, from the mail index; [] if it can't
+        answer the query. Terms must match whole words, as they do in Gmail, so
+        no mail is listed that Gmail's query would not match. Blocking (SQLite),
+        so run it in a worker thread.
+        """
+        message_cache = client.client.message_cache
+        message_ids = client.client.mail_index.search(query, limit=limit, exact=True)
+        if not message_ids:
+            return []
+
+        cached = message_cache.get_many(message_ids)
+        return [
+            cached[msg_id] for msg_id in message_ids
+            if msg_id in cached and not {'TRASH', 'SPAM'} & set(cached[msg_id]['labels'])
+        ]
+
+    async def _load_page(self, query: Text, cursor: Optional[Text]) -> Tuple[List[Dict[Text, Any]], Optional[Text]]:
+        """
+        Return one page of matches after cursor, newest first, and the cursor of
+        the next page (None at the end). Gmail answers every search; the mail
+        index adds cached mail Gmail does not match under a folded spelling
+        ("mueller" for "Müller"), and both are merged by date.
+        """
+        after = _cursor_key(cursor)
+        gmail_query = query
+        # One extra match tells whether there is another page; after a cursor, mail
+        # from the same second as the last one shown comes back and is skipped
+        fetch = EMAIL_PAGE_SIZE + 1
+        if after is not None:
+            fetch += EMAIL_PAGE_SIZE
+            if after[0]:
+                gmail_query = f"{query} before:{after[0] // 1000 + 1}"
+
+        client = await get_async_email_client()
+        local_results, gmail_results = await asyncio.gather(
+            asyncio.to_thread(self._search_locally, client, query, LOCAL_SEARCH_LIMIT),
+            client.search_emails(gmail_query, max_results=fetch)
+        )
+        while True:
+            results = merge_by_date(gmail_results, local_results)
+            if after is not None:
+                results = [email for email in results if _order_key(email) < after]
+            # Many mails from the same second can fill the fetched matches; look further
+            if len(results) > EMAIL_PAGE_SIZE or len(gmail_results) < fetch or fetch >= MAX_SEARCH_FETCH:
+                break
+            fetch = min(fetch * 2, MAX_SEARCH_FETCH)
+            gmail_results = await client.search_emails(gmail_query, max_results=fetch)
+
+        if len(results) <= EMAIL_PAGE_SIZE:
+            return results, None
+        page = results[:EMAIL_PAGE_SIZE]
+        return page, InboxSync.page_cursor(page[-1])
+
+    async def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+        """
+        Turn the user's request ("Mails von Anna letzte Woche") into a Gmail query
+        and store the first page of matches in the emails slot, or, after "mehr",
+        the page after the matches shown.
+        """
+        # "mehr" on a search result list continues that search
+        list_query = tracker.get_slot("email_list_query")
+        cursor = tracker.get_slot("email_page_cursor") if tracker.get_slot("email_list_more") and list_query else None
+
+        try:
+            if cursor:
+                query = list_query
+            else:
+                query = build_gmail_query(tracker.latest_message.get("text") or "")
+            if not query:
+                dispatcher.utter_message(
+                    text="Wonach soll ich suchen? Sagen Sie zum Beispiel \"Mails von Anna letzte Woche\" "
+                         "oder \"E-Mails mit Anhang zum Thema Rechnung\"."
+                )
+                return [SlotSet("email_search_query", None), SlotSet("email_count", 0)]
+
+            logger.info(f"Searching emails with query: {query}")
+
+            results, next_cursor = await self._load_page(query, cursor)
+
+            if not results:
+                if cursor:
+                    dispatcher.utter_message(text="Es gibt keine weiteren Treffer zu Ihrer Suche.")
+                    return [SlotSet("email_list_more", False), SlotSet("email_page_cursor", None)]
+                dispatcher.utter_message(text=f"Ich habe keine E-Mails gefunden, die zu Ihrer Suche passen ({query}).")
+                return [SlotSet("email_search_query", None), SlotSet("email_count", 0)]
+
+            if cursor:
+                email_list = f"Hier sind weitere E-Mails zu Ihrer Suche ({query}):\n\n"
+            else:
+                email_list = f"Hier sind die E-Mails zu Ihrer Suche ({query}):\n\n"
+            email_list += format_email_list(results)
+            if next_cursor:
+                email_list += "Es gibt weitere Treffer. Sagen Sie \"mehr\", um sie zu sehen."
+
+            dispatcher.utter_message(text=email_list)
+
+            return [
+                # Only a new search starts the search flow; further pages stay in the listing
+                SlotSet("email_search_query", None if cursor else query),
+                remember_emails(tracker, results),
+                SlotSet("email_count", len(results)),
+                SlotSet("current_email_index", 0),
+                SlotSet("selected_email", None),
+                SlotSet("email_page_cursor", next_cursor),
+                SlotSet("email_list_more", False),
+                SlotSet("email_list_query", query)
+            ]
+
+        except Exception as e:
+            logger.error(f"Error searching emails: {e}")
+            dispatcher.utter_message(
+                text="Ich habe Probleme beim Durchsuchen Ihrer E-Mails. Bitte überprüfen Sie Ihre Internetverbindung und die E-Mail-Authentifizierung."
+            )
+            if cursor:
+                return [SlotSet("email_list_more", False)]
+            return [SlotSet("email_search_query", None), SlotSet("email_count", 0)]
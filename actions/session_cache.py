@@ -0,0 +1,131 @@
+"""
+Per-conversation cache of the email records behind the emails slot.
+
+The slot only carries the message IDs of the listed mails; the parsed
+records stay on the action server, keyed by conversation (the tracker's
+sender_id), and are dropped after EMAIL_SESSION_TTL_SECONDS without use.
+Records that are no longer here (expired, action server restarted) are
+loaded again through the message cache by the caller. Bodies rendered for
+display (by the reading actions or ahead of time by the prefetcher) are
+kept next to the records.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class _Session:
+    __slots__ = ('last_used', 'records', 'rendered')
+
+    def __init__(self, now: float):
+        self.last_used = now
+        # message ID -> record, and message ID -> (body, rendered body)
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.rendered: Dict[str, Tuple[str, str]] = {}
+
+
+def _bound(entries: Dict[str, Any], limit: int) -> None:
+    """Drop the oldest entries of an insertion-ordered dict beyond limit."""
+    while len(entries) > limit:
+        del entries[next(iter(entries))]
+
+
+class SessionCache:
+    """Email records per conversation with an idle TTL and a bound on conversations"""
+
+    DEFAULT_TTL_SECONDS = 1800.0
+    DEFAULT_MAX_SESSIONS = 1000
+
+    # Listings replace each other, so a conversation never needs many records
+    MAX_RECORDS_PER_SESSION = 200
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_sessions: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(
+            os.getenv("EMAIL_SESSION_TTL_SECONDS", self.DEFAULT_TTL_SECONDS)
+        )
+        self.max_sessions = max_sessions or int(os.getenv("EMAIL_SESSION_MAX", self.DEFAULT_MAX_SESSIONS))
+
+        # conversation ID -> session, least recently used first
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, conversation_id: str, emails: Iterable[Dict[str, Any]]) -> None:
+        """Store email records for a conversation, keeping records stored earlier."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            records = self._touch(conversation_id, now).records
+            for email in emails:
+                records.pop(email['id'], None)
+                records[email['id']] = email
+            _bound(records, self.MAX_RECORDS_PER_SESSION)
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def get(self, conversation_id: str, message_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Return the cached records among message_ids as a dict of message ID ->
+        record. The records are shared and must not be modified.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if conversation_id not in self._sessions:
+                return {}
+            records = self._touch(conversation_id, now).records
+            return {msg_id: records[msg_id] for msg_id in message_ids if msg_id in records}
+
+    def put_rendered(self, conversation_id: str, message_id: str, body: str, rendered: str) -> None:
+        """Store the body of a message and its display rendering for a conversation."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            rendered_bodies = self._touch(conversation_id, now).rendered
+            rendered_bodies.pop(message_id, None)
+            rendered_bodies[message_id] = (body, rendered)
+            _bound(rendered_bodies, self.MAX_RECORDS_PER_SESSION)
+
+    def get_rendered(self, conversation_id: str, message_id: str) -> Optional[Tuple[str, str]]:
+        """Return (body, rendered body) of a message, or None if it was not rendered for the conversation."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if conversation_id not in self._sessions:
+                return None
+            return self._touch(conversation_id, now).rendered.get(message_id)
+
+    def clear(self, conversation_id: str) -> None:
+        """Forget the records of a conversation."""
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+
+    def _touch(self, conversation_id: str, now: float) -> _Session:
+        """Mark a conversation as used, creating it if needed (caller holds the lock)."""
+        session = self._sessions.pop(conversation_id, None) or _Session(now)
+        session.last_used = now
+        self._sessions[conversation_id] = session
+        return session
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            conversation_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.ttl_seconds:
+                break
+            del self._sessions[conversation_id]
+
+
+_session_cache: Optional[SessionCache] = None
+_session_cache_lock = threading.Lock()
+
+
+def get_session_cache() -> SessionCache:
+    """Return the process-wide session cache."""
+    global _session_cache
+    with _session_cache_lock:
+        if _session_cache is None:
+            _session_cache = SessionCache()
+        return _session_cache
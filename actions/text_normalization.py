@@ -0,0 +1,48 @@
+"""
+Linear-time normalization of email bodies.
+
+Shared by the Gmail client and the read actions. Bodies are cleaned line by
+line with plain string operations instead of regexes like \\n\\s*\\n\\s*\\n+,
+whose \\s also matches newlines and backtracks on long whitespace runs.
+"""
+
+# Invisible characters that newsletters use as preheader padding
+ZERO_WIDTH_CHARS = '\u034f\u200b\u200c\u200d\u200e\u200f\u2060\ufeff'
+
+_ZERO_WIDTH_TABLE = str.maketrans('', '', ZERO_WIDTH_CHARS)
+
+
+def normalize_body(body: str) -> str:
+    """
+    Clean an email body in a single pass over its lines: unify line endings,
+    remove zero-width characters, squeeze runs of spaces and tabs, and
+    collapse consecutive blank (or whitespace-only) lines into one.
+    """
+    if not body:
+        return ""
+
+    text = body.replace('\r\n', '\n').replace('\r', '\n').translate(_ZERO_WIDTH_TABLE)
+
+    lines = []
+    previous_blank = True  # Also drops leading blank lines
+    for line in text.split('\n'):
+        squeezed = ' '.join(line.split())
+        if not squeezed:
+            if not previous_blank:
+                lines.append('')
+            previous_blank = True
+            continue
+        lines.append(squeezed)
+        previous_blank = False
+
+    if lines and lines[-1] == '':
+        lines.pop()
+
+    return '\n'.join(lines)
+
+
+def truncate_for_display(text: str, max_chars: int, notice: str) -> str:
+    """Cut text after max_chars characters and append a notice when something was cut."""
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + notice
@@ -0,0 +1,118 @@
+"""
+Compare how many conversations one action server process serves concurrently
+with blocking Gmail calls versus the asyncio client.
+
+A local HTTP server stands in for Gmail and answers messages.modify after a
+fixed latency. "blocking" runs the call through googleapiclient inside the
+coroutine, the way a sync Action.run is executed on the action server's event
+loop; "async" sends it with AsyncEmailClient. Each conversation marks one
+mail as read.
+
+Usage:
+    python scripts/benchmark_async_actions.py
+    python scripts/benchmark_async_actions.py --latency 0.1 --conversations 1 10 50 100
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+
+from aiohttp import web
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.async_email_client import AsyncEmailClient  # noqa: E402
+from actions.message_cache import MessageCache  # noqa: E402
+from actions.rate_limiter import QuotaRateLimiter  # noqa: E402
+from actions.retry_policy import RetryPolicy  # noqa: E402
+
+
+class BenchmarkAccount:
+    """The parts of ImprovedEmailClient that AsyncEmailClient uses, without a real account"""
+
+    user_id = 'me'
+
+    def __init__(self, cache_dir: str):
+        self.credentials = Credentials(token='benchmark')
+        self.rate_limiter = QuotaRateLimiter(units_per_second=1e9)
+        self.retry_policy = RetryPolicy(max_attempts=1)
+        self.message_cache = MessageCache(os.path.join(cache_dir, 'messages.sqlite3'))
+
+    def ensure_connected(self) -> bool:
+        return True
+
+
+def start_fake_gmail(latency: float) -> str:
+    """Serve messages.modify with the given latency in a background thread; returns the base URL."""
+    async def modify(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        return web.json_response({'id': request.match_info['id'], 'labelIds': ['INBOX']})
+
+    app = web.Application()
+    app.router.add_post('/gmail/v1/users/{user}/messages/{id}/modify', modify)
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = runner.addresses[0][1]
+
+    threading.Thread(target=loop.run_forever, name="fake-gmail", daemon=True).start()
+    return f"http://127.0.0.1:{port}/"
+
+
+async def run_blocking(base_url: str, conversations: int) -> float:
+    service = build('gmail', 'v1', credentials=Credentials(token='benchmark'),
+                    static_discovery=True, client_options={'api_endpoint': base_url})
+
+    async def conversation(i: int) -> None:
+        # A sync action: the HTTP call holds the event loop until Gmail answers
+        service.users().messages().modify(userId='me', id=f'm{i}', body={'removeLabelIds': ['UNREAD']}).execute()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(i) for i in range(conversations)))
+    return time.perf_counter() - started
+
+
+async def run_async(base_url: str, conversations: int, cache_dir: str) -> float:
+    client = AsyncEmailClient(BenchmarkAccount(cache_dir))
+    client.API_ROOT = f"{base_url}gmail/v1/users"
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(client.mark_as_read(f'm{i}') for i in range(conversations)))
+    elapsed = time.perf_counter() - started
+    await client.close()
+
+    if not all(results):
+        raise RuntimeError("Some calls failed against the fake Gmail server")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent conversations with blocking vs. asyncio Gmail calls")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated Gmail latency in seconds")
+    parser.add_argument("--conversations", type=int, nargs="+", default=[1, 10, 50, 100],
+                        help="Numbers of simultaneous conversations to measure")
+    args = parser.parse_args()
+
+    base_url = start_fake_gmail(args.latency)
+    cache_dir = tempfile.mkdtemp(prefix="gmail-benchmark-")
+
+    print(f"Gmail latency {args.latency * 1000:.0f} ms")
+    print(f"{'conversations':>13}  {'blocking':>18}  {'async':>18}")
+    for conversations in args.conversations:
+        blocking = asyncio.run(run_blocking(base_url, conversations))
+        non_blocking = asyncio.run(run_async(base_url, conversations, cache_dir))
+        print(f"{conversations:>13}  {blocking:>7.2f} s {conversations / blocking:>6.1f}/s"
+              f"  {non_blocking:>7.2f} s {conversations / non_blocking:>6.1f}/s")
+
+
+if __name__ == "__main__":
+    main()
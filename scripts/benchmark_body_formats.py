@@ -0,0 +1,154 @@
+"""
+Compare the two ways ImprovedEmailClient gets a message body: format='raw'
+parsed with actions.mime_parser (the default) and GMAIL_BODY_FORMAT=full,
+whose JSON payload tree is walked by _extract_from_parts.
+
+Each case is one RFC 822 message. Its 'full' resource is derived from it the
+way Gmail builds one: transfer encodings are undone, but the part data stays
+in its declared charset, and attachment data is left out. Both resources go
+through _parse_message; the time per mail and whether the body equals the
+expected text are reported for each path. Fetching and JSON-decoding the
+resources is not included, and the client's decoding errors are silenced.
+
+Usage:
+    python scripts/benchmark_body_formats.py
+    python scripts/benchmark_body_formats.py --repeat 200
+"""
+
+import io
+import os
+import sys
+import time
+import base64
+import quopri
+import argparse
+import contextlib
+from email import message_from_bytes, policy
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.improved_email_client import ImprovedEmailClient  # noqa: E402
+from actions.text_normalization import normalize_body  # noqa: E402
+
+HEADERS = (
+    "From: Stadtwerke <rechnung@stadtwerke.example>\r\n"
+    "Subject: Ihre Rechnung\r\n"
+    "Date: Mon, 04 Mar 2024 09:15:00 +0100\r\n"
+    "MIME-Version: 1.0\r\n"
+)
+TEXT = "Sehr geehrte Frau Müller,\n\nanbei Ihre Rechnung über 12,50 €.\n\nMit freundlichen Grüßen"
+HTML = "<p>Sehr geehrte Frau Müller,</p><p>anbei Ihre Rechnung über 12,50 €.</p><p>Mit freundlichen Grüßen</p>"
+
+
+def part(content_type: str, body: bytes, encoding: str = '8bit', disposition: str = '') -> bytes:
+    headers = f"Content-Type: {content_type}\r\nContent-Transfer-Encoding: {encoding}\r\n{disposition}\r\n"
+    return headers.encode() + body + b"\r\n"
+
+
+def multipart(subtype: str, *parts: bytes) -> bytes:
+    body = f'Content-Type: multipart/{subtype}; boundary="b-{subtype}"\r\n\r\n'.encode()
+    for child in parts:
+        body += f"--b-{subtype}\r\n".encode() + child
+    return body + f"--b-{subtype}--\r\n".encode()
+
+
+def cases() -> Dict[str, bytes]:
+    plain = part("text/plain; charset=utf-8", TEXT.encode('utf-8'))
+    html = part("text/html; charset=utf-8", HTML.encode('utf-8'))
+    attachment = part("application/pdf", base64.encodebytes(os.urandom(3 * 1024 * 1024)), 'base64',
+                      'Content-Disposition: attachment; filename="rechnung.pdf"\r\n')
+    newsletter = "<html><head><style>" + "p{color:red}" * 20000 + "</style></head><body>" + HTML + "</body></html>"
+    return {
+        "utf-8 plain": plain,
+        "quoted-printable": part("text/plain; charset=utf-8", quopri.encodestring(TEXT.encode('utf-8')), 'quoted-printable'),
+        "latin-1 plain": part("text/plain; charset=iso-8859-1", TEXT.replace("€", "EUR").encode('latin-1')),
+        "equals sign": part("text/plain; charset=utf-8", (TEXT + "\nSumme=12 Euro").encode('utf-8')),
+        "alternative": multipart("alternative", plain, html),
+        "html only": html,
+        "3 MB attachment": multipart("mixed", multipart("alternative", plain, html), attachment),
+        "250 kB newsletter": part("text/html; charset=utf-8", newsletter.encode('utf-8')),
+    }
+
+
+def expected_body(name: str) -> str:
+    if name == "latin-1 plain":
+        return normalize_body(TEXT.replace("€", "EUR"))
+    if name == "equals sign":
+        return normalize_body(TEXT + "\nSumme=12 Euro")
+    return normalize_body(TEXT)
+
+
+def gmail_payload(message) -> Dict[str, Any]:
+    """The 'full' payload tree Gmail returns for a parsed message"""
+    payload = {
+        'mimeType': message.get_content_type(),
+        'filename': message.get_filename() or '',
+        'headers': [{'name': name, 'value': str(value)} for name, value in message.items()],
+    }
+    if message.is_multipart():
+        payload['body'] = {'size': 0}
+        payload['parts'] = [gmail_payload(child) for child in message.get_payload()]
+        return payload
+
+    data = message.get_payload(decode=True) or b''
+    if payload['filename']:
+        payload['body'] = {'size': len(data), 'attachmentId': 'attachment'}
+    else:
+        payload['body'] = {'size': len(data), 'data': base64.urlsafe_b64encode(data).decode()}
+    return payload
+
+
+def resources(source: bytes) -> Dict[str, Dict[str, Any]]:
+    common = {'id': 'bench', 'snippet': 'Sehr geehrte Frau Müller', 'internalDate': '1709540100000',
+              'labelIds': ['INBOX']}
+    return {
+        'raw': dict(common, raw=base64.urlsafe_b64encode(source).decode()),
+        'full': dict(common, payload=gmail_payload(message_from_bytes(source, policy=policy.default))),
+    }
+
+
+class _NoCache:
+    """Stands in for the message cache so every run parses the body again"""
+
+    def get_body(self, message_id):
+        return None
+
+    def put_body(self, message_id, body):
+        pass
+
+
+def offline_client() -> ImprovedEmailClient:
+    """A client with the parsing settings of ImprovedEmailClient, without credentials or caches"""
+    client = ImprovedEmailClient.__new__(ImprovedEmailClient)
+    client.max_part_bytes = ImprovedEmailClient.DEFAULT_MAX_PART_BYTES
+    client.html_text_max_chars = ImprovedEmailClient.DEFAULT_HTML_TEXT_MAX_CHARS
+    client.message_cache = _NoCache()
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Body extraction: format=raw + mime_parser vs. format=full payload walk")
+    parser.add_argument("--repeat", type=int, default=50, help="Runs per case; the fastest one is reported")
+    args = parser.parse_args()
+
+    client = offline_client()
+    print(f"{'case':>18}  {'raw':>10}  {'match':>5}  {'full':>10}  {'match':>5}")
+    for name, body in cases().items():
+        source = HEADERS.encode() + body
+        expected = expected_body(name)
+        row = f"{name:>18}"
+        for message in resources(source).values():
+            timings = []
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    email = client._parse_message(message)
+                    timings.append(time.perf_counter() - started)
+            match = "yes" if email['body'] == expected else "no"
+            row += f"  {min(timings) * 1e6:>7.0f} us  {match:>5}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Compare the ways of scoring a mail against the category keywords.
+
+"find" is the per-keyword scan KeywordCategorizer uses for small keyword
+sets (one C-level substring search per keyword), "regex" the trie-shaped
+pattern it compiles for large sets, and "aho-corasick" a pure-Python
+Aho-Corasick automaton. All three count overlapping occurrences and return
+the same scores, which is checked before timing.
+
+The keyword sets are the default table and the default table padded with
+generated keywords that rarely occur; the mails are German filler text with
+keywords sprinkled in.
+
+Usage:
+    python scripts/benchmark_keyword_categorizer.py
+    python scripts/benchmark_keyword_categorizer.py --keywords 50 150 1000 --mails 2000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from collections import deque
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions import keyword_categorizer  # noqa: E402
+from actions.keyword_categorizer import DEFAULT_CATEGORY_KEYWORDS, KeywordCategorizer  # noqa: E402
+
+FILLER = ("sehr geehrte damen und herren anbei erhalten sie die unterlagen zu ihrer anfrage "
+          "mit freundlichen grüßen ihr team bei fragen stehen wir gerne zur verfügung ").split()
+
+
+class AhoCorasick:
+    """Textbook Aho-Corasick automaton with dict transitions"""
+
+    def __init__(self, keyword_categories: Dict[str, List[str]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[str]] = [[]]
+        for keyword, categories in keyword_categories.items():
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].extend(categories)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def scores(self, text: str) -> Dict[str, int]:
+        goto, fail, output = self.goto, self.fail, self.output
+        scores: Dict[str, int] = {}
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for category in output[state]:
+                scores[category] = scores.get(category, 0) + 1
+        return scores
+
+
+def keyword_table(count: int, rng: random.Random) -> Dict[str, List[str]]:
+    """The default table, padded round-robin with generated keywords up to count keywords"""
+    table = {category: list(keywords) for category, keywords in DEFAULT_CATEGORY_KEYWORDS.items()}
+    categories = list(table)
+    total = sum(len(keywords) for keywords in table.values())
+    while total < count:
+        word = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyzäöü') for _ in range(rng.randint(5, 12)))
+        table[categories[total % len(categories)]].append(word)
+        total += 1
+    return table
+
+
+def make_mails(table: Dict[str, List[str]], count: int, words: int, rng: random.Random) -> List[str]:
+    keywords = [keyword for keywords in table.values() for keyword in keywords]
+    mails = []
+    for _ in range(count):
+        text = [rng.choice(FILLER) for _ in range(words)]
+        for _ in range(rng.randint(0, 5)):
+            text[rng.randrange(words)] = rng.choice(keywords)
+        mails.append(' '.join(text))
+    return mails
+
+
+def categorizer(table: Dict[str, List[str]], automaton: bool) -> KeywordCategorizer:
+    """Build a categorizer forced onto one of its two scan paths"""
+    threshold = keyword_categorizer.AUTOMATON_MIN_KEYWORDS
+    keyword_categorizer.AUTOMATON_MIN_KEYWORDS = 0 if automaton else sys.maxsize
+    try:
+        return KeywordCategorizer(table)
+    finally:
+        keyword_categorizer.AUTOMATON_MIN_KEYWORDS = threshold
+
+
+def per_mail(scores, mails: List[str], repeat: int) -> float:
+    """Fastest of repeat runs over all mails, in microseconds per mail"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for mail in mails:
+            scores(mail)
+        timings.append(time.perf_counter() - started)
+    return min(timings) / len(mails) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyword scoring: per-keyword find vs. trie regex vs. Aho-Corasick")
+    parser.add_argument("--keywords", type=int, nargs="+", default=[50, 150, 500, 1000],
+                        help="Keyword set sizes; the default table has about 50")
+    parser.add_argument("--words", type=int, nargs="+", default=[20, 700],
+                        help="Mail lengths in words (a subject line, about 4 KB of body)")
+    parser.add_argument("--mails", type=int, default=1000, help="Mails per measurement")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the fastest one is reported")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'keywords':>8}  {'words':>6}  {'find':>10}  {'regex':>10}  {'aho-corasick':>12}")
+    for count in args.keywords:
+        rng = random.Random(args.seed)
+        table = keyword_table(count, rng)
+        find = categorizer(table, automaton=False)
+        regex = categorizer(table, automaton=True)
+        aho = AhoCorasick(find._keyword_categories)
+
+        for words in args.words:
+            mails = make_mails(table, args.mails, words, rng)
+            for mail in mails[:100]:
+                expected = find.scores(mail)
+                if regex.scores(mail) != expected or aho.scores(mail) != expected:
+                    raise SystemExit(f"Scores differ for: {mail[:80]}")
+
+            timings = [per_mail(scan.scores, mails, args.repeat) for scan in (find, regex, aho)]
+            print(f"{count:>8}  {words:>6}  {timings[0]:>7.1f} us  {timings[1]:>7.1f} us  {timings[2]:>9.1f} us")
+
+
+if __name__ == "__main__":
+    main()
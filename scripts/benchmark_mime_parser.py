@@ -0,0 +1,94 @@
+"""
+Measure how long parsing a raw Gmail message and picking its body part takes
+for ordinary and hostile MIME structures.
+
+Each case is parsed with parse_raw and, unless the parse is rejected, its
+body part is picked with get_text_body under the client's default limits.
+"Rejected" cases are refused before the stdlib parser sees them, and their
+headers are read with parse_raw_headers instead.
+
+Usage:
+    python scripts/benchmark_mime_parser.py
+    python scripts/benchmark_mime_parser.py --repeat 20
+"""
+
+import os
+import sys
+import time
+import base64
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.mime_parser import MimeLimitError, get_text_body, parse_raw, parse_raw_headers  # noqa: E402
+
+HEADERS = (
+    b"From: Benchmark <benchmark@example.com>\r\n"
+    b"Subject: Benchmark\r\n"
+    b"Date: Mon, 04 Mar 2024 09:15:00 +0100\r\n"
+    b"MIME-Version: 1.0\r\n"
+)
+PLAIN = b"Content-Type: text/plain; charset=utf-8\r\n\r\nHallo Welt\r\n"
+HTML = b"Content-Type: text/html; charset=utf-8\r\n\r\n<p>Hallo Welt</p>\r\n"
+
+MAX_PART_BYTES = 1024 * 1024
+
+
+def multipart(boundary: str, *parts: bytes, subtype: str = 'mixed') -> bytes:
+    body = f'Content-Type: multipart/{subtype}; boundary="{boundary}"\r\n\r\n'.encode()
+    for part in parts:
+        body += f"--{boundary}\r\n".encode() + part
+    return body + f"--{boundary}--\r\n".encode()
+
+
+def nested(levels: int) -> bytes:
+    body = PLAIN
+    for level in range(levels, 0, -1):
+        body = multipart(f"b{level}", body)
+    return body
+
+
+def cases():
+    attachment = (b"Content-Type: application/pdf\r\nContent-Transfer-Encoding: base64\r\n"
+                  b'Content-Disposition: attachment; filename="r.pdf"\r\n\r\n'
+                  + base64.encodebytes(os.urandom(3 * 1024 * 1024)))
+    return {
+        "alternative": multipart("alt", PLAIN, HTML, subtype='alternative'),
+        "3 MB attachment": multipart("top", multipart("alt", PLAIN, HTML, subtype='alternative'), attachment),
+        "5000 flat parts": multipart("top", *([b"Content-Type: application/octet-stream\r\n\r\nx\r\n"] * 5000), PLAIN),
+        "nested 50": nested(50),
+        "nested 200": nested(200),
+        "nested 1000": nested(1000),
+        "oversized plain": multipart("alt", b"Content-Type: text/plain\r\n\r\n" + b"x" * (2 * MAX_PART_BYTES) + b"\r\n",
+                                     HTML, subtype='alternative'),
+    }
+
+
+def measure(raw: str) -> str:
+    try:
+        message = parse_raw(raw)
+    except MimeLimitError:
+        parse_raw_headers(raw)
+        return "rejected"
+    body, is_html = get_text_body(message, max_part_bytes=MAX_PART_BYTES)
+    return "html" if is_html else ("plain" if body else "no text")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse time of raw messages with ordinary and hostile MIME structures")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case; the fastest one is reported")
+    args = parser.parse_args()
+
+    print(f"{'case':>16}  {'size':>9}  {'result':>8}  {'time':>10}")
+    for name, source in cases().items():
+        raw = base64.urlsafe_b64encode(HEADERS + source).decode()
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = measure(raw)
+            timings.append(time.perf_counter() - started)
+        print(f"{name:>16}  {len(source) / 1024:>6.0f} kB  {result:>8}  {min(timings) * 1000:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
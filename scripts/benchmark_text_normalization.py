@@ -0,0 +1,68 @@
+"""
+Compare normalize_body with the regex pipeline it replaced on inputs that
+make whitespace regexes backtrack.
+
+"regex" is the former ImprovedEmailClient._clean_body: \n\s*\n\s*\n+ for
+blank lines, then zero-width characters, runs of spaces and line endings,
+each in its own pass. "linear" is actions.text_normalization.normalize_body.
+
+Usage:
+    python scripts/benchmark_text_normalization.py
+    python scripts/benchmark_text_normalization.py --sizes 10000 100000 1000000 --repeat 3
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.text_normalization import normalize_body  # noqa: E402
+
+INPUTS = {
+    "newsletter": lambda size: ("Hallo Welt,  hier ist der Text.\r\n\r\n\r\n \u200c\u034f" * (size // 40)),
+    "whitespace run": lambda size: "\n\n" + " " * size + "x",
+    "tabs and newlines": lambda size: "\n \t" * (size // 3) + "x",
+    "two newlines per run": lambda size: ("\n" + " " * 50 + "\n" + " " * 50 + "x") * (size // 103),
+    "carriage returns": lambda size: "\r" * size + "x",
+    "zero-width padding": lambda size: ("\u200c\u034f " * (size // 3)) + "x",
+}
+
+
+def regex_clean(body: str) -> str:
+    cleaned = re.sub(r'\n\s*\n\s*\n+', '\n\n', body)
+    cleaned = re.sub(r'[\u034f\u200c\u200b\u200d\u200e\u200f]+', '', cleaned)
+    cleaned = re.sub(r'[ \t]+', ' ', cleaned)
+    cleaned = cleaned.replace('\r\n', '\n').replace('\r', '\n')
+    return cleaned.strip()
+
+
+def fastest(function, body: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(body)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="normalize_body vs. the former regex cleanup")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="Input sizes in characters")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the fastest one is reported")
+    args = parser.parse_args()
+
+    print(f"{'input':>20}  {'chars':>9}  {'regex':>10}  {'linear':>10}")
+    for name, make in INPUTS.items():
+        for size in args.sizes:
+            body = make(size)
+            regex = fastest(regex_clean, body, args.repeat)
+            linear = fastest(normalize_body, body, args.repeat)
+            print(f"{name:>20}  {len(body):>9}  {regex * 1000:>7.1f} ms  {linear * 1000:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Label the whole mailbox by keyword category.
+
+Runs a CategorizationJob for the account behind the token file. Progress is
+checkpointed next to the token, so an interrupted run (Ctrl+C, crash) picks
+up where it stopped when started again with the same query. Messages that
+were categorized before are skipped, so repeated runs only process new mail.
+
+Usage:
+    python scripts/categorize_mailbox.py
+    python scripts/categorize_mailbox.py --query "in:inbox" --workers 8
+    python scripts/categorize_mailbox.py --limit 1000
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.categorization_job import CategorizationJob  # noqa: E402
+from actions.improved_email_client import ImprovedEmailClient  # noqa: E402
+
+
+def print_progress(stats: dict) -> None:
+    print(f"\r{stats['processed']} messages, {stats['messages_per_second']:.1f} messages/s", end="", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Categorize all messages of a Gmail account")
+    parser.add_argument("--token", help="Token file of the account (default: GMAIL_TOKEN_PATH)")
+    parser.add_argument("--credentials", help="OAuth client file (default: GMAIL_CREDENTIALS_PATH)")
+    parser.add_argument("--query", help="Gmail query limiting the messages, e.g. \"in:inbox\"")
+    parser.add_argument("--workers", type=int, help="Parallel fetch threads (default: GMAIL_CATEGORIZE_WORKERS or 4)")
+    parser.add_argument("--limit", type=int, help="Stop after this many messages; the next run continues")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: next to the token file)")
+    args = parser.parse_args()
+
+    client = ImprovedEmailClient(credentials_path=args.credentials, token_path=args.token)
+    job = CategorizationJob(client, query=args.query, checkpoint_path=args.checkpoint, workers=args.workers)
+
+    try:
+        stats = job.run(max_messages=args.limit, progress=print_progress)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; run again to resume from {job.checkpoint_path}")
+        return 1
+    print()
+
+    for category, count in sorted(stats['categories'].items()):
+        print(f"{category}: {count}")
+    if stats['failed']:
+        print(f"Skipped {stats['failed']} messages that could not be fetched")
+    if stats['skipped']:
+        print(f"Skipped {stats['skipped']} messages that could not be categorized")
+    print(f"{stats['processed_this_run']} messages in this run, {stats['messages_per_second']:.1f} messages/s")
+    if not stats['complete']:
+        print(f"Not finished; run again to continue from {job.checkpoint_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
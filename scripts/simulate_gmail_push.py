@@ -0,0 +1,73 @@
+"""
+Post fake Gmail push notifications to the local push receiver.
+
+Builds the same body a Cloud Pub/Sub push subscription sends for a Gmail
+watch, so the receiver started by the action server (GMAIL_PUSH_PORT) can
+be exercised without a Google Cloud project.
+
+Usage:
+    python scripts/simulate_gmail_push.py --email me@gmail.com --history-id 123456
+    python scripts/simulate_gmail_push.py --count 5 --interval 2
+"""
+
+import json
+import time
+import base64
+import argparse
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+
+def build_push_body(email_address: str, history_id: int, message_id: str) -> dict:
+    """Pub/Sub push envelope around a Gmail notification."""
+    data = json.dumps({"emailAddress": email_address, "historyId": history_id}).encode()
+    return {
+        "message": {
+            "data": base64.b64encode(data).decode(),
+            "messageId": message_id,
+            "publishTime": datetime.now(timezone.utc).isoformat()
+        },
+        "subscription": "projects/local/subscriptions/gmail-push"
+    }
+
+
+def post_notification(url: str, body: dict) -> int:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send fake Gmail push notifications")
+    parser.add_argument("--url", default="http://127.0.0.1:8085/", help="Push receiver URL")
+    parser.add_argument("--token", help="Verification token (GMAIL_PUSH_TOKEN of the receiver)")
+    parser.add_argument("--email", default="", help="Account address; empty matches any account")
+    parser.add_argument("--history-id", type=int, default=1,
+                        help="historyId to report; values above the mailbox's current one keep the mirror marked stale")
+    parser.add_argument("--count", type=int, default=1, help="Number of notifications to send")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between notifications")
+    args = parser.parse_args()
+
+    url = args.url
+    if args.token:
+        url += ("&" if "?" in url else "?") + "token=" + args.token
+
+    history_id = args.history_id
+    for i in range(args.count):
+        status = post_notification(url, build_push_body(args.email, history_id + i, f"sim-{history_id + i}"))
+        print(f"historyId {history_id + i}: HTTP {status}")
+        if i + 1 < args.count:
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+from rasa_sdk.executor import CollectingDispatcher
+
+from actions import bulk_email_actions
+from actions.async_email_client import AsyncEmailClient
+from actions.bulk_email_actions import (
+    ActionExecuteBulkOperation, ActionPrepareBulkOperation, _parse_operation, _resolve_targets,
+)
+
+
+class FakeTracker:
+    def __init__(self, text="", **slots):
+        self.sender_id = 'c1'
+        self.latest_message = {'text': text}
+        self.slots = slots
+
+    def get_slot(self, name):
+        return self.slots.get(name)
+
+
+class FakeSyncClient:
+    """The parts of ImprovedEmailClient an AsyncEmailClient reads"""
+
+    user_id = 'me'
+    MAX_BATCH_MODIFY_IDS = 1000
+
+
+def make_async_client(found=()):
+    """An AsyncEmailClient whose Gmail REST requests are recorded instead of sent"""
+    client = AsyncEmailClient(FakeSyncClient())
+    client.requests = []
+
+    async def request(method, path, api_method, json_body=None, **kwargs):
+        client.requests.append((method, path, json_body))
+        return {}
+
+    async def list_message_ids(query=None, label_ids=None, max_results=10):
+        client.requests.append(('GET', 'messages', {'q': query, 'labelIds': label_ids}))
+        return list(found)
+
+    client._request = request
+    client._update_cached_labels = lambda *args: None
+    client.list_message_ids = list_message_ids
+    return client
+
+
+EMAILS = [
+    {'id': f"m{i}", 'sender': sender, 'sender_name': name}
+    for i, (sender, name) in enumerate([
+        ('news@shop.example', 'Shop'), ('vincent@example.org', 'Vincent'), ('news@shop.example', 'Shop'),
+        ('anna@example.org', 'Anna'), ('news@shop.example', 'Shop'), ('bank@example.org', 'Bank'),
+    ], 1)
+]
+
+
+@pytest.mark.parametrize("text, operation", [
+    ("1 bis 5 löschen", "trash"),
+    ("alle in den papierkorb", "trash"),
+    ("alle als gelesen markieren", "mark_read"),
+    ("mach was mit den mails", None),
+])
+def test_parse_operation(text, operation):
+    assert _parse_operation(text) == operation
+
+
+def test_range_selects_listed_positions():
+    ids, sender, description = _resolve_targets("1 bis 5 löschen", FakeTracker(), EMAILS)
+
+    assert ids == ['m1', 'm2', 'm3', 'm4', 'm5']
+    assert sender is None
+    assert description == "die E-Mails 1 bis 5"
+
+
+def test_range_is_clipped_to_the_listing_and_may_be_reversed():
+    assert _resolve_targets("5 bis 9 löschen", FakeTracker(), EMAILS)[0] == ['m5', 'm6']
+    assert _resolve_targets("3-1 löschen", FakeTracker(), EMAILS)[0] == ['m1', 'm2', 'm3']
+
+
+def test_alle_selects_every_listed_email():
+    ids, sender, description = _resolve_targets("alle als gelesen markieren", FakeTracker(), EMAILS)
+
+    assert ids == [email['id'] for email in EMAILS]
+    assert sender is None
+    assert description == "alle geladenen E-Mails"
+
+
+def test_current_sender_comes_from_the_open_email():
+    tracker = FakeTracker(current_email_id='m3')
+
+    ids, sender, description = _resolve_targets("alle von diesem absender löschen", tracker, EMAILS)
+
+    assert ids == ['m1', 'm3', 'm5']
+    assert sender == 'news@shop.example'
+    assert description == "alle E-Mails von news@shop.example"
+
+
+def test_current_sender_falls_back_to_the_sender_slot():
+    tracker = FakeTracker(current_email_sender="Vincent (vincent@example.org)")
+
+    ids, sender, _ = _resolve_targets("alle von diesem absender löschen", tracker, EMAILS)
+
+    assert ids == ['m2']
+    assert sender == 'vincent@example.org'
+
+
+def test_current_sender_without_an_open_email_resolves_nothing():
+    assert _resolve_targets("alle von diesem absender löschen", FakeTracker(), EMAILS) == (None, None, "")
+
+
+def test_sender_command_adds_search_hits_beyond_the_listing(monkeypatch):
+    client = make_async_client(found=['m3', 'older1', 'older2'])
+
+    async def get_client():
+        return client
+
+    monkeypatch.setattr(bulk_email_actions, 'get_async_email_client', get_client)
+    monkeypatch.setattr(bulk_email_actions, 'load_listed_emails', lambda tracker: EMAILS)
+    tracker = FakeTracker("alle von diesem Absender als gelesen markieren", current_email_id='m1')
+
+    events = asyncio.run(ActionPrepareBulkOperation().run(CollectingDispatcher(), tracker, {}))
+
+    assert events[0]['value'] == "mark_read"
+    assert events[1]['value'] == ['m1', 'm3', 'm5', 'older1', 'older2']
+    assert client.requests == [('GET', 'messages', {'q': "from:news@shop.example", 'labelIds': ['INBOX', 'UNREAD']})]
+
+
+@pytest.mark.parametrize("operation, change", [
+    ("trash", {'addLabelIds': ['TRASH'], 'removeLabelIds': ['INBOX']}),
+    ("mark_read", {'removeLabelIds': ['UNREAD']}),
+])
+def test_execution_makes_one_batch_modify_call(monkeypatch, operation, change):
+    client = make_async_client()
+
+    async def get_client():
+        return client
+
+    monkeypatch.setattr(bulk_email_actions, 'get_async_email_client', get_client)
+    target_ids = ['m1', 'm2', 'm3', 'm4', 'm5']
+    tracker = FakeTracker(bulk_operation=operation, bulk_target_ids=target_ids,
+                          emails=[email['id'] for email in EMAILS], current_email_id='m2')
+
+    events = asyncio.run(ActionExecuteBulkOperation().run(CollectingDispatcher(), tracker, {}))
+
+    assert client.requests == [('POST', 'messages/batchModify', dict(change, ids=target_ids))]
+    slots = {event['name']: event['value'] for event in events}
+    assert slots['emails'] == ['m6']
+    assert slots['email_count'] == 1
+    assert slots['current_email_id'] is None
@@ -0,0 +1,357 @@
+import os
+import json
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from actions.categorization_job import CategorizationJob
+
+
+class FakeRequest:
+    def __init__(self, method, respond, page_token=None):
+        self.method = method
+        self.respond = respond
+        self.page_token = page_token
+
+
+class FakeAccount:
+    """Just enough of a Gmail account and ImprovedEmailClient for CategorizationJob"""
+
+    def __init__(self, tmp_path, subjects):
+        self.token_path = str(tmp_path / "gmail_token.json")
+        self.service = self
+        self.user_id = 'me'
+        self.batch_size = 2
+        self.body_format = 'full'
+        self.calls = []
+
+        self.history_id = 100
+        # (history ID, history record) per change
+        self.changes = []
+        # ID -> subject, newest first
+        self.mails = dict(subjects)
+
+        # Messages the batch fetch leaves out, and messages that fail to parse
+        self.unfetchable = set()
+        self.broken = set()
+        # (label ID, message IDs) per batchModify call
+        self.modified = []
+        self.fail_batch_modify = False
+        # Whether history.list answers 404, as for a historyId Gmail no longer serves
+        self.history_expired = False
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return HistoryResource(self)
+
+    def ensure_connected(self):
+        return True
+
+    def new_http(self):
+        return object()
+
+    def _execute(self, request):
+        self.calls.append((request.method, request.page_token))
+        return request.respond()
+
+    def getProfile(self, userId):
+        return FakeRequest('getProfile', lambda: {'historyId': str(self.history_id)})
+
+    def list(self, userId, q, maxResults, pageToken=None):
+        def respond():
+            listed = list(self.mails)
+            start = int(pageToken or 0)
+            response = {'messages': [{'id': msg_id} for msg_id in listed[start:start + maxResults]]}
+            if start + maxResults < len(listed):
+                response['nextPageToken'] = str(start + maxResults)
+            return response
+        return FakeRequest('messages.list', respond, pageToken)
+
+    def _batch_get_messages(self, message_ids, http=None, format=None):
+        self.calls.append(('messages.get', tuple(message_ids)))
+        return {msg_id: {'id': msg_id} for msg_id in message_ids if msg_id not in self.unfetchable}
+
+    def _parse_message(self, message):
+        if message['id'] in self.broken:
+            raise ValueError("broken MIME structure")
+        return {'subject': self.mails[message['id']], 'body': ""}
+
+    def _get_or_create_label(self, name):
+        return f"Label_{name}"
+
+    def batch_modify(self, message_ids, add_label_ids=None, remove_label_ids=None):
+        if self.fail_batch_modify:
+            raise KeyboardInterrupt
+        self.modified.append((add_label_ids[0], list(message_ids)))
+        return True
+
+    # Changes made in Gmail
+    def receive(self, msg_id, subject):
+        self.mails = {msg_id: subject, **self.mails}
+        self.history_id += 1
+        self.changes.append((self.history_id, {'messagesAdded': [{'message': {'id': msg_id, 'labelIds': ['INBOX']}}]}))
+
+    def fetched(self):
+        return [msg_id for method, ids in self.calls if method == 'messages.get' for msg_id in ids]
+
+    def listed_pages(self):
+        return [page_token for method, page_token in self.calls if method == 'messages.list']
+
+
+class HistoryResource:
+    def __init__(self, account):
+        self.account = account
+
+    def list(self, userId, startHistoryId, historyTypes, pageToken=None):
+        def respond():
+            if self.account.history_expired:
+                raise HttpError(httplib2.Response({'status': 404}), b'{}')
+            changes = [record for history_id, record in self.account.changes if history_id > int(startHistoryId)]
+            return {'history': changes, 'historyId': str(self.account.history_id)}
+        return FakeRequest('history.list', respond, pageToken)
+
+
+SUBJECTS = {
+    'm0': "Rechnung März",
+    'm1': "Ihre Flugbuchung",
+    'm2': "Rechnung zur Hotelbuchung",
+    'm3': "Einladung zur Feier",
+    'm4': "Dringend: Rechnung",
+    'm5': "Hallo",
+}
+
+
+def make_job(account, page_size=CategorizationJob.PAGE_SIZE, **kwargs):
+    job = CategorizationJob(account, workers=2, **kwargs)
+    job.PAGE_SIZE = page_size
+    return job
+
+
+def state_lines(job):
+    with open(job.state_path) as saved:
+        return saved.read().splitlines()
+
+
+def write_state(job, *records, tail=''):
+    with open(job.state_path, 'w') as log:
+        log.write(''.join(json.dumps(record) + '\n' for record in records) + tail)
+
+
+def labeled(account):
+    """(label ID, message ID) for every label applied, in order"""
+    return [(label_id, msg_id) for label_id, msg_ids in account.modified for msg_id in msg_ids]
+
+
+def test_labels_every_message_with_one_batch_modify_per_label(tmp_path):
+    account = FakeAccount(tmp_path, SUBJECTS)
+
+    stats = make_job(account).run()
+
+    assert stats['complete']
+    assert stats['processed'] == 6
+    assert stats['categories'] == {'Finanzen': 3, 'Reise': 2, 'Soziales': 1, 'Dringend': 1}
+    labels = [label_id for label_id, _ in account.modified]
+    assert sorted(labels) == sorted(set(labels))
+    assert sorted(dict(account.modified)['Label_Finanzen']) == ['m0', 'm2', 'm4']
+    assert not os.path.exists(make_job(account).checkpoint_path)
+
+
+def test_stopped_run_resumes_from_the_checkpointed_page(tmp_path):
+    account = FakeAccount(tmp_path, SUBJECTS)
+    job = make_job(account, page_size=2)
+
+    def stop_on_second_page(stats):
+        if stats['processed'] >= 3:
+            job.stop()
+
+    stats = job.run(progress=stop_on_second_page)
+
+    assert not stats['complete']
+    with open(job.checkpoint_path) as saved:
+        assert json.load(saved)['page_token'] == '2'
+
+    fetched_before = account.fetched()
+    account.calls.clear()
+    stats = make_job(account, page_size=2).run()
+
+    assert stats['complete']
+    assert stats['processed'] == 6
+    assert account.listed_pages()[0] == '2'
+    assert sorted(fetched_before + account.fetched()) == sorted(SUBJECTS)
+    pairs = labeled(account)
+    assert len(pairs) == len(set(pairs))
+
+
+def test_fetch_failures_are_left_for_a_later_run_and_parse_failures_are_not_retried(tmp_path):
+    account = FakeAccount(tmp_path, SUBJECTS)
+    account.unfetchable = {'m1'}
+    account.broken = {'m2'}
+
+    stats = make_job(account).run()
+
+    assert stats['complete']
+    assert stats['failed'] == 1
+    assert stats['skipped'] == 1
+    assert {msg_id for _, msg_id in labeled(account)} == {'m0', 'm3', 'm4'}
+
+    account.unfetchable = set()
+    account.calls.clear()
+    stats = make_job(account).run()
+
+    assert stats['processed_this_run'] == 1
+    assert account.fetched() == ['m1']
+    assert ('Label_Reise', 'm1') in labeled(account)
+
+
+def test_max_messages_cuts_a_page_and_the_next_run_continues(tmp_path):
+    account = FakeAccount(tmp_path, SUBJECTS)
+
+    stats = make_job(account).run(max_messages=3)
+
+    assert not stats['complete']
+    assert stats['processed_this_run'] == 3
+    assert sorted(account.fetched()) == ['m0', 'm1', 'm2']
+
+    account.calls.clear()
+    stats = make_job(account).run()
+
+    assert stats['complete']
+    assert stats['processed_this_run'] == 3
+    assert sorted(account.fetched()) == ['m3', 'm4', 'm5']
+
+
+def test_interrupted_run_labels_recorded_results_on_resume_and_nothing_twice(tmp_path):
+    account = FakeAccount(tmp_path, SUBJECTS)
+    account.fail_batch_modify = True
+
+    with pytest.raises(KeyboardInterrupt):
+        make_job(account, page_size=2).run()
+    assert account.modified == []
+
+    account.fail_batch_modify = False
+    account.calls.clear()
+    stats = make_job(account, page_size=2).run()
+
+    assert stats['complete']
+    pairs = labeled(account)
+    assert len(pairs) == len(set(pairs))
+    assert {msg_id for _, msg_id in pairs} == {'m0', 'm1', 'm2', 'm3', 'm4'}
+    # The interrupted page was fetched before; its results came from the checkpoint
+    assert 'm0' not in account.fetched()
+
+
+def test_state_log_lines_are_merged_in_order(tmp_path):
+    job = make_job(FakeAccount(tmp_path, SUBJECTS))
+    write_state(job,
+                {'fingerprint': job.categorizer.fingerprint, 'assigned': {'a': ['Finanzen']}, 'passes': {'': '40'}},
+                {'assigned': {'b': ['Reise']}, 'skipped': {'c': "ValueError: broken"}},
+                {'assigned': {'a': ['Dringend']}, 'passes': {'': '50'}})
+
+    known = job._load_state()
+
+    assert known['assigned'] == {'a': ['Dringend'], 'b': ['Reise']}
+    assert known['skipped'] == {'c': "ValueError: broken"}
+    assert known['passes'] == {'': '50'}
+    assert job._state_records == 3
+
+
+def test_torn_last_line_is_ignored_and_the_next_record_starts_a_new_line(tmp_path):
+    job = make_job(FakeAccount(tmp_path, SUBJECTS))
+    write_state(job, {'fingerprint': job.categorizer.fingerprint, 'assigned': {'a': ['Finanzen']}},
+                tail='{"assigned": {"b": ["Re')
+
+    assert job._load_state()['assigned'] == {'a': ['Finanzen']}
+
+    job._append_state({'assigned': {'c': ['Reise']}})
+
+    assert job._load_state()['assigned'] == {'a': ['Finanzen'], 'c': ['Reise']}
+    assert len(state_lines(job)) == 3
+
+
+def test_changed_keywords_start_the_state_over(tmp_path):
+    job = make_job(FakeAccount(tmp_path, SUBJECTS))
+    write_state(job, {'fingerprint': 'other keywords', 'assigned': {'a': ['Finanzen']}, 'passes': {'': '50'}})
+
+    known = job._load_state()
+
+    assert known['assigned'] == {} and known['passes'] == {}
+    assert [json.loads(line)['fingerprint'] for line in state_lines(job)] == [job.categorizer.fingerprint]
+
+
+def test_state_log_is_compacted_once_it_grows_long(tmp_path):
+    account = FakeAccount(tmp_path, SUBJECTS)
+    job = make_job(account, page_size=2)
+    job.STATE_COMPACT_RECORDS = 2
+
+    job.run()
+
+    lines = state_lines(job)
+    assert len(lines) == 1
+    snapshot = json.loads(lines[0])
+    assert sorted(snapshot['assigned']) == ['m0', 'm1', 'm2', 'm3', 'm4', 'm5']
+    assert snapshot['passes'] == {'': '100'}
+
+
+def test_later_runs_read_added_mail_from_the_history(tmp_path):
+    account = FakeAccount(tmp_path, SUBJECTS)
+    make_job(account).run()
+
+    account.receive('n1', "Rechnung April")
+    account.calls.clear()
+    stats = make_job(account).run()
+
+    methods = [method for method, _ in account.calls]
+    assert 'history.list' in methods
+    assert 'messages.list' not in methods
+    assert account.fetched() == ['n1']
+    assert stats['processed_this_run'] == 1
+
+
+def test_expired_history_falls_back_to_the_listing_up_to_a_page_of_known_mail(tmp_path):
+    account = FakeAccount(tmp_path, SUBJECTS)
+    make_job(account, page_size=2).run()
+
+    account.receive('n1', "Rechnung April")
+    account.history_expired = True
+    account.calls.clear()
+    stats = make_job(account, page_size=2).run()
+
+    assert stats['complete']
+    assert account.fetched() == ['n1']
+    # n1, m0 | m1, m2: the second page holds only known mail, the third is never listed
+    assert account.listed_pages() == [None, '2']
+
+
+def test_query_runs_stop_at_the_first_page_of_known_mail(tmp_path):
+    account = FakeAccount(tmp_path, SUBJECTS)
+    make_job(account, page_size=2, query='in:inbox').run()
+
+    account.receive('n1', "Rechnung April")
+    account.receive('n2', "Flug nach Rom")
+    account.calls.clear()
+    stats = make_job(account, page_size=2, query='in:inbox').run()
+
+    assert stats['complete']
+    assert sorted(account.fetched()) == ['n1', 'n2']
+    assert account.listed_pages() == [None, '2']
+
+
+@pytest.mark.parametrize("query", [None, 'in:inbox'])
+def test_run_without_new_mail_fetches_and_labels_nothing(tmp_path, query):
+    account = FakeAccount(tmp_path, SUBJECTS)
+    make_job(account, query=query).run()
+
+    account.calls.clear()
+    account.modified.clear()
+    stats = make_job(account, query=query).run()
+
+    assert stats['complete']
+    assert stats['processed_this_run'] == 0
+    assert account.fetched() == []
+    assert account.modified == []
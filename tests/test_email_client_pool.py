@@ -0,0 +1,58 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from actions import email_client_pool
+
+
+class SlowClient:
+    """Stands in for ImprovedEmailClient; building the one for 'slow' blocks until released"""
+
+    created = []
+    release = threading.Event()
+    building = threading.Event()
+
+    def __init__(self, credentials_path=None, token_path=None):
+        self.token_path = token_path
+        if token_path.endswith('slow'):
+            SlowClient.building.set()
+            assert SlowClient.release.wait(5)
+        SlowClient.created.append(token_path)
+
+
+@pytest.fixture(autouse=True)
+def fake_clients(monkeypatch):
+    monkeypatch.setattr(email_client_pool, 'ImprovedEmailClient', SlowClient)
+    monkeypatch.setattr(email_client_pool, 'resolve_token_path', lambda token_path: token_path)
+    SlowClient.created = []
+    SlowClient.release = threading.Event()
+    SlowClient.building = threading.Event()
+    email_client_pool.reset_email_clients()
+    yield
+    email_client_pool.reset_email_clients()
+
+
+def test_building_one_client_does_not_block_other_accounts():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        slow = executor.submit(email_client_pool._get_pooled_client, None, 'token-slow')
+        assert SlowClient.building.wait(5)
+
+        # Served while the other account's client is still being built
+        client, created = executor.submit(email_client_pool._get_pooled_client, None, 'token-fast').result(timeout=1)
+        assert created and client.token_path == 'token-fast'
+
+        SlowClient.release.set()
+        assert slow.result(timeout=5)[1]
+
+
+def test_concurrent_callers_for_one_account_share_one_client():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(email_client_pool._get_pooled_client, None, 'token-slow') for _ in range(4)]
+        assert SlowClient.building.wait(5)
+        SlowClient.release.set()
+        results = [future.result(timeout=5) for future in futures]
+
+    assert SlowClient.created == ['token-slow']
+    assert len({id(client) for client, _ in results}) == 1
+    assert sum(created for _, created in results) == 1
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+from concurrent.futures import wait
+
+import pytest
+
+from actions import improved_email_actions
+from actions.email_prefetcher import EmailPrefetcher
+from actions.improved_email_actions import load_email_body, prefetch_neighbours
+from actions.session_cache import SessionCache
+
+
+class FakeTracker:
+    def __init__(self, sender_id):
+        self.sender_id = sender_id
+
+
+class CountingClient:
+    """Stands in for the pooled client; counts body loads and can hold, fail or empty them"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.failures = {}
+        self.empty = set()
+
+    def get_email_body(self, msg_id):
+        self.calls.append(msg_id)
+        assert self.release.wait(5)
+        if self.failures.get(msg_id):
+            self.failures[msg_id] -= 1
+            raise ConnectionError("Gmail unreachable")
+        if msg_id in self.empty:
+            self.empty.discard(msg_id)
+            return ""
+        return f"Inhalt von {msg_id}"
+
+
+EMAILS = [{'id': f"m{i}", 'snippet': f"Vorschau m{i}"} for i in range(3)]
+
+
+@pytest.fixture
+def prefetcher(monkeypatch):
+    prefetcher = EmailPrefetcher(session_cache=SessionCache(ttl_seconds=60))
+    monkeypatch.setattr(improved_email_actions, 'get_email_prefetcher', lambda: prefetcher)
+    yield prefetcher
+    prefetcher.shutdown()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = CountingClient()
+    monkeypatch.setattr(improved_email_actions, 'get_email_client', lambda **kwargs: client)
+    return client
+
+
+def finish_prefetches(prefetcher):
+    with prefetcher._lock:
+        running = list(prefetcher._in_flight.values())
+    wait(running, timeout=5)
+
+
+def test_navigation_after_a_prefetch_makes_no_gmail_call(prefetcher, client):
+    tracker = FakeTracker('c1')
+
+    prefetch_neighbours(tracker, EMAILS, 1)
+    finish_prefetches(prefetcher)
+    assert sorted(client.calls) == ['m0', 'm2']
+
+    body, rendered = asyncio.run(load_email_body(tracker, EMAILS[2]))
+
+    assert body == "Inhalt von m2"
+    assert "Inhalt von m2" in rendered
+    assert sorted(client.calls) == ['m0', 'm2']
+
+
+def test_get_awaits_a_running_prefetch_instead_of_loading_again(prefetcher, client):
+    tracker = FakeTracker('c1')
+    client.release.clear()
+
+    async def read_while_prefetching():
+        prefetch_neighbours(tracker, EMAILS, 1)
+        reading = asyncio.ensure_future(load_email_body(tracker, EMAILS[2]))
+        # The event loop keeps running while the read waits
+        await asyncio.sleep(0.05)
+        assert not reading.done()
+        client.release.set()
+        return await reading
+
+    body, _ = asyncio.run(read_while_prefetching())
+
+    assert body == "Inhalt von m2"
+    assert client.calls.count('m2') == 1
+
+
+def test_failed_prefetch_is_not_cached_and_the_read_loads_again(prefetcher, client):
+    tracker = FakeTracker('c1')
+    client.failures = {'m2': 1}
+
+    prefetch_neighbours(tracker, EMAILS, 1)
+    finish_prefetches(prefetcher)
+    assert prefetcher.session_cache.get_rendered('c1', 'm2') is None
+
+    body, _ = asyncio.run(load_email_body(tracker, EMAILS[2]))
+
+    assert body == "Inhalt von m2"
+    assert client.calls.count('m2') == 2
+
+
+def test_unavailable_body_falls_back_to_the_snippet_for_this_turn_only(prefetcher, client):
+    tracker = FakeTracker('c1')
+    client.empty = {'m0'}
+
+    body, _ = asyncio.run(load_email_body(tracker, EMAILS[0]))
+    assert body == "Vorschau m0"
+
+    body, _ = asyncio.run(load_email_body(tracker, EMAILS[0]))
+
+    assert body == "Inhalt von m0"
+    assert client.calls == ['m0', 'm0']
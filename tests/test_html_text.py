@@ -0,0 +1,41 @@
+import pytest
+
+from actions.html_text import FEED_CHUNK_SIZE, html_to_text
+
+
+def test_blocks_become_line_breaks_and_styles_are_dropped():
+    html = "<html><head><style>p { color: red }</style></head><body><p>Hallo</p><p>Welt<br>zwei</p></body></html>"
+
+    assert html_to_text(html) == "Hallo\n\nWelt\nzwei"
+
+
+@pytest.mark.parametrize("html", [
+    "<html><head><meta charset=utf-8><style>p{}</style><body><p>Hallo Welt</p></body></html>",
+    "<html><head><title>Newsletter</title><link rel=stylesheet href=a.css></head><body><p>Hallo Welt</p>",
+    "<head><noscript>Bitte JavaScript aktivieren<body><p>Hallo Welt</p>",
+])
+def test_body_after_head_without_end_tag_is_kept(html):
+    assert html_to_text(html) == "Hallo Welt"
+
+
+def test_closed_comment_is_dropped():
+    assert html_to_text("<p>Hallo</p><!-- intern --> weiter") == "Hallo\n\nweiter"
+
+
+@pytest.mark.parametrize("tail", [
+    "<!-- intern <b>geheim</b> ende",
+    "<!-- intern" + "x" * (FEED_CHUNK_SIZE * 3),
+    "<![CDATA[ intern",
+    "<? intern",
+    '<a href="https://example.com/intern',
+])
+def test_unterminated_markup_at_the_end_is_dropped(tail):
+    assert html_to_text("<p>Hallo</p>" + tail) == "Hallo"
+
+
+def test_lone_angle_brackets_and_ampersands_stay_text():
+    assert html_to_text("a < b &amp; c &") == "a < b & c &"
+
+
+def test_stops_at_character_budget():
+    assert html_to_text("<p>" + "x" * 1000 + "</p>", max_chars=10) == "x" * 10
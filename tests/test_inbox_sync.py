@@ -0,0 +1,176 @@
+from actions.inbox_sync import InboxSync
+
+
+class FakeRequest:
+    def __init__(self, method, respond):
+        self.method = method
+        self.respond = respond
+
+
+class FakeGmail:
+    """Just enough of a Gmail account and ImprovedEmailClient for InboxSync"""
+
+    def __init__(self, count):
+        self.authorized = True
+        self.service = self
+        self.user_id = 'me'
+        self.message_cache = self
+        self.calls = []
+
+        self.history_id = 100
+        # (history ID, history record) per change
+        self.changes = []
+        # ID -> (internalDate, labels); m0 is the newest
+        self.mails = {f"m{i}": (10_000 - i, {'INBOX', 'UNREAD'}) for i in range(count)}
+
+    def users(self):
+        return Users(self)
+
+    def _execute(self, request):
+        self.calls.append(request.method)
+        return request.respond()
+
+    # Message cache
+    def set_labels(self, msg_id, label_ids):
+        pass
+
+    def get(self, msg_id):
+        return None
+
+    def get_emails(self, message_ids, label_ids=None, include_body=False):
+        return [{'id': msg_id, 'subject': f"Betreff {msg_id}", 'internal_date': self.mails[msg_id][0]}
+                for msg_id in message_ids if msg_id in self.mails]
+
+    # Changes made in Gmail
+    def _record(self, kind, msg_id):
+        self.history_id += 1
+        labels = sorted(self.mails[msg_id][1])
+        self.changes.append((self.history_id, {kind: [{'message': {'id': msg_id, 'labelIds': labels}}]}))
+
+    def receive(self, msg_id, date):
+        self.mails[msg_id] = (date, {'INBOX', 'UNREAD'})
+        self._record('messagesAdded', msg_id)
+
+    def mark_read(self, msg_id):
+        self.mails[msg_id][1].discard('UNREAD')
+        self._record('labelsRemoved', msg_id)
+
+    def unread(self):
+        unread = [msg_id for msg_id, (_, labels) in self.mails.items() if {'INBOX', 'UNREAD'} <= labels]
+        return sorted(unread, key=lambda msg_id: -self.mails[msg_id][0])
+
+
+class Users:
+    """service.users() with the messages.list, history.list and getProfile calls InboxSync makes"""
+
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return HistoryResource(self.gmail)
+
+    def getProfile(self, userId):
+        return FakeRequest('getProfile', lambda: {'historyId': str(self.gmail.history_id)})
+
+    def list(self, userId, labelIds, maxResults, pageToken=None):
+        def respond():
+            unread = self.gmail.unread()
+            start = int(pageToken or 0)
+            response = {'messages': [{'id': msg_id} for msg_id in unread[start:start + maxResults]]}
+            if start + maxResults < len(unread):
+                response['nextPageToken'] = str(start + maxResults)
+            return response
+        return FakeRequest('messages.list', respond)
+
+
+class HistoryResource:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId, startHistoryId, historyTypes, pageToken=None):
+        def respond():
+            changes = [record for history_id, record in self.gmail.changes if history_id > int(startHistoryId)]
+            return {'history': changes, 'historyId': str(self.gmail.history_id)}
+        return FakeRequest('history.list', respond)
+
+
+def make_sync(count, max_messages=InboxSync.DEFAULT_MAX_MESSAGES):
+    gmail = FakeGmail(count)
+    return gmail, InboxSync(gmail, max_messages=max_messages)
+
+
+def ids(page):
+    return [email['id'] for email in page]
+
+
+def test_pages_continue_after_the_cursor():
+    gmail, sync = make_sync(25)
+
+    first = sync.get_unread_emails(10)
+    second = sync.get_unread_emails(10, after=sync.page_cursor(first[-1]))
+    third = sync.get_unread_emails(10, after=sync.page_cursor(second[-1]))
+
+    assert ids(first) == [f"m{i}" for i in range(10)]
+    assert ids(second) == [f"m{i}" for i in range(10, 20)]
+    assert ids(third) == [f"m{i}" for i in range(20, 25)]
+    assert not sync.has_more(sync.page_cursor(third[-1]))
+
+
+def test_later_listings_read_the_history_instead_of_listing_again():
+    gmail, sync = make_sync(25)
+
+    first = sync.get_unread_emails(10)
+    gmail.calls.clear()
+    sync.get_unread_emails(10, after=sync.page_cursor(first[-1]))
+
+    assert 'history.list' in gmail.calls
+    assert 'messages.list' not in gmail.calls
+
+
+def test_new_and_read_mail_does_not_shift_the_next_page():
+    gmail, sync = make_sync(25)
+    first = sync.get_unread_emails(10)
+
+    gmail.receive("new", 20_000)
+    gmail.mark_read("m2")
+    gmail.mark_read("m10")
+    second = sync.get_unread_emails(10, after=sync.page_cursor(first[-1]))
+
+    assert ids(second) == [f"m{i}" for i in range(11, 21)]
+    assert ids(sync.get_unread_emails(1)) == ["new"]
+
+
+def test_page_continues_by_date_when_the_cursor_mail_was_read():
+    gmail, sync = make_sync(25)
+    first = sync.get_unread_emails(10)
+
+    gmail.mark_read("m9")
+    second = sync.get_unread_emails(10, after=sync.page_cursor(first[-1]))
+
+    assert ids(second) == [f"m{i}" for i in range(10, 20)]
+
+
+def test_pages_continue_past_the_mirror_cap():
+    gmail, sync = make_sync(30, max_messages=20)
+
+    pages = [sync.get_unread_emails(10)]
+    while sync.has_more(sync.page_cursor(pages[-1][-1])):
+        pages.append(sync.get_unread_emails(10, after=sync.page_cursor(pages[-1][-1])))
+
+    assert [ids(page) for page in pages] == [[f"m{i}" for i in range(start, start + 10)] for start in (0, 10, 20)]
+    assert sync.get_unread_emails(10, after=sync.page_cursor(pages[-1][-1])) == []
+
+
+def test_capped_mirror_is_refilled_when_mail_is_read():
+    gmail, sync = make_sync(25, max_messages=10)
+    first = sync.get_unread_emails(5)
+    assert sync.unread_count() == 10
+
+    for msg_id in ids(first):
+        gmail.mark_read(msg_id)
+    page = sync.get_unread_emails(10)
+
+    assert ids(page) == [f"m{i}" for i in range(5, 15)]
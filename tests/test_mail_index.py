@@ -0,0 +1,133 @@
+import random
+import string
+import time
+
+from actions.mail_index import MailIndex, fold, tokenize
+
+
+def email(msg_id, sender="", subject="", body="", date=None):
+    return {'id': msg_id, 'sender': sender, 'subject': subject, 'body': body, 'internal_date': date}
+
+
+def make_index(*emails):
+    index = MailIndex()
+    index.load(emails)
+    return index
+
+
+def test_fold_replaces_umlauts_and_accents():
+    assert fold("Müller Straße") == "mueller strasse"
+    assert tokenize("Café, René & Zoë") == ["cafe", "rene", "zoe"]
+
+
+def test_search_matches_all_terms_newest_first():
+    index = make_index(
+        email("old", "Anna <anna@example.com>", "Rechnung März", date=1000),
+        email("new", "Anna <anna@example.com>", "Rechnung April", date=3000),
+        email("other", "Bob <bob@example.com>", "Rechnung Mai", date=2000),
+    )
+
+    assert index.search("anna rechnung") == ["new", "old"]
+    assert index.search("rechnung", limit=2) == ["new", "other"]
+
+
+def test_search_folds_query_terms():
+    index = make_index(email("m1", "Jörg Müller <j@example.com>", "Hallo"))
+
+    assert index.search("mueller") == ["m1"]
+    assert index.search("Müller") == ["m1"]
+
+
+def test_prefix_needs_minimum_length():
+    index = make_index(email("m1", "Annabelle <a@example.com>", "Hallo"))
+
+    assert index.search("anna") == ["m1"]
+    assert index.search("ann") == ["m1"]
+    assert index.search("an") == []
+
+
+def test_exact_search_matches_whole_words_only():
+    index = make_index(email("m1", "Annabelle <a@example.com>", "Hallo"))
+
+    assert index.search("annabelle", exact=True) == ["m1"]
+    assert index.search("anna", exact=True) == []
+
+
+def test_search_does_not_match_inside_words():
+    index = make_index(email("m1", "Stadtwerke <info@stadtwerke.example>", "Ihre Stromrechnung"))
+
+    assert index.search("rechnung") == []
+    assert index.search("strom") == ["m1"]
+
+
+def test_selection_matches_inside_sender_and_subject_words():
+    index = make_index(
+        email("header", "Stadtwerke <info@stadtwerke.example>", "Ihre Stromrechnung"),
+        email("body", "Bob <bob@example.com>", "Hallo", body="anbei die Stromrechnung"),
+    )
+
+    assert index.best_match("die rechnung", ["body", "header"]) == "header"
+    assert index.best_match("von den werken", ["body", "header"]) is None
+    assert index.best_match("werke", ["body", "header"]) == "header"
+
+
+def test_search_cost_does_not_grow_with_the_mailbox():
+    rng = random.Random(1)
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(8)) for _ in range(5000)]
+    index = make_index(*(
+        email(f"m{i}", f"{rng.choice(words)} <{rng.choice(words)}@example.com>",
+              " ".join(rng.sample(words, 5)), body=" ".join(rng.sample(words, 20)), date=i)
+        for i in range(30_000)
+    ))
+    queries = [f"{rng.choice(words)[:5]} {rng.choice(words)}" for _ in range(200)]
+
+    started = time.perf_counter()
+    for query in queries:
+        index.search(query)
+    per_search = (time.perf_counter() - started) / len(queries)
+
+    # A scan over the sender and subject vocabulary took several milliseconds per search here
+    assert per_search < 0.002
+
+
+def test_field_operators_restrict_the_field():
+    index = make_index(
+        email("from-anna", "Anna <anna@example.com>", "Termin"),
+        email("about-anna", "Bob <bob@example.com>", "Geschenk für Anna"),
+    )
+
+    assert index.search("from:anna") == ["from-anna"]
+    assert index.search("subject:anna") == ["about-anna"]
+    assert index.search('subject:"geschenk anna"') == ["about-anna"]
+
+
+def test_unsupported_queries_and_unready_index_defer_to_gmail():
+    index = make_index(email("m1", "Anna <anna@example.com>", "Hallo"))
+
+    assert index.search("newer_than:2d") is None
+    assert index.search("anna -hallo") is None
+    assert index.search("anna OR bob") is None
+    assert MailIndex().search("anna") is None
+
+
+def test_removed_and_updated_messages_leave_the_index():
+    index = make_index(email("m1", "Anna <anna@example.com>", "Hallo", body="Projekt"))
+
+    index.add_many([{'id': "m1", 'sender': "Anna <anna@example.com>", 'subject': "Neu"}])
+    assert index.search("hallo") == []
+    assert index.search("projekt") == ["m1"]
+
+    index.remove(["m1"])
+    assert index.search("anna") == []
+    assert len(index) == 0
+
+
+def test_best_match_picks_listed_mail_by_sender_and_subject():
+    index = make_index(
+        email("m1", "Vincent <v@example.com>", "Urlaubsfotos"),
+        email("m2", "Anna <anna@example.com>", "Fotos vom Urlaub"),
+    )
+
+    assert index.best_match("die E-Mail von Vincent", ["m1", "m2"]) == "m1"
+    assert index.best_match("zeige mir die fotos von anna", ["m1", "m2"]) == "m2"
+    assert index.best_match("die E-Mail", ["m1", "m2"]) is None
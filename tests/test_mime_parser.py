@@ -0,0 +1,170 @@
+import base64
+import random
+
+import pytest
+
+from actions.mime_parser import (
+    MAX_MIME_DEPTH, MAX_MIME_PARTS, MAX_PARSE_DEPTH, MAX_PARSE_PARTS, MimeLimitError,
+    get_header, get_text_body, mime_structure, parse_raw, parse_raw_headers,
+)
+
+HEADERS = (
+    b"From: Stadtwerke <rechnung@stadtwerke.example>\r\n"
+    b"Subject: =?utf-8?q?Ihre_Stromrechnung_M=C3=A4rz?=\r\n"
+    b"Date: Mon, 04 Mar 2024 09:15:00 +0100\r\n"
+    b"MIME-Version: 1.0\r\n"
+)
+
+PLAIN = b"Content-Type: text/plain; charset=utf-8\r\n\r\nHallo Welt\r\n"
+HTML = b"Content-Type: text/html; charset=utf-8\r\n\r\n<p>Hallo <b>HTML</b></p>\r\n"
+
+
+def encode(source: bytes) -> str:
+    return base64.urlsafe_b64encode(source).decode()
+
+
+def multipart(boundary: str, *parts: bytes, subtype: str = 'mixed') -> bytes:
+    body = f'Content-Type: multipart/{subtype}; boundary="{boundary}"\r\n\r\n'.encode()
+    for part in parts:
+        body += f"--{boundary}\r\n".encode() + part
+    return body + f"--{boundary}--\r\n".encode()
+
+
+def nested(levels: int, leaf: bytes = PLAIN) -> bytes:
+    body = leaf
+    for level in range(levels, 0, -1):
+        body = multipart(f"b{level}", body)
+    return body
+
+
+def test_parse_raw_decodes_headers_and_body():
+    message = parse_raw(encode(HEADERS + nested(2)))
+
+    assert get_header(message, 'Subject') == "Ihre Stromrechnung März"
+    assert get_text_body(message) == ("Hallo Welt", False)
+
+
+def test_text_body_is_decoded_with_declared_charset():
+    latin1 = "Content-Type: text/plain; charset=iso-8859-1\r\n\r\nMit freundlichen Grüßen\r\n".encode('latin-1')
+    message = parse_raw(encode(HEADERS + latin1))
+
+    assert get_text_body(message)[0].strip() == "Mit freundlichen Grüßen"
+
+
+def test_text_body_undoes_quoted_printable():
+    quoted = (b"Content-Type: text/plain; charset=utf-8\r\nContent-Transfer-Encoding: quoted-printable\r\n\r\n"
+              b"Summe=3D12 Euro, mit freundlichen Gr=C3=BC=C3=9Fen und eine sehr lange Zeile, die umbroche=\r\n"
+              b"n wurde\r\n")
+    message = parse_raw(encode(HEADERS + quoted))
+
+    assert get_text_body(message)[0].strip() == (
+        "Summe=12 Euro, mit freundlichen Grüßen und eine sehr lange Zeile, die umbrochen wurde")
+
+
+def test_headers_with_raw_8bit_bytes_and_folding_are_decoded():
+    source = (b"From: M\xc3\xbcller <m@example.org>\r\n"
+              b"Subject: Gr\xc3\xbc\xc3\x9fe zur =?utf-8?q?M=C3=A4rz?=\r\n =?utf-8?q?rechnung?=\r\n\r\nx\r\n")
+    message = parse_raw_headers(encode(source))
+
+    assert get_header(message, 'From') == "Müller <m@example.org>"
+    assert get_header(message, 'Subject') == "Grüße zur Märzrechnung"
+    assert get_header(message, 'Date') == ""
+
+
+def test_parse_raw_rejects_deep_nesting():
+    with pytest.raises(MimeLimitError):
+        parse_raw(encode(HEADERS + nested(1000)))
+
+
+def test_parse_raw_accepts_nesting_up_to_the_limit():
+    message = parse_raw(encode(HEADERS + nested(MAX_PARSE_DEPTH)))
+
+    assert get_header(message, 'Subject') == "Ihre Stromrechnung März"
+
+
+def test_headers_of_deeply_nested_message_stay_readable():
+    message = parse_raw_headers(encode(HEADERS + nested(1000)))
+
+    assert get_header(message, 'From') == "Stadtwerke <rechnung@stadtwerke.example>"
+
+
+def test_parse_raw_rejects_too_many_parts():
+    parts = [b"Content-Type: application/octet-stream\r\n\r\nx\r\n"] * (MAX_PARSE_PARTS + 1)
+
+    with pytest.raises(MimeLimitError):
+        parse_raw(encode(HEADERS + multipart("top", *parts)))
+
+
+def test_mime_structure_counts_levels_not_siblings():
+    siblings = [multipart(f"s{i}", PLAIN, subtype='alternative') for i in range(MAX_PARSE_DEPTH * 2)]
+
+    assert mime_structure(multipart("top", *siblings)) == (2, MAX_PARSE_DEPTH * 4)
+    assert mime_structure(nested(MAX_PARSE_DEPTH + 10)) == (MAX_PARSE_DEPTH + 10, MAX_PARSE_DEPTH + 10)
+
+
+def test_mime_structure_ignores_dashes_in_body_text():
+    signature = b"Content-Type: text/plain\r\n\r\n" + b"--\r\nGruss\r\n" * (MAX_PARSE_PARTS + 1)
+
+    assert mime_structure(multipart("top", *([signature] * (MAX_PARSE_DEPTH + 1))))[1] == MAX_PARSE_DEPTH + 1
+
+
+def test_text_body_ignores_parts_below_depth_limit():
+    message = parse_raw(encode(HEADERS + nested(MAX_MIME_DEPTH + 1)))
+
+    assert get_text_body(message) == ("", False)
+    assert get_text_body(parse_raw(encode(HEADERS + nested(MAX_MIME_DEPTH))))[0] == "Hallo Welt"
+
+
+def test_text_body_looks_at_limited_number_of_parts():
+    attachments = [b"Content-Type: application/octet-stream\r\n\r\nx\r\n"] * MAX_MIME_PARTS
+    message = parse_raw(encode(HEADERS + multipart("top", *attachments, PLAIN)))
+
+    assert get_text_body(message) == ("", False)
+
+
+def test_text_body_falls_back_to_html_when_plain_part_is_too_large():
+    large_plain = b"Content-Type: text/plain\r\n\r\n" + b"x" * 5000 + b"\r\n"
+    message = parse_raw(encode(HEADERS + multipart("alt", large_plain, HTML, subtype='alternative')))
+
+    body, is_html = get_text_body(message, max_part_bytes=1000)
+
+    assert is_html
+    assert "Hallo <b>HTML</b>" in body
+
+
+def test_text_body_skips_attachments_and_forwarded_messages():
+    attachment = (b'Content-Type: text/plain\r\nContent-Disposition: attachment; filename="a.txt"\r\n\r\n'
+                  b"Anhang\r\n")
+    forwarded = b"Content-Type: message/rfc822\r\n\r\n" + HEADERS + PLAIN
+    message = parse_raw(encode(HEADERS + multipart("top", attachment, forwarded, HTML)))
+
+    body, is_html = get_text_body(message)
+
+    assert is_html
+    assert "Anhang" not in body
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_mangled_messages_parse_or_fail_cleanly(seed):
+    rng = random.Random(seed)
+    source = bytearray(HEADERS + multipart("top", nested(3), multipart("alt", PLAIN, HTML, subtype='alternative')))
+
+    # Flip, drop and duplicate random bytes, then cut the source somewhere
+    for _ in range(rng.randint(1, 40)):
+        position = rng.randrange(len(source))
+        operation = rng.choice(('flip', 'drop', 'duplicate'))
+        if operation == 'flip':
+            source[position] = rng.randrange(256)
+        elif operation == 'drop':
+            del source[position]
+        else:
+            source[position:position] = source[position:position + rng.randint(1, 200)]
+    source = bytes(source[:rng.randint(0, len(source))])
+
+    try:
+        message = parse_raw(encode(source))
+    except MimeLimitError:
+        return
+    body, is_html = get_text_body(message, max_part_bytes=10000)
+    assert isinstance(body, str)
+    assert isinstance(is_html, bool)
@@ -0,0 +1,66 @@
+import time
+import asyncio
+
+import pytest
+
+from actions.rate_limiter import DEFAULT_QUOTA_UNITS, QuotaRateLimiter, get_rate_limiter, quota_units
+
+
+def test_quota_units_per_method():
+    assert quota_units('gmail.users.messages.send') == 100
+    assert quota_units('gmail.users.messages.list') == 5
+    assert quota_units('history.list') == 2
+    assert quota_units('gmail.users.unknown') == DEFAULT_QUOTA_UNITS
+    assert quota_units(None) == DEFAULT_QUOTA_UNITS
+
+
+def test_burst_is_served_at_once_and_later_calls_queue():
+    limiter = QuotaRateLimiter(units_per_second=100, burst=10)
+
+    assert limiter._reserve(10) == 0.0
+    # Each reservation queues behind the previous ones
+    assert limiter._reserve(5) == pytest.approx(0.05, abs=0.01)
+    assert limiter._reserve(5) == pytest.approx(0.10, abs=0.01)
+
+
+def test_acquire_waits_for_units():
+    limiter = QuotaRateLimiter(units_per_second=100, burst=5)
+    limiter.acquire(5)
+
+    started = time.monotonic()
+    limiter.acquire(5)
+
+    assert time.monotonic() - started >= 0.04
+
+
+def test_acquire_refuses_to_block_the_event_loop():
+    limiter = QuotaRateLimiter(units_per_second=100, burst=5)
+
+    async def blocking_call():
+        limiter.acquire(1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(blocking_call())
+
+
+def test_acquire_async_lets_other_tasks_run():
+    limiter = QuotaRateLimiter(units_per_second=100, burst=5)
+    ticks = []
+
+    async def ticker():
+        for _ in range(3):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await limiter.acquire_async(5)
+        await asyncio.gather(limiter.acquire_async(5), ticker())
+
+    asyncio.run(main())
+
+    assert len(ticks) == 3
+
+
+def test_one_limiter_per_account():
+    assert get_rate_limiter('a.json') is get_rate_limiter('a.json')
+    assert get_rate_limiter('a.json') is not get_rate_limiter('b.json')
@@ -0,0 +1,152 @@
+import time
+import asyncio
+import threading
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from actions.retry_policy import Failure, RetryPolicy, classify_http_error, parse_retry_after
+
+
+def http_error(status, content=b'', retry_after=None):
+    headers = {'status': status}
+    if retry_after is not None:
+        headers['retry-after'] = retry_after
+    return HttpError(httplib2.Response(headers), content)
+
+
+def fast_policy(**kwargs):
+    """A policy whose backoff sleeps are a few milliseconds at most"""
+    policy = RetryPolicy(**kwargs)
+    policy.BASE_DELAY_SECONDS = 0.001
+    return policy
+
+
+def failing(*errors, result='ok'):
+    """send() that raises the given errors in turn, then returns result"""
+    calls = []
+
+    def send():
+        calls.append(time.monotonic())
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return send, calls
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after("Mon, 01 Jan 2001 00:00:00 GMT") == 0.0
+    assert parse_retry_after("bald") is None
+    assert parse_retry_after(None) is None
+
+
+def test_classify_http_error():
+    assert classify_http_error(http_error(429, retry_after="3")) == Failure(429, 3.0, False)
+    assert classify_http_error(http_error(403, b'{"reason": "rateLimitExceeded"}')).rate_limited
+    assert not classify_http_error(http_error(403, b'{"reason": "forbidden"}')).rate_limited
+    assert classify_http_error(ConnectionError()) == Failure(None)
+    assert classify_http_error(ValueError()) is None
+
+
+def test_transient_errors_are_retried_until_success():
+    policy = fast_policy(max_attempts=5)
+    send, calls = failing(http_error(503), ConnectionError())
+
+    assert policy.run(send, classify_http_error, 'gmail.users.messages.list') == 'ok'
+    assert len(calls) == 3
+    assert policy.metrics.snapshot()['retries'] == 2
+
+
+def test_client_errors_are_not_retried():
+    policy = fast_policy()
+    send, calls = failing(http_error(404))
+
+    with pytest.raises(HttpError):
+        policy.run(send, classify_http_error, 'gmail.users.messages.get')
+    assert len(calls) == 1
+
+
+def test_non_idempotent_calls_are_only_retried_when_rate_limited():
+    policy = fast_policy()
+
+    send, calls = failing(http_error(500))
+    with pytest.raises(HttpError):
+        policy.run(send, classify_http_error, 'gmail.users.messages.send')
+    assert len(calls) == 1
+
+    send, calls = failing(http_error(429))
+    assert policy.run(send, classify_http_error, 'gmail.users.messages.send') == 'ok'
+    assert len(calls) == 2
+
+
+def test_attempts_are_limited():
+    policy = fast_policy(max_attempts=3)
+    send, calls = failing(*[http_error(503)] * 10)
+
+    with pytest.raises(HttpError):
+        policy.run(send, classify_http_error, 'gmail.users.messages.list')
+    assert len(calls) == 3
+    assert policy.metrics.snapshot()['failures'] == 1
+
+
+def test_retry_after_is_honored():
+    policy = fast_policy()
+    send, calls = failing(http_error(429, retry_after="0.2"))
+
+    policy.run(send, classify_http_error, 'gmail.users.messages.list')
+
+    assert calls[1] - calls[0] >= 0.2
+
+
+def test_retry_that_would_overrun_the_deadline_is_not_attempted():
+    policy = fast_policy(deadline_seconds=1.0)
+    send, calls = failing(http_error(429, retry_after="5"))
+
+    with pytest.raises(HttpError):
+        policy.run(send, classify_http_error, 'gmail.users.messages.list')
+    assert len(calls) == 1
+    assert policy.metrics.snapshot()['deadline_exceeded'] == 1
+
+
+def test_hung_attempt_fails_at_the_deadline():
+    policy = fast_policy(deadline_seconds=0.2)
+    release = threading.Event()
+
+    started = time.monotonic()
+    try:
+        with pytest.raises(TimeoutError):
+            policy.run(lambda: release.wait(5), classify_http_error, 'gmail.users.messages.get')
+    finally:
+        release.set()
+
+    assert time.monotonic() - started < 1.0
+    assert policy.metrics.snapshot()['attempt_timeouts'] >= 1
+
+
+def test_hung_async_attempt_fails_at_the_deadline():
+    policy = fast_policy(deadline_seconds=0.2)
+
+    async def hung():
+        await asyncio.sleep(5)
+
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(policy.run_async(hung, classify_http_error, 'gmail.users.messages.get'))
+
+    assert time.monotonic() - started < 1.0
+
+
+def test_async_retries_until_success():
+    policy = fast_policy()
+    errors = [http_error(503)]
+
+    async def send():
+        if errors:
+            raise errors.pop()
+        return 'ok'
+
+    assert asyncio.run(policy.run_async(send, classify_http_error, 'gmail.users.messages.list')) == 'ok'
+    assert policy.metrics.snapshot()['retries'] == 1
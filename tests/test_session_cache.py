@@ -0,0 +1,139 @@
+import json
+
+import pytest
+
+from actions import improved_email_actions, session_cache
+from actions.improved_email_actions import listed_email_ids, load_listed_emails, remember_emails
+from actions.session_cache import SessionCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeTracker:
+    def __init__(self, sender_id, emails_slot=None):
+        self.sender_id = sender_id
+        self.slots = {'emails': emails_slot}
+
+    def get_slot(self, name):
+        return self.slots.get(name)
+
+
+class CountingClient:
+    """Stands in for the pooled client; records which messages had to be loaded again"""
+
+    def __init__(self):
+        self.loaded = []
+
+    def get_emails(self, message_ids):
+        self.loaded.append(list(message_ids))
+        return [record(msg_id) for msg_id in message_ids]
+
+
+def record(msg_id):
+    return {'id': msg_id, 'subject': f"Betreff {msg_id}", 'sender': 'a@example.org', 'sender_name': 'A',
+            'date': 'Mon, 04 Mar 2024'}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(session_cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(monkeypatch, clock):
+    cache = SessionCache(ttl_seconds=60, max_sessions=3)
+    monkeypatch.setattr(improved_email_actions, 'get_session_cache', lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = CountingClient()
+    monkeypatch.setattr(improved_email_actions, 'get_email_client', lambda **kwargs: client)
+    return client
+
+
+def test_sessions_expire_after_the_idle_ttl(cache, clock):
+    cache.put('c1', [record('m1')])
+    cache.put_rendered('c1', 'm1', "Text", "Text")
+
+    clock.now += 50
+    assert cache.get('c1', ['m1']) == {'m1': record('m1')}
+
+    # The read above counts as use
+    clock.now += 50
+    assert cache.get_rendered('c1', 'm1') == ("Text", "Text")
+
+    clock.now += 61
+    assert cache.get('c1', ['m1']) == {}
+    assert cache.get_rendered('c1', 'm1') is None
+
+
+def test_least_recently_used_sessions_are_dropped_beyond_the_limit(cache):
+    for conversation_id in ('c1', 'c2', 'c3'):
+        cache.put(conversation_id, [record('m1')])
+    cache.get('c1', ['m1'])
+
+    cache.put('c4', [record('m1')])
+
+    assert cache.get('c2', ['m1']) == {}
+    assert all(cache.get(conversation_id, ['m1']) for conversation_id in ('c1', 'c3', 'c4'))
+
+
+def test_records_per_session_are_bounded_oldest_first(cache):
+    limit = SessionCache.MAX_RECORDS_PER_SESSION
+    cache.put('c1', [record(f"m{i}") for i in range(limit)])
+    # Storing a record again makes it the newest
+    cache.put('c1', [record('m0'), record('new')])
+
+    cached = cache.get('c1', [f"m{i}" for i in range(limit)] + ['new'])
+
+    assert len(cached) == limit
+    assert 'm1' not in cached
+    assert 'm0' in cached and 'new' in cached
+
+
+def test_remember_emails_puts_only_ids_into_the_slot(cache, client):
+    tracker = FakeTracker('c1')
+
+    event = remember_emails(tracker, [record('m1'), record('m2')])
+    tracker.slots['emails'] = event['value']
+
+    assert event['value'] == ['m1', 'm2']
+    assert [email['id'] for email in load_listed_emails(tracker)] == ['m1', 'm2']
+    assert client.loaded == []
+
+
+def test_records_missing_from_the_cache_are_loaded_again(cache, clock, client):
+    tracker = FakeTracker('c1', ['m1', 'm2'])
+    cache.put('c1', [record('m1'), record('m2')])
+
+    clock.now += 61
+    emails = load_listed_emails(tracker)
+
+    assert [email['id'] for email in emails] == ['m1', 'm2']
+    assert client.loaded == [['m1', 'm2']]
+
+    load_listed_emails(tracker)
+    assert client.loaded == [['m1', 'm2']]
+
+
+def test_legacy_json_slot_is_read_and_cached(cache, client):
+    tracker = FakeTracker('c1', json.dumps([record('m1'), record('m2')]))
+
+    assert listed_email_ids(tracker) == ['m1', 'm2']
+    assert [email['subject'] for email in load_listed_emails(tracker)] == ["Betreff m1", "Betreff m2"]
+    assert client.loaded == []
+
+
+def test_unreadable_legacy_slot_lists_nothing(cache):
+    assert listed_email_ids(FakeTracker('c1', '[{"id": "m1"')) == []
+    assert listed_email_ids(FakeTracker('c1')) == []
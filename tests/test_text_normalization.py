@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from actions.text_normalization import normalize_body, truncate_for_display
+
+# Inputs of about 1 MB that make backtracking whitespace regexes slow
+PATHOLOGICAL_INPUTS = {
+    "whitespace run": lambda size: "\n\n" + " " * size + "x",
+    "tabs and newlines": lambda size: "\n \t" * (size // 3) + "x",
+    "two newlines per run": lambda size: ("\n" + " " * 50 + "\n" + " " * 50 + "x") * (size // 103),
+    "carriage returns": lambda size: "\r" * size + "x",
+    "zero-width padding": lambda size: ("\u200c\u034f " * (size // 3)) + "x",
+    "no line breaks": lambda size: "wort " * (size // 5),
+}
+
+
+def test_blank_lines_collapse_into_one():
+    assert normalize_body("\n\nHallo\n\n \n\t\nWelt\n\n") == "Hallo\n\nWelt"
+
+
+def test_line_endings_spaces_and_invisible_characters_are_normalized():
+    assert normalize_body("Hallo  \t Welt\r\nzwei\u200b\u034f\rdrei") == "Hallo Welt\nzwei\ndrei"
+
+
+def test_empty_body_stays_empty():
+    assert normalize_body("") == ""
+    assert normalize_body(" \n\u200b\n\t") == ""
+
+
+def test_truncate_appends_notice_only_when_cut():
+    assert truncate_for_display("kurz", 10, " …") == "kurz"
+    assert truncate_for_display("ziemlich lang", 8, " …") == "ziemlich …"
+
+
+@pytest.mark.parametrize("name", PATHOLOGICAL_INPUTS)
+def test_pathological_inputs_are_normalized_in_linear_time(name):
+    body = PATHOLOGICAL_INPUTS[name](1_000_000)
+
+    started = time.perf_counter()
+    cleaned = normalize_body(body)
+    elapsed = time.perf_counter() - started
+
+    # A single pass over 1 MB takes milliseconds; quadratic behaviour would take minutes
+    assert elapsed < 2.0
+    assert "\n\n\n" not in cleaned
+    assert "  " not in cleaned
+    assert cleaned == cleaned.strip()